@@ -69,6 +69,7 @@ Adafruit_DotStar strip = Adafruit_DotStar(1, DATAPIN, CLOCKPIN, DOTSTAR_BRG);
 #define gadget_readBytes(...)  GADGET_UART.readBytes(__VA_ARGS__)
 #define gadget_available(...)  GADGET_UART.available(__VA_ARGS__)
 #define gadget_setTimeout(...) GADGET_UART.setTimeout(__VA_ARGS__)
+#define gadget_availableForWrite(...) GADGET_UART.availableForWrite(__VA_ARGS__)
 
 #define DEBUG_ON  0
 #if DEBUG_ON
@@ -97,6 +98,43 @@ uint32_t elapsed_mSecs(uint32_t last_millis)
 const uint8_t STX = 0x02;
 const uint8_t ETX = 0x03;
 
+// Frame types
+const uint8_t FRAME_REPORT = 3;   // first 10 bytes of the report
+const uint8_t FRAME_DELTA = 4;    // field mask then the changed fields
+const uint8_t FRAME_TELEMETRY = 5;  // gadget to host, gadget_counters
+const uint8_t FRAME_EXTENDED = 6; // region mask then the changed regions
+
+// Extended frame regions, offset and size in HID_DS4GamepadReport_Data_t
+const struct {
+  uint8_t offset;
+  uint8_t size;
+} EXT_REGIONS[] = {
+  {1, 4},     // sticks
+  {5, 3},     // dPad and buttons
+  {8, 2},     // triggers
+  {12, 1},    // batteryLvl
+  {13, 6},    // gyro X, Y, Z
+  {19, 6},    // accel X, Y, Z
+  {33, 10},   // touch packet count, timestamp, 2 fingers
+};
+#define EXT_REGION_COUNT (sizeof(EXT_REGIONS) / sizeof(EXT_REGIONS[0]))
+
+// Send telemetry to the host this often
+#define TELEMETRY_MS  100
+
+// Counters sent to the host in telemetry frames. All wrap.
+struct gadget_counters_t {
+  uint32_t frames_accepted;   // frames ending with ETX
+  uint32_t frames_dropped;    // no ETX where expected
+  uint32_t frames_ignored;    // unknown type or bad delta frame
+  uint32_t resyncs;           // 2 ms timeouts
+  uint32_t bytes_discarded;   // bytes outside frames
+  uint32_t usb_reports;       // USB reports sent
+} gadget_counters;
+
+// Last report received. Delta frames change it.
+uint8_t gadget_last[sizeof(HID_DS4GamepadReport_Data_t)];
+
 uint8_t gadget_report(uint8_t *buffer, size_t buflen)
 {
   static uint8_t gadget_buffer[128];
@@ -121,6 +159,9 @@ uint8_t gadget_report(uint8_t *buffer, size_t buflen)
             gadget_state = 1;
             gadget_buflen = 0;
           }
+          else {
+            gadget_counters.bytes_discarded++;
+          }
         }
         break;
       case 1:
@@ -164,12 +205,14 @@ uint8_t gadget_report(uint8_t *buffer, size_t buflen)
         if (byt != -1) {
           dbprintln(byt, HEX);
           if (byt == ETX) {
+            gadget_counters.frames_accepted++;
             if (gadget_buflen > buflen) gadget_buflen = buflen;
             memcpy(buffer, gadget_buffer, gadget_buflen);
             gadget_state = 0;
             return gadget_buflen;
           }
-          else if (byt == STX) {
+          gadget_counters.frames_dropped++;
+          if (byt == STX) {
             timeout_ms = millis();
             gadget_state = 1;
             gadget_buflen = 0;
@@ -186,13 +229,91 @@ uint8_t gadget_report(uint8_t *buffer, size_t buflen)
   // If STX seen and more than 2 ms, give up and go back to looking for STX
   if ((gadget_state != 0) && (elapsed_mSecs(timeout_ms) > 2)) {
     gadget_state = 0;
-    static uint32_t timeout_error = 0;
-    timeout_error++;
-    digitalWrite(LED_BUILTIN, timeout_error & 1);
+    gadget_counters.resyncs++;
+    digitalWrite(LED_BUILTIN, gadget_counters.resyncs & 1);
   }
   return 0;
 }
 
+/*
+ * Apply a delta frame to report. delta[0] is the field mask, bit n set means
+ * report byte n + 1 (leftXAxis, leftYAxis, rightXAxis, rightYAxis, the 3
+ * button bytes, L2Axis) follows. Bit 7 is followed by L2Axis and R2Axis.
+ * Returns false and leaves report unchanged if the length does not match.
+ */
+bool gadget_delta(uint8_t *report, const uint8_t *delta, size_t deltalen)
+{
+  if (deltalen < 1) return false;
+  uint8_t mask = delta[0];
+  size_t needed = 1;
+  for (uint8_t bit = 0; bit < 8; bit++) {
+    if (mask & (1 << bit)) needed++;
+  }
+  if (mask & 0x80) needed++;
+  if (deltalen != needed) return false;
+
+  size_t in = 1;
+  for (uint8_t bit = 0; bit < 8; bit++) {
+    if (mask & (1 << bit)) {
+      report[bit + 1] = delta[in++];
+    }
+  }
+  if (mask & 0x80) {
+    report[9] = delta[in];
+  }
+  return true;
+}
+
+/*
+ * Apply an extended frame to report. payload[0] is the region mask, bit n
+ * set means EXT_REGIONS[n] follows. Returns false and leaves report
+ * unchanged if the length does not match.
+ */
+bool gadget_regions(uint8_t *report, const uint8_t *payload, size_t payloadlen)
+{
+  if (payloadlen < 1) return false;
+  uint8_t mask = payload[0];
+  if (mask >> EXT_REGION_COUNT) return false;
+  size_t needed = 1;
+  for (uint8_t bit = 0; bit < EXT_REGION_COUNT; bit++) {
+    if (mask & (1 << bit)) needed += EXT_REGIONS[bit].size;
+  }
+  if (payloadlen != needed) return false;
+
+  size_t in = 1;
+  for (uint8_t bit = 0; bit < EXT_REGION_COUNT; bit++) {
+    if (mask & (1 << bit)) {
+      memcpy(&report[EXT_REGIONS[bit].offset], &payload[in], EXT_REGIONS[bit].size);
+      in += EXT_REGIONS[bit].size;
+    }
+  }
+  return true;
+}
+
+/*
+ * Send the counters to the host. The frame is skipped if the UART transmit
+ * buffer does not have room so receiving is never held up.
+ */
+void gadget_telemetry(void)
+{
+  static uint8_t sequence = 0;
+  uint8_t frame[4 + sizeof(gadget_counters) + 1];
+
+  gadget_counters.usb_reports = DS4Gamepad.reportCount();
+  frame[0] = STX;
+  frame[1] = sizeof(frame) - 3;
+  frame[2] = FRAME_TELEMETRY;
+  frame[3] = sequence;
+  // Little endian like the host expects
+  memcpy(&frame[4], &gadget_counters, sizeof(gadget_counters));
+  frame[sizeof(frame) - 1] = ETX;
+  if (gadget_availableForWrite() >= (int)sizeof(frame)) {
+    gadget_write(frame, sizeof(frame));
+  }
+  // The host sees a skipped frame as a gap in the sequence
+  sequence++;
+}
+
 void setup()
 {
   // Turn off built-in LED
@@ -214,6 +335,12 @@ void setup()
 #endif
 
   DS4Gamepad.begin();
+
+  // Same as DS4GamepadAPI::releaseAll()
+  memset(gadget_last, 0, sizeof(gadget_last));
+  gadget_last[0] = 0x01;
+  gadget_last[1] = gadget_last[2] = gadget_last[3] = gadget_last[4] = 0x80;
+  gadget_last[5] = DS4GAMEPAD_DPAD_CENTERED;
 }
 
 void loop()
@@ -221,9 +348,38 @@ void loop()
   uint8_t gadget_data[128];
   memset(gadget_data, 0, sizeof(gadget_data));
   uint8_t reportLen = gadget_report(gadget_data, sizeof(gadget_data));
-  if ((reportLen > 1) && (gadget_data[1] == 3)) {
-    DS4Gamepad.write(&gadget_data[2]);
+  if ((reportLen > 1) && (gadget_data[1] == FRAME_REPORT)) {
+    // Only the bytes received, the rest is kept for extended frames
+    size_t count = reportLen - 2;
+    if (count > sizeof(gadget_last)) count = sizeof(gadget_last);
+    memcpy(gadget_last, &gadget_data[2], count);
+    DS4Gamepad.write(gadget_last);
+  }
+  else if ((reportLen > 1) && (gadget_data[1] == FRAME_EXTENDED)) {
+    if (gadget_regions(gadget_last, &gadget_data[2], reportLen - 2)) {
+      DS4Gamepad.write(gadget_last);
+    }
+    else {
+      gadget_counters.frames_ignored++;
+    }
+  }
+  else if ((reportLen > 1) && (gadget_data[1] == FRAME_DELTA)) {
+    if (gadget_delta(gadget_last, &gadget_data[2], reportLen - 2)) {
+      DS4Gamepad.write(gadget_last);
+    }
+    else {
+      gadget_counters.frames_ignored++;
+    }
+  }
+  else if (reportLen > 1) {
+    gadget_counters.frames_ignored++;
   }
 
   DS4Gamepad.loop();
+
+  static uint32_t telemetry_ms = 0;
+  if (elapsed_mSecs(telemetry_ms) >= TELEMETRY_MS) {
+    telemetry_ms = millis();
+    gadget_telemetry();
+  }
 }
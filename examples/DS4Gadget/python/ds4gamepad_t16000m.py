@@ -5,31 +5,35 @@ Read from Thrustmaster T.16000M FCS and write to DS4Gadget.
 T16K -> Raspberry Pi -> DS4Gadget -> PlayStation 4
 """
 import os
-from struct import unpack
-import array
-from fcntl import ioctl
+from sys import exit
 import serial
-from ds4gpadserial import DS4GamepadSerial, DS4Button
+from ds4gpadserial import DS4GamepadSerial
+from ds4gmapper import DeviceMapper, ProfileRegistry, load_profile
+from ds4gidentity import IdentityCache
+from jsreader import JoystickReader
 
 ds4g = DS4GamepadSerial()
 ds4g.begin(serial.Serial('/dev/ttyAMA0', 2000000, timeout=0))
 
+PROFILE = load_profile('t16000m')
+
 # Open the T16K
 # joystick code based on https://gist.github.com/rdb/8864666
 T16K = False
-for fn in os.listdir('/dev/input'):
+# Identify joysticks from sysfs, only the match is opened
+REGISTRY = ProfileRegistry([PROFILE])
+IDENTITIES = IdentityCache()
+for fn in sorted(os.listdir('/dev/input')):
     if fn.startswith('js'):
-        print('/dev/input/%s' % (fn))
-        jsdev = open('/dev/input/' + fn, 'rb')
-        buf = array.array('B', [0] * 64)
-        ioctl(jsdev, 0x80006a13 + (0x10000 * len(buf)), buf) # JSIOCGNAME(len)
-        js_name = buf.tobytes().rstrip(b'\x00').decode('utf-8').upper()
-        print('Device name: %s' % js_name)
-        if 'THRUSTMASTER T.16000M' in js_name:
+        identity = IDENTITIES.lookup('/dev/input/' + fn)
+        if identity is None:
+            continue
+        print('/dev/input/%s %04x:%04x %s' % (fn, identity.vendor,
+                                             identity.product, identity.name))
+        if REGISTRY.find(identity):
+            jsdev = JoystickReader('/dev/input/' + fn)
             T16K = True
             break
-        else:
-            jsdev.close()
 
 if not T16K:
     print('THRUSTMASTER T.16000M not found')
@@ -38,15 +42,8 @@ if not T16K:
 print('THRUSTMASTER T.16000M found')
 
 # Get number of axes and buttons
-buf = array.array('B', [0])
-ioctl(jsdev, 0x80016a11, buf) # JSIOCGAXES
-num_axes = buf[0]
-print('num_axes = %s' % num_axes)
-
-buf = array.array('B', [0])
-ioctl(jsdev, 0x80016a12, buf) # JSIOCGBUTTONS
-num_buttons = buf[0]
-print('num_buttons = %s' % num_buttons)
+print('num_axes = %s' % jsdev.num_axes())
+print('num_buttons = %s' % jsdev.num_buttons())
 
 # Map T16K button numbers to DS4 gamepad buttons
 # T16K buttons
@@ -62,68 +59,7 @@ print('num_buttons = %s' % num_buttons)
 # 7 9 11
 # 6 8 10
 #
-BUTTON_MAP = array.array('B', [
-    DS4Button.CROSS,
-    DS4Button.CIRCLE,
-    DS4Button.SQUARE,
-    DS4Button.TRIANGLE,
-    DS4Button.L1,
-    DS4Button.R1,
-    DS4Button.SHARE,
-    DS4Button.LOGO,
-    DS4Button.SHARE,
-    DS4Button.LOGO,
-    DS4Button.L2,
-    DS4Button.R2,
-    222,
-    222,
-    222,
-    222])
-
-left_stick_pressed = False
-right_stick_pressed = False
-
-while True:
-    evbuf = jsdev.read(8)
-    if evbuf:
-        time, value, type, number = unpack('IhBB', evbuf)
-        if type & 0x01: # button event
-            button_out = BUTTON_MAP[number]
-            if value:
-                ds4g.press(button_out)
-            else:
-                ds4g.release(button_out)
+# See profiles/t16000m.json. The twist axis presses L3/R3 at its ends, the
+# hat switch (axes 4, 5) moves the right stick.
 
-        if type & 0x02: # axis event
-            # DS4 wants values 0..128..255 where 128 is center position
-            axis = ((value + 32767) >> 8)
-            if axis == 127:
-                axis = 128
-            # Axes 0,1 left stick X,Y
-            if number == 0:
-                ds4g.leftXAxis(axis)
-            elif number == 1:
-                ds4g.leftYAxis(axis)
-            # Axis 2 twist
-            elif number == 2:
-                if axis == 0:
-                    ds4g.press(DS4Button.L3)
-                    left_stick_pressed = True
-                elif axis == 255:
-                    ds4g.press(DS4Button.R3)
-                    right_stick_pressed = True
-                else:
-                    if left_stick_pressed:
-                        ds4g.release(DS4Button.L3)
-                        left_stick_pressed = False
-                    if right_stick_pressed:
-                        ds4g.release(DS4Button.R3)
-                        right_stick_pressed = False
-            # Axis 3 throttle lever
-#            elif number == 3:
-#                Find a use for this!
-            # Axes 4,5 directional pad X,Y
-            elif number == 4:
-                ds4g.rightXAxis(axis)
-            elif number == 5:
-                ds4g.rightYAxis(axis)
+DeviceMapper(PROFILE, ds4g, jsdev).run(jsdev)
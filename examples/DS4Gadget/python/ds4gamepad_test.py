@@ -1,34 +1,40 @@
 #!/usr/bin/python3
 """
 Exercise DS4GamepadSerial class.
+
+Steps are timed on absolute deadlines so they do not drift. The lateness of
+the steps is printed after each round.
 """
-from time import sleep
 import serial
-from ds4gpadserial import DS4GamepadSerial
+from ds4gpadserial import DS4GamepadSerial, DS4DPad
+from ds4gschedule import Scheduler
 
 DS4G = DS4GamepadSerial()
 # TODO port name from command line
 DS4G.begin(serial.Serial('/dev/ttyAMA0', 2000000, timeout=0))
 
+SCHED = Scheduler().start()
+
 while True:
     # Press and hold every button 0..13
     for x in range(0, 14):
         DS4G.press(x)
-        sleep(0.1)
-    sleep(1)
+        SCHED.wait(0.1)
+    SCHED.wait(1)
     # Release all buttons
     DS4G.releaseAll()
-    sleep(1)
+    SCHED.wait(1)
     # Press all 14 buttons at the same time
     DS4G.buttons(0x3fff)
-    sleep(1)
+    SCHED.wait(1)
     # Release all buttons
     DS4G.releaseAll()
-    sleep(1)
+    SCHED.wait(1)
     # Move directional pad in all directions
     # 0 = North, 1 = North-East, 2 = East, etc.
     for x in range(0, 8):
         DS4G.dPad(x)
-        sleep(0.5)
+        SCHED.wait(0.5)
     # Move directional pad to center
-    DS4G.dPad(15)
+    DS4G.dPad(DS4DPad.CENTERED)
+    print('lateness us %s' % SCHED.stats())
@@ -0,0 +1,265 @@
+#!/usr/bin/python3
+"""
+Benchmarks for the host side of the DS4Gadget pipeline.
+
+    encode      DS4GamepadSerial.write() frames/s to a null port
+    setters     leftXAxis() calls/s from 1, 2 and 4 threads sharing one
+                DS4GamepadSerial, like the two reader threads in
+                ds4gamepad_dragonrise.py
+    jsdecode    js_event decode rate, unpack('IhBB') per event and
+                Struct.iter_unpack over a buffer as in jsreader.py
+    pty         sustained frames/s and frame to USB report latency through a
+                pty to the ds4greceiver model at GADGET_BPS, paced to the
+                line rate. "valid": false marks a run where the model lost
+                bytes or frames.
+
+Results are printed as one JSON object per benchmark. Use --output to save
+them and --compare to print the change against a saved run.
+
+    $ ./ds4gbench.py --output pi3.json
+    $ ./ds4gbench.py --compare pi3.json
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+import json
+import time
+import platform
+import threading
+import termios
+from struct import pack, unpack
+from ds4gpadserial import DS4GamepadSerial
+from ds4greceiver import GadgetReceiver, PtyGadget, GADGET_BPS
+from ds4ggovernor import OutputGovernor
+from jsreader import JS_EVENT
+
+class NullPort:
+    """Serial port that discards everything"""
+    def write(self, data):
+        """Discard data"""
+        return len(data)
+
+    def close(self):
+        """Nothing to close"""
+        return
+
+def best_rate(func, count, repeat):
+    """Run func(count) repeat times, return the best operations per second"""
+    best = 0.0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(count)
+        elapsed = time.perf_counter() - start
+        best = max(best, count / elapsed)
+    return best
+
+def bench_encode(count, repeat):
+    """DS4GamepadSerial.write() rate"""
+    ds4g = DS4GamepadSerial()
+    ds4g.begin(NullPort())
+    def run(count):
+        write = ds4g.write
+        for _ in range(count):
+            write()
+    return {'name': 'encode', 'frames_per_s': best_rate(run, count, repeat)}
+
+def bench_setters(count, repeat, threads):
+    """Setter calls/s with threads contending for one DS4GamepadSerial"""
+    ds4g = DS4GamepadSerial()
+    ds4g.begin(NullPort())
+    def worker(count):
+        axis = ds4g.leftXAxis
+        for i in range(count):
+            axis(i & 0xff)
+    def run(count):
+        per_thread = count // threads
+        workers = [threading.Thread(target=worker, args=(per_thread,))
+                   for _ in range(threads)]
+        for thr in workers:
+            thr.start()
+        for thr in workers:
+            thr.join()
+    return {'name': 'setters_%d_threads' % threads, 'threads': threads,
+            'calls_per_s': best_rate(run, count, repeat)}
+
+def bench_jsdecode(count, repeat):
+    """js_event decode rate"""
+    events = b''.join(pack('IhBB', i, (i * 37) & 0x7fff, 2, i & 7)
+                      for i in range(64))
+    view = memoryview(events)
+    batches = max(1, count // 64)
+    def per_event(_):
+        for _ in range(batches):
+            for offset in range(0, len(events), 8):
+                unpack('IhBB', events[offset:offset + 8])
+    def bulk(_):
+        iter_unpack = JS_EVENT.iter_unpack
+        for _ in range(batches):
+            for _ in iter_unpack(view):
+                pass
+    total = batches * 64
+    return {'name': 'jsdecode',
+            'unpack_events_per_s': best_rate(per_event, total, repeat),
+            'iter_unpack_events_per_s': best_rate(bulk, total, repeat)}
+
+def open_port(path, bps):
+    """Open path with pyserial if installed, else as a raw tty"""
+    try:
+        import serial
+        return serial.Serial(path, bps, timeout=0)
+    except ImportError:
+        pass
+    class RawPort:
+        """Minimal pyserial look-alike"""
+        def __init__(self):
+            self.fd = os.open(path, os.O_WRONLY | os.O_NOCTTY)
+            attrs = termios.tcgetattr(self.fd)
+            speed = getattr(termios, 'B%d' % bps, termios.B38400)
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
+        def write(self, data):
+            """Write all of data"""
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self.fd, view):]
+            return len(data)
+        def close(self):
+            """Close the tty"""
+            os.close(self.fd)
+    return RawPort()
+
+def bench_pty(seconds, rate_hz):
+    """
+    Frames/s and latency through a pty to the receiver model. The left stick
+    axes carry a 16-bit sequence number so each USB report can be matched to
+    the frame that produced it. An OutputGovernor paces the frames to the
+    line rate, otherwise the pty queues them and the latency measured is the
+    queue. valid is False if the model lost bytes or frames; compare()
+    skips such results.
+    """
+    sent = {}
+    latencies = []
+    def on_report(collected_ms, report):
+        sent_ms = sent.pop(report[1] | (report[2] << 8), None)
+        if sent_ms is not None:
+            latencies.append(collected_ms - sent_ms)
+    gadget = PtyGadget(GadgetReceiver(on_report=on_report)).start()
+    ds4g = DS4GamepadSerial(rate_hz)
+    ds4g.begin(open_port(gadget.slave_name, GADGET_BPS))
+    governor = OutputGovernor(ds4g, bps=GADGET_BPS).start()
+    sequence = 0
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        sequence = (sequence + 1) & 0xffff
+        with ds4g.batch():
+            sent[sequence] = time.monotonic() * 1000.0
+            ds4g.leftXAxis(sequence & 0xff)
+            ds4g.leftYAxis(sequence >> 8)
+    time.sleep(0.1)
+    governor.stop()
+    ds4g.end()
+    counters = gadget.counters()
+    gadget.stop()
+    latencies.sort()
+    def pct(fraction):
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+    return {'name': 'pty' if not rate_hz else 'pty_%dhz' % rate_hz,
+            'bps': GADGET_BPS,
+            'frames_per_s': counters['frames_accepted'] / seconds,
+            'usb_reports_per_s': counters['usb_reports'] / seconds,
+            'latency_ms_p50': pct(0.5), 'latency_ms_p99': pct(0.99),
+            'latency_ms_max': latencies[-1] if latencies else 0.0,
+            'valid': not counters['bytes_overrun']
+                     and not counters['frames_dropped'],
+            'governor': governor.counters(),
+            'counters': counters}
+
+def run_all(args):
+    """Run the selected benchmarks"""
+    results = []
+    selected = args.only.split(',') if args.only else \
+        ['encode', 'setters', 'jsdecode', 'pty']
+    if 'encode' in selected:
+        results.append(bench_encode(args.count, args.repeat))
+    if 'setters' in selected:
+        for threads in (1, 2, 4):
+            results.append(bench_setters(args.count, args.repeat, threads))
+    if 'jsdecode' in selected:
+        results.append(bench_jsdecode(args.count, args.repeat))
+    if 'pty' in selected:
+        results.append(bench_pty(args.seconds, 0))
+        results.append(bench_pty(args.seconds, 250))
+    return results
+
+def compare(results, old_path):
+    """Print the change of every rate and latency against a saved run"""
+    with open(old_path) as old_file:
+        old = {entry['name']: entry for entry in
+               (json.loads(line) for line in old_file if line.startswith('{'))}
+    for entry in results:
+        before = old.get(entry['name'])
+        if before is None:
+            continue
+        if not entry.get('valid', True) or not before.get('valid', True):
+            print('%-22s lost bytes or frames, not compared' % entry['name'])
+            continue
+        for key, value in entry.items():
+            if isinstance(value, float) and isinstance(before.get(key), float) \
+                    and before[key]:
+                print('%-22s %-26s %12.1f -> %12.1f %+7.1f%%' %
+                      (entry['name'], key, before[key], value,
+                       100.0 * (value - before[key]) / before[key]))
+
+def main():
+    """Run benchmarks"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--count', type=int, default=100000,
+                        help='operations per timed run')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='timed runs, the best is reported')
+    parser.add_argument('--seconds', type=float, default=2.0,
+                        help='duration of each pty run')
+    parser.add_argument('--only', help='comma separated list of benchmarks')
+    parser.add_argument('--output', help='save results as JSON lines')
+    parser.add_argument('--compare', help='saved results to compare against')
+    args = parser.parse_args()
+
+    header = {'name': 'host', 'machine': platform.machine(),
+              'node': platform.node(), 'python': platform.python_version(),
+              'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    results = run_all(args)
+    lines = [json.dumps(header)] + [json.dumps(entry) for entry in results]
+    print('\n'.join(lines))
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            out_file.write('\n'.join(lines) + '\n')
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+Latest state wins output governor for DS4GamepadSerial.
+
+At 2,000,000 bps the UART carries about 14000 frames per second but a USB
+serial adapter or a slower link can back up. Then ser_port.write() blocks
+with thread_lock held and every frame queued behind it is stale by the time
+it goes out.
+
+OutputGovernor keeps the bytes waiting to be sent under a budget, max_latency
+seconds of line time. The waiting bytes are the larger of the port
+out_waiting (pyserial) and a model of the line draining at bps. While over
+budget the setters only update the state: the frame is held, newer states
+replace it and a governor thread sends the newest state as soon as the
+budget allows. States are coalesced, never encoded frames, so delta frames
+stay correct.
+
+    governor = OutputGovernor(ds4g, bps=2000000).start()
+    ...
+    print(governor.counters())
+
+Counters
+    sent        frames written
+    coalesced   held states replaced by a newer one before they were sent.
+                These are the states the gadget never saw.
+    dropped     held states that were never written. Either the newest state
+                was already the last frame sent, as after a press and
+                release while held, so the gadget has it, or stop() was
+                called while a state was held.
+
+A press and release that both happen while the port is over budget are
+coalesced away; the newest state always wins.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import threading
+from time import monotonic_ns
+
+# 8N1, 10 bits on the line per byte
+BITS_PER_BYTE = 10
+
+# Bytes queued for at most 2 ms, about 28 full frames at 2,000,000 bps
+MAX_LATENCY = 0.002
+
+class OutputGovernor:
+    """Hold frames while the serial port is over its byte budget and send
+    the newest state when it drains"""
+    def __init__(self, ds4g, bps=2000000, max_latency=MAX_LATENCY):
+        self.ds4g = ds4g
+        self.ns_per_byte = BITS_PER_BYTE * 1e9 / bps
+        self.budget = int(max_latency * bps / BITS_PER_BYTE)
+        # Time the line model finishes sending what was written
+        self.busy_until_ns = 0
+        # A state newer than the last frame sent is waiting
+        self.held = False
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.frames_sent = 0
+        self.frames_coalesced = 0
+        self.frames_dropped = 0
+
+    def start(self):
+        """Govern ds4g. With rate_hz = 0 a thread sends held frames; with
+        rate_hz > 0 the sender thread of ds4g retries them every tick."""
+        with self.ds4g.thread_lock:
+            self.ds4g.governor = self
+        if not self.ds4g.rate_hz:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop governing. A held state is dropped."""
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        with self.ds4g.thread_lock:
+            self.ds4g.governor = None
+            if self.held:
+                self.drop()
+        return
+
+    def pending(self, now_ns):
+        """Bytes written but not yet on the line"""
+        modelled = (self.busy_until_ns - now_ns) / self.ns_per_byte
+        try:
+            waiting = self.ds4g.ser_port.out_waiting
+        except (AttributeError, OSError):
+            waiting = 0
+        return max(modelled, waiting, 0)
+
+    def drain_ns(self):
+        """How long until the port is under budget, 0 if it is now"""
+        now_ns = monotonic_ns()
+        excess = self.pending(now_ns) - self.budget
+        return int(excess * self.ns_per_byte) if excess > 0 else 0
+
+    def admit(self, new_state=True):
+        """True if a frame may be written now. Otherwise the state is held
+        for the governor thread, or the sender thread with rate_hz > 0.
+        new_state False retries a held state that did not change. Call with
+        thread_lock held."""
+        if not self.drain_ns():
+            # Anything held goes out in this frame
+            self.held = False
+            return True
+        if not self.held:
+            self.held = True
+            self.wakeup.set()
+        elif new_state:
+            self.frames_coalesced += 1
+        return False
+
+    def drop(self):
+        """Forget the held state, the gadget already has it. Call with
+        thread_lock held."""
+        self.held = False
+        self.frames_dropped += 1
+        return
+
+    def sent(self, length):
+        """Account for a frame of length bytes written"""
+        now_ns = monotonic_ns()
+        self.busy_until_ns = max(self.busy_until_ns, now_ns) + \
+            int(length * self.ns_per_byte)
+        self.frames_sent += 1
+        return
+
+    def counters(self):
+        """Dict of frames sent, coalesced and dropped, see the module
+        docstring"""
+        return {'sent': self.frames_sent,
+                'coalesced': self.frames_coalesced,
+                'dropped': self.frames_dropped}
+
+    def run(self):
+        """Governor thread, sends the held state once the port drains"""
+        ds4g = self.ds4g
+        while not self.stop_event.is_set():
+            self.wakeup.wait()
+            self.wakeup.clear()
+            while not self.stop_event.is_set():
+                with ds4g.thread_lock:
+                    if not self.held:
+                        break
+                    delay_ns = self.drain_ns()
+                    if not delay_ns:
+                        if ds4g.last_frame == ds4g.state() \
+                                and not ds4g.ext_dirty:
+                            self.drop()
+                        else:
+                            ds4g.write()
+                        break
+                self.stop_event.wait(delay_ns / 1e9)
+        return
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+"""
+Hat switch resolver. Every way an input device reports a direction pad
+becomes a DS4 dPad code with one table lookup.
+
+    axis pair       AXIS_HAT[(x << 8) | y], x and y 0..128..255
+    4 buttons       ButtonHat(socd).set(HAT_UP, pressed)
+    POV angle       pov(angle), hundredths of a degree clockwise from up
+    and back        HAT_X[code], HAT_Y[code], the axis pair of a code
+
+Codes are the DS4DPad values, 0 up then clockwise to 7 up-left, and
+HAT_CENTERED (8, DS4GAMEPAD_DPAD_CENTERED in the firmware) for centered.
+Every code from 8 to 15 is read as centered.
+
+SOCD (simultaneous opposite cardinal directions) modes for 4 button pads
+    neutral     left + right and up + down cancel out, per axis
+    up          up + down is up, left + right cancels out
+    last        the direction pressed last wins
+    first       the direction pressed first wins
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+HAT_CENTERED = 8
+
+# Code of each (dx, dy) step, y grows downwards like the stick axes
+DIRECTIONS = {(0, -1): 0, (1, -1): 1, (1, 0): 2, (1, 1): 3,
+              (0, 1): 4, (-1, 1): 5, (-1, 0): 6, (-1, -1): 7,
+              (0, 0): HAT_CENTERED}
+
+# Axis pair of each code, 16 entries so any 4 bit dPad value is an index
+STEPS = {code: steps for steps, code in DIRECTIONS.items()}
+AXIS_VALUE = {-1: 0, 0: 128, 1: 255}
+HAT_X = bytes(AXIS_VALUE[STEPS.get(code, (0, 0))[0]] for code in range(16))
+HAT_Y = bytes(AXIS_VALUE[STEPS.get(code, (0, 0))[1]] for code in range(16))
+
+# ButtonHat index bits, the 4 buttons in LDRU order
+HAT_UP = 0x01
+HAT_RIGHT = 0x02
+HAT_DOWN = 0x04
+HAT_LEFT = 0x08
+# and which of the opposite buttons was pressed last
+LAST_LEFT = 0x10
+LAST_DOWN = 0x20
+
+SOCD_NEUTRAL = 'neutral'
+SOCD_UP = 'up'
+SOCD_LAST = 'last'
+SOCD_FIRST = 'first'
+SOCD_MODES = (SOCD_NEUTRAL, SOCD_UP, SOCD_LAST, SOCD_FIRST)
+
+def step(value, threshold):
+    """-1, 0 or 1 for an axis value 0..255 around 128"""
+    if abs(value - 128) <= threshold:
+        return 0
+    return 1 if value > 128 else -1
+
+def axis_table(threshold=0):
+    """65536 entry table of codes indexed by (x << 8) | y. Values within
+    threshold of 128 count as centered."""
+    steps = [step(value, threshold) for value in range(256)]
+    table = bytearray(65536)
+    for x in range(256):
+        dx = steps[x]
+        table[x << 8:(x + 1) << 8] = bytes(DIRECTIONS[(dx, dy)] for dy in steps)
+    return bytes(table)
+
+AXIS_HAT = axis_table()
+
+def resolve(negative, positive, last_negative, mode, negative_wins):
+    """Step of one axis from its two buttons"""
+    if negative and positive:
+        if mode == SOCD_NEUTRAL:
+            return 0
+        if mode == SOCD_UP:
+            return -1 if negative_wins else 0
+        if (mode == SOCD_LAST) == bool(last_negative):
+            return -1
+        return 1
+    return -1 if negative else (1 if positive else 0)
+
+def button_table(socd=SOCD_NEUTRAL):
+    """64 entry table of codes indexed by LDRU button bits, LAST_LEFT and
+    LAST_DOWN"""
+    if socd not in SOCD_MODES:
+        raise ValueError('unknown SOCD mode %s' % socd)
+    table = bytearray(64)
+    for index in range(64):
+        dx = resolve(index & HAT_LEFT, index & HAT_RIGHT, index & LAST_LEFT,
+                     socd, False)
+        # Up is the negative direction
+        dy = resolve(index & HAT_UP, index & HAT_DOWN, not index & LAST_DOWN,
+                     socd, True)
+        table[index] = DIRECTIONS[(dx, dy)]
+    return bytes(table)
+
+class ButtonHat:
+    """Code of a 4 button direction pad"""
+    def __init__(self, socd=SOCD_NEUTRAL):
+        self.table = button_table(socd)
+        self.index = 0
+
+    def set(self, button, pressed):
+        """Press or release HAT_UP, HAT_RIGHT, HAT_DOWN or HAT_LEFT. Returns
+        the code."""
+        index = self.index
+        if pressed:
+            index |= button
+            if button & (HAT_LEFT | HAT_RIGHT):
+                index = (index & ~LAST_LEFT) | (LAST_LEFT if button == HAT_LEFT else 0)
+            else:
+                index = (index & ~LAST_DOWN) | (LAST_DOWN if button == HAT_DOWN else 0)
+        else:
+            index &= ~button
+        self.index = index
+        return self.table[index]
+
+# Code of each whole degree, sectors of 45 degrees centered on the directions
+POV_TABLE = bytes(((degree * 100 + 2250) // 4500) % 8 for degree in range(360))
+
+def pov(angle, full_circle=36000):
+    """Code of a POV hat angle, full_circle units per turn. Angles outside
+    0..full_circle, like -1 or 0xffff, are centered."""
+    if angle < 0 or angle >= full_circle:
+        return HAT_CENTERED
+    return POV_TABLE[angle * 360 // full_circle]
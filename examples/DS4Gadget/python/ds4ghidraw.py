@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+"""
+Pass DS4 compatible gamepad reports straight through to DS4Gadget.
+
+A DualShock 4 or another PS4 compatible gamepad already sends the 64 byte
+report DS4Gadget emulates. Reading it as joystick events, mapping each field
+and packing it again is pure overhead. HidrawPassthrough reads the raw USB
+input reports from /dev/hidraw*, applies an optional patch table and sends
+the changed regions of the report as an extended frame (type 6). Reports are
+read into two buffers in turn so the previous report is there to compare
+with, and the regions are copied once, from the report into the frame.
+Latency is one read plus one write.
+
+A patch is (offset, keep, value): report[offset] = report[offset] & keep |
+value. The default patch clears the 6 bit report counter of the source so it
+does not make every report differ; the gadget counts its own reports.
+
+    $ ./ds4ghidraw.py                       first DS4 compatible hidraw
+    $ ./ds4ghidraw.py /dev/hidraw2 --patch 7:fc:00
+
+Only USB reports (report ID 1, 64 bytes) are passed through.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+from ds4gpadserial import REPORT_SIZE, EXT_FRAME_LEN, DELTA_FULL_EVERY, \
+    encode_regions
+from ds4gidentity import read_sysfs, usb_id
+
+SYSFS_HIDRAW = '/sys/class/hidraw'
+
+# Gamepads that send DS4 USB reports
+DS4_USB_IDS = ('054c:05c4',     # DualShock 4
+               '054c:09cc',     # DualShock 4 v2
+               '0f0d:00ee')     # Hori Mini4
+
+DS4_REPORT_ID = 1
+# Keep dPad and buttons, clear the report counter in the top 6 bits
+DEFAULT_PATCHES = ((7, 0x03, 0x00),)
+
+def hidraw_usb_id(node, sysfs=SYSFS_HIDRAW):
+    """'vvvv:pppp' of a hidraw node, for example 'hidraw0', or None"""
+    uevent = read_sysfs(os.path.join(sysfs, node, 'device', 'uevent'))
+    for line in uevent.split('\n'):
+        if line.startswith('HID_ID='):
+            # HID_ID=0003:0000054C:000005C4, bus:vendor:product
+            _, vendor, product = line[7:].split(':')
+            return usb_id(int(vendor, 16), int(product, 16))
+    return None
+
+def find_hidraw(usb_ids=DS4_USB_IDS, directory='/dev'):
+    """Path of the first hidraw node with one of usb_ids, or None"""
+    nodes = sorted((name for name in os.listdir(directory)
+                    if name.startswith('hidraw')),
+                   key=lambda name: int(name[6:] or 0))
+    for node in nodes:
+        if hidraw_usb_id(node) in usb_ids:
+            return os.path.join(directory, node)
+    return None
+
+def parse_patch(text):
+    """(offset, keep, value) from 'offset:keep:value', keep and value in
+    hex"""
+    offset, keep, value = text.split(':')
+    offset, keep, value = int(offset), int(keep, 16), int(value, 16)
+    if not 0 <= offset < REPORT_SIZE:
+        raise ValueError('patch offset %d is outside the %d byte report'
+                         % (offset, REPORT_SIZE))
+    if not (0 <= keep <= 0xff and 0 <= value <= 0xff):
+        raise ValueError('patch keep and value must be bytes')
+    return offset, keep, value
+
+class HidrawPassthrough:
+    """Forward raw DS4 reports from a hidraw device to a DS4Gadget port"""
+    def __init__(self, path, ser_port, patches=DEFAULT_PATCHES):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.ser_port = ser_port
+        self.patches = tuple(patches)
+        # Read into one while the other holds the previous report
+        self.reports = (bytearray(REPORT_SIZE), bytearray(REPORT_SIZE))
+        self.frame = bytearray(EXT_FRAME_LEN)
+        self.frame_view = memoryview(self.frame)
+        # Frames since the last frame with every region
+        self.full_count = DELTA_FULL_EVERY
+        self.reports_read = 0
+        self.reports_ignored = 0
+        self.frames_sent = 0
+
+    def close(self):
+        """Close the hidraw device"""
+        os.close(self.fd)
+        return
+
+    def forward(self, report, previous):
+        """Patch report and send the regions that differ from previous.
+        previous None sends every region."""
+        for offset, keep, value in self.patches:
+            report[offset] = (report[offset] & keep) | value
+        self.full_count += 1
+        if self.full_count >= DELTA_FULL_EVERY:
+            self.full_count = 0
+            previous = None
+        length = encode_regions(report, previous, self.frame)
+        # Mask 0, nothing changed
+        if self.frame[3]:
+            self.ser_port.write(self.frame_view[:length])
+            self.frames_sent += 1
+        return
+
+    def run(self):
+        """Forward reports until the device is unplugged (OSError)"""
+        fd = self.fd
+        current, previous = self.reports
+        have_previous = False
+        while True:
+            nbytes = os.readv(fd, (current,))
+            if nbytes == 0:
+                raise OSError('%s: end of file' % self.path)
+            self.reports_read += 1
+            if nbytes != REPORT_SIZE or current[0] != DS4_REPORT_ID:
+                self.reports_ignored += 1
+                continue
+            self.forward(current, previous if have_previous else None)
+            have_previous = True
+            current, previous = previous, current
+
+def main():
+    """Pass a hidraw gamepad through to DS4Gadget"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('hidraw', nargs='?',
+                        help='hidraw node, the first DS4 compatible by default')
+    parser.add_argument('--port', default='/dev/ttyAMA0')
+    parser.add_argument('--bps', type=int, default=2000000)
+    parser.add_argument('--patch', action='append', type=parse_patch,
+                        help='offset:keep:value, replaces the default patch')
+    args = parser.parse_args()
+
+    path = args.hidraw or find_hidraw()
+    if path is None:
+        print('DS4 compatible gamepad not found')
+        return 1
+    import serial
+    passthrough = HidrawPassthrough(
+        path, serial.Serial(args.port, args.bps),
+        DEFAULT_PATCHES if args.patch is None else args.patch)
+    print('%s -> %s' % (path, args.port))
+    try:
+        passthrough.run()
+    except OSError as err:
+        print(err)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        passthrough.close()
+        print('reports %d ignored %d frames %d' % (
+            passthrough.reports_read, passthrough.reports_ignored,
+            passthrough.frames_sent))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+"""
+Input device hotplug using inotify on /dev/input.
+
+Hotplug blocks on an inotify file descriptor watching /dev/input and calls
+on_add(path) and on_remove(path) as soon as js* or event* device nodes appear
+and disappear. There is no polling so the process does not wake up while
+nothing changes.
+
+udev may change the permissions of a new node just after it is created. If
+on_add() returns False (for example opening the node failed with
+PermissionError) it is called again when the node attributes change.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import ctypes
+import ctypes.util
+from struct import Struct
+
+# <sys/inotify.h>
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+# struct inotify_event { int wd; uint32_t mask, cookie, len; char name[]; }
+INOTIFY_EVENT = Struct('iIII')
+
+LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+class Hotplug:
+    """Watch a directory of device nodes"""
+    def __init__(self, on_add, on_remove, directory='/dev/input',
+                 prefixes=('js', 'event')):
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.directory = directory
+        self.prefixes = tuple(prefixes)
+        # Nodes on_add() accepted
+        self.attached = set()
+        self.fd = LIBC.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        mask = IN_CREATE | IN_ATTRIB | IN_MOVED_TO | IN_DELETE | IN_MOVED_FROM
+        if LIBC.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), directory)
+
+    def close(self):
+        """Stop watching"""
+        os.close(self.fd)
+        return
+
+    def wanted(self, name):
+        """True if name is a device node to report"""
+        return name.startswith(self.prefixes)
+
+    def add(self, name):
+        """Call on_add() for a node not yet attached"""
+        path = os.path.join(self.directory, name)
+        if path not in self.attached and self.on_add(path) is not False:
+            self.attached.add(path)
+        return
+
+    def remove(self, name):
+        """Call on_remove() for an attached node"""
+        path = os.path.join(self.directory, name)
+        if path in self.attached:
+            self.attached.discard(path)
+            self.on_remove(path)
+        return
+
+    def scan(self):
+        """Report the nodes that already exist and forget removed ones"""
+        names = [name for name in sorted(os.listdir(self.directory))
+                 if self.wanted(name)]
+        for path in list(self.attached):
+            if os.path.basename(path) not in names:
+                self.remove(os.path.basename(path))
+        for name in names:
+            self.add(name)
+        return
+
+    def handle(self, data):
+        """Handle a buffer of inotify events"""
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b'\x00').decode()
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, compare with the directory instead
+                self.scan()
+            elif not self.wanted(name):
+                continue
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.remove(name)
+            elif mask & (IN_CREATE | IN_ATTRIB | IN_MOVED_TO):
+                self.add(name)
+        return
+
+    def run(self):
+        """Report existing nodes then block waiting for changes"""
+        self.scan()
+        while True:
+            self.handle(os.read(self.fd, 4096))
@@ -0,0 +1,97 @@
+#!/usr/bin/python3
+"""
+Input device identity from sysfs.
+
+The USB vendor and product IDs, version, bus type, name and serial number of
+an input device node are read from /sys/class/input/<node>/device without
+opening the node. Results are cached by node name, inode, device number and
+change time so a node is only looked up again when it is replaced by a new
+device.
+
+    >>> IdentityCache().lookup('/dev/input/js0')
+    DeviceIdentity(bustype=3, vendor=3853, product=238, version=273,
+                   name='HORI CO.,LTD. HORIPAD MINI4', uniq='')
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+from collections import namedtuple
+
+SYSFS_INPUT = '/sys/class/input'
+
+DeviceIdentity = namedtuple('DeviceIdentity',
+                            'bustype vendor product version name uniq')
+
+def read_sysfs(path, default=''):
+    """Contents of a sysfs attribute without the trailing newline"""
+    try:
+        with open(path) as attr_file:
+            return attr_file.read().rstrip('\n')
+    except OSError:
+        return default
+
+def usb_id(vendor, product):
+    """'vvvv:pppp' as printed by lsusb"""
+    return '%04x:%04x' % (vendor, product)
+
+def parse_usb_id(text):
+    """(vendor, product) from 'vvvv:pppp'"""
+    vendor, product = text.split(':')
+    return int(vendor, 16), int(product, 16)
+
+class IdentityCache:
+    """DeviceIdentity of device nodes, cached by node, inode, rdev and ctime"""
+    def __init__(self, sysfs=SYSFS_INPUT):
+        self.sysfs = sysfs
+        # node name: ((st_ino, st_rdev, st_ctime_ns), DeviceIdentity)
+        self.cache = {}
+
+    def read(self, node):
+        """Read the identity of node, for example 'js0', from sysfs"""
+        device = os.path.join(self.sysfs, node, 'device')
+        ids = [int(read_sysfs(os.path.join(device, 'id', attr), '0'), 16)
+               for attr in ('bustype', 'vendor', 'product', 'version')]
+        return DeviceIdentity(*ids, read_sysfs(os.path.join(device, 'name')),
+                              read_sysfs(os.path.join(device, 'uniq')))
+
+    def lookup(self, path):
+        """DeviceIdentity of the node at path or None if it is gone"""
+        node = os.path.basename(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self.cache.pop(node, None)
+            return None
+        # The same inode and device number are reused when a joystick is
+        # unplugged and plugged in again
+        key = (stat.st_ino, stat.st_rdev, stat.st_ctime_ns)
+        entry = self.cache.get(node)
+        if entry is None or entry[0] != key:
+            entry = (key, self.read(node))
+            self.cache[node] = entry
+        return entry[1]
+
+    def forget(self, path):
+        """Drop the cached identity of a removed node"""
+        self.cache.pop(os.path.basename(path), None)
+        return
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+"""
+Input to UART latency instrumentation for DS4GamepadSerial.
+
+Each input event is timestamped at every stage on its way to the serial port.
+
+    kernel      js_event time to JoystickReader read
+    dispatch    read to the mapper calling the DS4GamepadSerial setter
+    lock        dispatch to thread_lock acquired and the field updated
+    encode      lock to the frame being ready to write
+    write       frame ready to ser_port.write() returning
+    total       kernel to ser_port.write() returning
+
+The js_event time is a 32-bit jiffies based millisecond counter so the kernel
+stage is measured relative to the smallest delay seen on that device and has
+1 jiffy resolution. All other stages use time.monotonic_ns().
+
+    tracer = LatencyTracer()
+    ds4g.tracer = tracer
+    reader = JoystickReader(path, tracer=tracer)
+    ...
+    print(tracer.format_report())
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import array
+import threading
+from time import monotonic_ns
+
+STAGES = ('kernel', 'dispatch', 'lock', 'encode', 'write', 'total')
+
+# Histogram buckets: values below SUB_BUCKETS are exact, above that each
+# power of 2 is split into SUB_BUCKETS buckets so the error is below 7%.
+SUB_BUCKETS = 16
+SUB_BITS = 4
+MAX_EXPONENT = 40
+
+# Events waiting for a frame are dropped past this so a client that never
+# writes cannot grow the list forever.
+MAX_PENDING = 1024
+
+class LatencyHistogram:
+    """
+    Log-linear (HDR style) histogram of microsecond values. Two windows are
+    kept so the percentiles cover between window and 2 * window seconds.
+    """
+    def __init__(self, window=10.0):
+        self.window_ns = int(window * 1e9)
+        size = (MAX_EXPONENT + 1) * SUB_BUCKETS
+        self.counts = array.array('Q', bytes(8 * size))
+        self.prev_counts = array.array('Q', bytes(8 * size))
+        self.window_start = monotonic_ns()
+        self.max_value = 0
+        self.prev_max_value = 0
+
+    @staticmethod
+    def bucket(value):
+        """Bucket index for value"""
+        if value < SUB_BUCKETS:
+            return value
+        exponent = value.bit_length() - SUB_BITS - 1
+        if exponent >= MAX_EXPONENT:
+            return (MAX_EXPONENT + 1) * SUB_BUCKETS - 1
+        return (exponent + 1) * SUB_BUCKETS + (value >> exponent) - SUB_BUCKETS
+
+    @staticmethod
+    def bucket_value(index):
+        """Highest value in bucket index"""
+        if index < SUB_BUCKETS:
+            return index
+        exponent = index // SUB_BUCKETS - 1
+        mantissa = index % SUB_BUCKETS + SUB_BUCKETS
+        return ((mantissa + 1) << exponent) - 1
+
+    def record(self, value, now):
+        """Add one value"""
+        if now - self.window_start > self.window_ns:
+            self.counts, self.prev_counts = self.prev_counts, self.counts
+            self.counts[:] = array.array('Q', bytes(8 * len(self.counts)))
+            self.prev_max_value = self.max_value
+            self.max_value = 0
+            self.window_start = now
+        if value < 0:
+            value = 0
+        self.counts[self.bucket(value)] += 1
+        if value > self.max_value:
+            self.max_value = value
+        return
+
+    def percentiles(self, fractions):
+        """Return values at fractions (0..1) of both windows"""
+        counts = [a + b for a, b in zip(self.counts, self.prev_counts)]
+        total = sum(counts)
+        results = []
+        for fraction in fractions:
+            if total == 0:
+                results.append(0)
+                continue
+            target = max(1, int(fraction * total + 0.5))
+            running = 0
+            for index, count in enumerate(counts):
+                running += count
+                if running >= target:
+                    results.append(self.bucket_value(index))
+                    break
+        return results
+
+    def summary(self):
+        """Return dict of count, p50, p99, p999 and max"""
+        p50, p99, p999 = self.percentiles((0.5, 0.99, 0.999))
+        return {'count': sum(self.counts) + sum(self.prev_counts),
+                'p50': p50, 'p99': p99, 'p999': p999,
+                'max': max(self.max_value, self.prev_max_value)}
+
+class DeviceLatency:
+    """Histograms and counters for one input device"""
+    def __init__(self, window):
+        self.histograms = [LatencyHistogram(window) for _ in STAGES]
+        self.events = 0
+        self.frames = 0
+        # Smallest (read time - js_event time) seen, in ms mod 2**32
+        self.kernel_offset = None
+
+class LatencyTracer:
+    """
+    Collects stage timestamps from JoystickReader, the mapper and
+    DS4GamepadSerial. Events are tracked per thread from read until the
+    setter runs, then queued until the next frame is written.
+    """
+    def __init__(self, window=10.0):
+        self.window = window
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.devices = {}
+        self.pending = []
+        self.frame_events = []
+        self.encode_ns = 0
+
+    def device(self, name):
+        """Return DeviceLatency for name"""
+        stats = self.devices.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.devices.setdefault(name, DeviceLatency(self.window))
+        return stats
+
+    def begin(self, name, kernel_ms):
+        """Input event read from device name"""
+        now = monotonic_ns()
+        stats = self.device(name)
+        stats.events += 1
+        delay = ((now // 1000000) - kernel_ms) & 0xFFFFFFFF
+        if stats.kernel_offset is None or delay < stats.kernel_offset:
+            stats.kernel_offset = delay
+        # stats, kernel stage us, read, dispatch, lock
+        self.local.event = [stats, (delay - stats.kernel_offset) * 1000, now, now, now]
+        return
+
+    def dispatched(self):
+        """Mapper is about to call a setter for the current event"""
+        event = getattr(self.local, 'event', None)
+        if event is not None:
+            event[3] = monotonic_ns()
+        return
+
+    def locked(self):
+        """Setter has the lock and updated the state. Call with the
+        DS4GamepadSerial thread_lock held."""
+        event = getattr(self.local, 'event', None)
+        if event is None:
+            return
+        self.local.event = None
+        event[4] = monotonic_ns()
+        if len(self.pending) >= MAX_PENDING:
+            del self.pending[0]
+        self.pending.append(event)
+        return
+
+    def encoded(self):
+        """Frame is ready to write. Call with thread_lock held."""
+        self.encode_ns = monotonic_ns()
+        self.frame_events, self.pending = self.pending, self.frame_events
+        self.pending.clear()
+        return
+
+    def skipped(self):
+        """Pending events did not change the frame. Call with thread_lock
+        held."""
+        self.pending.clear()
+        return
+
+    def written(self):
+        """ser_port.write() returned for the frame from encoded()"""
+        now = monotonic_ns()
+        encode_ns = self.encode_ns
+        counted = set()
+        for stats, kernel_us, read_ns, dispatch_ns, lock_ns in self.frame_events:
+            hist = stats.histograms
+            hist[0].record(kernel_us, now)
+            hist[1].record((dispatch_ns - read_ns) // 1000, now)
+            hist[2].record((lock_ns - dispatch_ns) // 1000, now)
+            hist[3].record((encode_ns - lock_ns) // 1000, now)
+            hist[4].record((now - encode_ns) // 1000, now)
+            hist[5].record(kernel_us + (now - read_ns) // 1000, now)
+            if id(stats) not in counted:
+                counted.add(id(stats))
+                stats.frames += 1
+        self.frame_events.clear()
+        return
+
+    def report(self):
+        """Return {device: {'events', 'frames', 'frames_per_event', stage:
+        summary}} with latencies in microseconds"""
+        result = {}
+        for name, stats in list(self.devices.items()):
+            entry = {'events': stats.events, 'frames': stats.frames,
+                     'frames_per_event':
+                         stats.frames / stats.events if stats.events else 0.0}
+            for stage, hist in zip(STAGES, stats.histograms):
+                entry[stage] = hist.summary()
+            result[name] = entry
+        return result
+
+    def format_report(self):
+        """Return report() as a text table"""
+        lines = []
+        for name, entry in self.report().items():
+            lines.append('%s events=%d frames=%d frames/event=%.3f' %
+                         (name, entry['events'], entry['frames'],
+                          entry['frames_per_event']))
+            lines.append('    %-8s %8s %8s %8s %8s %8s' %
+                         ('stage us', 'count', 'p50', 'p99', 'p999', 'max'))
+            for stage in STAGES:
+                summary = entry[stage]
+                lines.append('    %-8s %8d %8d %8d %8d %8d' %
+                             (stage, summary['count'], summary['p50'],
+                              summary['p99'], summary['p999'], summary['max']))
+        return '\n'.join(lines)
@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""
+Pre-encoded macros and combos.
+
+A Macro is a list of timed DS4GamepadSerial setter calls. compile() runs it
+once and keeps the frames it produces in one buffer with a table of
+deadlines, so playing it costs no encoding.
+
+    hadouken = Macro()
+    hadouken.dPad(DS4DPad.DOWN).wait(FRAME_S)
+    hadouken.dPad(DS4DPad.DOWN_RIGHT).wait(FRAME_S)
+    hadouken.dPad(DS4DPad.RIGHT).press(DS4Button.SQUARE).wait(FRAME_S)
+    hadouken.dPad(DS4DPad.CENTERED).release(DS4Button.SQUARE)
+    hadouken = hadouken.compile()
+
+MacroEngine plays compiled macros on top of live input. Each frame of a
+macro carries the bits the macro has set so far; the engine applies those
+bits as an overlay in DS4GamepadSerial and every other bit still comes from
+the live state. When a macro ends its overlay is removed. Several macros can
+play at once.
+
+    engine = MacroEngine(ds4g).start()
+    engine.play(hadouken)
+
+Without live input play_frames() writes the pre-encoded frames straight to
+the port, all the frames due at once in one write.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import heapq
+import array
+import threading
+from time import monotonic_ns
+from ds4gpadserial import DS4GamepadSerial, FRAME_LEN, OFF_LX, OFF_L2, \
+    OFF_R2, OFF_BUTTONS, AXES_STRUCT
+from ds4gschedule import Scheduler
+
+# One frame of a 60 frames per second game
+FRAME_S = 1.0 / 60.0
+
+# Setters a macro may call
+MACRO_SETTERS = ('press', 'release', 'releaseAll', 'buttons', 'dPad',
+                 'leftXAxis', 'leftYAxis', 'rightXAxis', 'rightYAxis',
+                 'allAxes', 'leftTrigger', 'rightTrigger',
+                 'dPadXAxis', 'dPadYAxis')
+
+# The dPad code, the low 4 bits of the first button byte, as frame bits
+DPAD_BITS = 0x0f << (8 * OFF_BUTTONS)
+
+# Wake up this long before a deadline and sleep the rest with the scheduler
+WAKE_NS = 2000000
+
+class CapturePort:
+    """Keep the last frame written"""
+    def __init__(self):
+        self.frame = b''
+
+    def write(self, data):
+        """Keep data"""
+        self.frame = bytes(data)
+        return len(data)
+
+def shadow(complement):
+    """DS4GamepadSerial writing to a CapturePort, from the neutral state or
+    with every field bit inverted"""
+    ds4g = DS4GamepadSerial()
+    ds4g.ser_port = CapturePort()
+    if complement:
+        # 0x80 -> 0x7f, dPad 8 -> 7, no buttons -> all, triggers 0 -> 255
+        AXES_STRUCT.pack_into(ds4g.report, OFF_LX, 0x7f7f7f7f)
+        ds4g.my_buttons = 0x3fff
+        ds4g.d_pad = 7
+        ds4g.dpad_x_axis = ds4g.dpad_y_axis = 127
+        ds4g.pack_buttons()
+        ds4g.report[OFF_L2] = ds4g.report[OFF_R2] = 255
+    return ds4g
+
+class Macro:
+    """Timed setter calls. The setter methods return the Macro so calls can
+    be chained."""
+    def __init__(self):
+        self.time = 0.0
+        # (time, setter name, args)
+        self.steps = []
+
+    def __getattr__(self, name):
+        if name not in MACRO_SETTERS:
+            raise AttributeError(name)
+        def step(*args):
+            self.steps.append((self.time, name, args))
+            return self
+        return step
+
+    def wait(self, seconds):
+        """Advance the time of the following calls"""
+        self.time += seconds
+        return self
+
+    def tap(self, button, hold=FRAME_S):
+        """Press button for hold seconds"""
+        self.press(button).wait(hold)
+        return self.release(button)
+
+    def compile(self):
+        """Run the steps and return a CompiledMacro"""
+        neutral = shadow(False)
+        inverted = shadow(True)
+        deadlines = array.array('q')
+        frames = bytearray()
+        keeps = []
+        values = []
+        index = 0
+        while index < len(self.steps):
+            # Calls at the same time make one frame
+            when = self.steps[index][0]
+            end = index
+            while end < len(self.steps) and self.steps[end][0] == when:
+                end += 1
+            for ds4g in (neutral, inverted):
+                with ds4g.batch():
+                    for _, name, args in self.steps[index:end]:
+                        getattr(ds4g, name)(*args)
+            # Bits the macro has set are the same from both starting states
+            frame = neutral.ser_port.frame
+            first = int.from_bytes(frame, 'little')
+            owned = ~(first ^ int.from_bytes(inverted.ser_port.frame, 'little')) \
+                & ((1 << (8 * FRAME_LEN)) - 1)
+            # The dPad is a code, not bits. dPadXAxis() and dPadYAxis()
+            # give different codes from the two starting states so a macro
+            # that sets any of it owns all of it, with the neutral code.
+            if owned & DPAD_BITS:
+                owned |= DPAD_BITS
+            deadlines.append(int(when * 1e9))
+            frames += frame
+            keeps.append(~owned & ((1 << (8 * FRAME_LEN)) - 1))
+            values.append(first & owned)
+            index = end
+        return CompiledMacro(deadlines, bytes(frames), keeps, values,
+                             int(self.time * 1e9))
+
+class CompiledMacro:
+    """
+    Pre-encoded macro. Frame n is frames[n * FRAME_LEN:(n + 1) * FRAME_LEN],
+    due deadlines[n] ns after the start. keeps[n] and values[n] are its
+    overlay for DS4GamepadSerial.set_overlay().
+    """
+    def __init__(self, deadlines, frames, keeps, values, duration_ns):
+        self.deadlines = deadlines
+        self.frames = frames
+        self.view = memoryview(frames)
+        self.keeps = keeps
+        self.values = values
+        self.duration_ns = max(duration_ns, deadlines[-1] if deadlines else 0)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def due(self, index, elapsed_ns):
+        """Index of the first frame from index not due at elapsed_ns"""
+        deadlines = self.deadlines
+        while index < len(deadlines) and deadlines[index] <= elapsed_ns:
+            index += 1
+        return index
+
+def play_frames(compiled, port, scheduler=None):
+    """Write the pre-encoded frames to port on time, without live input"""
+    scheduler = (scheduler if scheduler is not None else Scheduler()).start()
+    start_ns = scheduler.start_ns
+    index = 0
+    while index < len(compiled):
+        scheduler.until_ns(start_ns + compiled.deadlines[index])
+        end = compiled.due(index, monotonic_ns() - start_ns)
+        port.write(compiled.view[index * FRAME_LEN:end * FRAME_LEN])
+        index = end
+    return
+
+class MacroEngine:
+    """Play compiled macros over the live state of a DS4GamepadSerial"""
+    def __init__(self, ds4g, scheduler=None):
+        self.ds4g = ds4g
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # play id: [compiled, start_ns, next frame index, keep, value]
+        self.playing = {}
+        # (deadline ns, play id)
+        self.heap = []
+        self.next_id = 0
+
+    def start(self):
+        """Start the engine thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the engine thread and remove the overlay"""
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.ds4g.set_overlay(None, 0)
+        return
+
+    def play(self, compiled, delay=0.0):
+        """Start a compiled macro after delay seconds. Returns its id."""
+        start_ns = monotonic_ns() + int(delay * 1e9)
+        with self.lock:
+            play_id = self.next_id
+            self.next_id += 1
+            self.playing[play_id] = [compiled, start_ns, 0, None, 0]
+            heapq.heappush(self.heap, (start_ns + compiled.deadlines[0]
+                                       if len(compiled) else start_ns, play_id))
+        self.wakeup.set()
+        return play_id
+
+    def cancel(self, play_id):
+        """Stop a macro and give its fields back to the live state"""
+        with self.lock:
+            if self.playing.pop(play_id, None) is not None:
+                self.ds4g.set_overlay(*self.overlay())
+        return
+
+    def busy(self):
+        """True while macros are playing"""
+        with self.lock:
+            return bool(self.playing)
+
+    def advance(self, now_ns):
+        """Move every macro due at now_ns to its current frame. Returns True
+        if the overlay changed."""
+        changed = False
+        heap = self.heap
+        while heap and heap[0][0] <= now_ns:
+            _, play_id = heapq.heappop(heap)
+            entry = self.playing.get(play_id)
+            if entry is None:
+                # Cancelled
+                changed = True
+                continue
+            compiled, start_ns, index = entry[0], entry[1], entry[2]
+            end = compiled.due(index, now_ns - start_ns)
+            if end > index:
+                entry[2] = end
+                entry[3] = compiled.keeps[end - 1]
+                entry[4] = compiled.values[end - 1]
+                changed = True
+            if end < len(compiled):
+                heapq.heappush(heap, (start_ns + compiled.deadlines[end], play_id))
+            elif now_ns - start_ns >= compiled.duration_ns:
+                del self.playing[play_id]
+                changed = True
+            else:
+                heapq.heappush(heap, (start_ns + compiled.duration_ns, play_id))
+        return changed
+
+    def overlay(self):
+        """Combined (keep, value) of the playing macros. Later macros win
+        where they overlap."""
+        keep = None
+        value = 0
+        for entry in self.playing.values():
+            if entry[3] is None:
+                continue
+            if keep is None:
+                keep, value = entry[3], entry[4]
+            else:
+                value = (value & entry[3]) | entry[4]
+                keep &= entry[3]
+        return keep, value
+
+    def run(self):
+        """Engine thread"""
+        while not self.stop_event.is_set():
+            with self.lock:
+                deadline = self.heap[0][0] if self.heap else None
+            if deadline is None:
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            remaining = deadline - monotonic_ns()
+            if remaining > WAKE_NS:
+                # New macros and stop() wake this up early
+                if self.wakeup.wait((remaining - WAKE_NS) / 1e9):
+                    self.wakeup.clear()
+                    with self.lock:
+                        if self.advance(monotonic_ns()):
+                            self.ds4g.set_overlay(*self.overlay())
+                    continue
+            self.scheduler.until_ns(deadline)
+            with self.lock:
+                if self.advance(monotonic_ns()):
+                    self.ds4g.set_overlay(*self.overlay())
+        return
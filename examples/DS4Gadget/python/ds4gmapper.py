@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+"""
+Map joystick events to DS4Gadget using device profiles.
+
+A profile is a JSON file in the profiles directory describing how the axes
+and buttons of one input device map to the DS4. Profiles are compiled into a
+flat dispatch table so each event costs one list index and one call no
+matter how large the profile is.
+
+    {
+        "name": "Hori Mini4",
+        "match": {"usb": ["0f0d:00ee"],
+                  "names": ["HORI CO.,LTD. HORIPAD MINI4"]},
+        "axes": {
+            "0": "leftXAxis",
+            "1": {"target": "leftYAxis", "invert": true},
+            "2": {"low": "L3", "high": "R3"},
+            "6": "dPadXAxis"
+        },
+        "buttons": {
+            "0": "SQUARE",
+            "3": "DPAD_UP"
+        }
+    }
+
+"match" lists USB vendor:product IDs, looked up in a ProfileRegistry using
+the identity read from sysfs (see ds4gidentity.py), and device name
+substrings used for devices without a known ID.
+
+Axis targets are DS4GamepadSerial axis setter names (leftXAxis, leftYAxis,
+rightXAxis, rightYAxis, leftTrigger, rightTrigger, dPadXAxis, dPadYAxis) or a
+pair of DS4Button names pressed at the low and high ends of the axis.
+Button targets are DS4Button names or DPAD_UP, DPAD_DOWN, DPAD_LEFT and
+DPAD_RIGHT for gamepads with a 4 button direction pad.
+
+Axis entries may also set min, center, max, deadzone and curve. Each axis is
+converted with a 65536 entry lookup table, see ds4gtransfer.py. Without those
+settings "axis_offset" (default 32768) is added to the 16-bit js value before
+it is shifted down to 0..255 and "center_fix": true maps 127 to 128 for
+sticks that do not reach the exact center.
+
+"calibration": "kernel" bakes the kernel joystick correction (set with
+jscal) into the tables and switches it off in the kernel while the mapper
+runs. This needs the JoystickReader passed to DeviceMapper.
+
+"socd" sets how a 4 button direction pad resolves opposite directions held
+together: "neutral" (default), "up", "last" or "first", see ds4ghat.py.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import json
+from ds4gpadserial import DS4Button, DPadButton
+from jsreader import JS_EVENT_BUTTON, JS_EVENT_AXIS
+from ds4gtransfer import transfer_table, TABLE_OFFSET, JS_CORR_NONE
+from ds4gidentity import parse_usb_id
+from ds4ghat import ButtonHat, SOCD_MODES, SOCD_NEUTRAL, HAT_UP, HAT_RIGHT, \
+    HAT_DOWN, HAT_LEFT
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+
+AXIS_SETTERS = ('leftXAxis', 'leftYAxis', 'rightXAxis', 'rightYAxis',
+                'leftTrigger', 'rightTrigger', 'dPadXAxis', 'dPadYAxis')
+
+# Index is ((type & 0x03) << 8) | number
+TABLE_SIZE = 4 << 8
+
+# 4 button dPad, ds4ghat.ButtonHat bits
+DPAD_BITS = {DPadButton.UP: HAT_UP, DPadButton.RIGHT: HAT_RIGHT,
+             DPadButton.DOWN: HAT_DOWN, DPadButton.LEFT: HAT_LEFT}
+
+class ProfileError(ValueError):
+    """Profile cannot be compiled"""
+
+def load_profile(name_or_path):
+    """Load a profile by file name (without .json) or path"""
+    path = name_or_path
+    if not os.path.exists(path):
+        path = os.path.join(PROFILE_DIR, name_or_path + '.json')
+    with open(path) as profile_file:
+        profile = json.load(profile_file)
+    profile.setdefault('name', os.path.splitext(os.path.basename(path))[0])
+    return profile
+
+def load_profiles(directory=PROFILE_DIR):
+    """Load every profile in directory"""
+    return [load_profile(os.path.join(directory, fn))
+            for fn in sorted(os.listdir(directory)) if fn.endswith('.json')]
+
+def find_profile(profiles, js_name):
+    """Return the first profile with a match name in js_name or None"""
+    for profile in profiles:
+        for name in profile.get('match', {}).get('names', ()):
+            if name.upper() in js_name:
+                return profile
+    return None
+
+class ProfileRegistry:
+    """
+    Profiles indexed by USB (vendor, product). find() is one dict lookup no
+    matter how many profiles are registered, the name substring search is
+    only done for devices with an unknown ID.
+    """
+    def __init__(self, profiles=()):
+        self.profiles = []
+        self.by_usb = {}
+        for profile in profiles:
+            self.add(profile)
+
+    def add(self, profile):
+        """Register a profile. The first profile for an ID wins."""
+        self.profiles.append(profile)
+        for text in profile.get('match', {}).get('usb', ()):
+            try:
+                self.by_usb.setdefault(parse_usb_id(text), profile)
+            except ValueError:
+                raise ProfileError('bad usb id %s' % text) from None
+        return
+
+    def find(self, identity):
+        """Return the profile for a DeviceIdentity or None"""
+        if identity is None:
+            return None
+        profile = self.by_usb.get((identity.vendor, identity.product))
+        if profile is None:
+            profile = find_profile(self.profiles, identity.name.upper())
+        return profile
+
+def button_code(name):
+    """DS4Button or DPadButton for a profile button name"""
+    if name.startswith('DPAD_'):
+        try:
+            return DPadButton[name[5:]]
+        except KeyError:
+            raise ProfileError('unknown dPad button %s' % name) from None
+    try:
+        return DS4Button[name]
+    except KeyError:
+        raise ProfileError('unknown button %s' % name) from None
+
+class DeviceMapper:
+    """
+    Compiled profile for one input device and one DS4GamepadSerial.
+    table[((type & 0x03) << 8) | number] is a callable taking the event value or None.
+    """
+    def __init__(self, profile, ds4g, reader=None, tracer=None):
+        self.profile = profile
+        self.ds4g = ds4g
+        self.tracer = tracer
+        socd = profile.get('socd', SOCD_NEUTRAL)
+        if socd not in SOCD_MODES:
+            raise ProfileError('unknown socd %s' % socd)
+        self.hat = ButtonHat(socd)
+        self.table = [None] * TABLE_SIZE
+        # Kernel correction to restore when the mapper stops
+        self.saved_corr = None
+        corrs = None
+        if profile.get('calibration') == 'kernel':
+            if reader is None:
+                raise ProfileError('kernel calibration needs the joystick')
+            corrs = reader.get_corr()
+            reader.set_corr([(coef, prec, JS_CORR_NONE)
+                             for coef, prec, _ in corrs])
+            self.saved_corr = corrs
+        offset = profile.get('axis_offset', 32768)
+        center_fix = profile.get('center_fix', False)
+        for number, target in profile.get('axes', {}).items():
+            number = int(number)
+            if isinstance(target, str):
+                target = {'target': target}
+            if not 0.0 <= target.get('deadzone', 0.0) < 1.0:
+                raise ProfileError('axis %d deadzone %s must be >= 0 and < 1'
+                                   % (number, target['deadzone']))
+            lut = transfer_table(target, offset, center_fix,
+                                 corrs[number] if corrs and number < len(corrs) else None)
+            self.table[(JS_EVENT_AXIS << 8) | number] = \
+                self.axis_handler(target, lut)
+        for number, target in profile.get('buttons', {}).items():
+            self.table[(JS_EVENT_BUTTON << 8) | int(number)] = \
+                self.button_handler(button_code(target))
+
+    def axis_handler(self, target, lut):
+        """Compile one axis entry. lut maps js value + 32768 to 0..255."""
+        if 'low' in target or 'high' in target:
+            return self.axis_buttons_handler(
+                button_code(target['low']) if 'low' in target else None,
+                button_code(target['high']) if 'high' in target else None,
+                lut)
+        if target.get('target') not in AXIS_SETTERS:
+            raise ProfileError('unknown axis target %s' % target.get('target'))
+        setter = getattr(self.ds4g, target['target'])
+        def axis(value):
+            setter(lut[value + TABLE_OFFSET])
+        return axis
+
+    def axis_buttons_handler(self, low, high, lut):
+        """Press low or high when the axis reaches its end. For the twist
+        axis on flight sticks."""
+        press = self.ds4g.press
+        release = self.ds4g.release
+        pressed = [None]
+        def axis(value):
+            position = lut[value + TABLE_OFFSET]
+            if position == 0 and low is not None:
+                button = low
+            elif position == 255 and high is not None:
+                button = high
+            else:
+                button = None
+            if button != pressed[0]:
+                if pressed[0] is not None:
+                    release(pressed[0])
+                if button is not None:
+                    press(button)
+                pressed[0] = button
+        return axis
+
+    def button_handler(self, code):
+        """Compile one button entry"""
+        if code in DPAD_BITS:
+            bit = DPAD_BITS[code]
+            dpad = self.ds4g.dPad
+            resolve = self.hat.set
+            def dpad_button(value):
+                dpad(resolve(bit, value))
+            return dpad_button
+        press = self.ds4g.press
+        release = self.ds4g.release
+        def button(value):
+            if value:
+                press(code)
+            else:
+                release(code)
+        return button
+
+    def dispatch(self, event):
+        """Handle one (time, value, type, number) event"""
+        handler = self.table[((event[2] & 0x03) << 8) | event[3]]
+        if handler is not None:
+            handler(event[1])
+        return
+
+    def run(self, reader):
+        """Map events from a JoystickReader until it is unplugged"""
+        table = self.table
+        tracer = self.tracer
+        try:
+            for _, value, type, number in reader.events():
+                handler = table[((type & 0x03) << 8) | number]
+                if handler is not None:
+                    if tracer is not None:
+                        tracer.dispatched()
+                    handler(value)
+        except OSError:
+            reader.close()
+        finally:
+            if self.saved_corr is not None and not reader.jsdev.closed:
+                reader.set_corr(self.saved_corr)
+        return
+
+    def run_frames(self, reader):
+        """Map frames from an evreader.EventReader until it is unplugged.
+        Each frame is applied in one batch() so it is sent as one frame."""
+        table = self.table
+        tracer = self.tracer
+        batch = self.ds4g.batch
+        try:
+            for frame in reader.frames():
+                with batch():
+                    for _, value, type, number in frame:
+                        handler = table[((type & 0x03) << 8) | number]
+                        if handler is not None:
+                            if tracer is not None:
+                                tracer.dispatched()
+                            handler(value)
+        except OSError:
+            reader.close()
+        finally:
+            if self.saved_corr is not None and not reader.jsdev.closed:
+                reader.set_corr(self.saved_corr)
+        return
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+"""
+Merge several input sources into one DS4Gadget without a shared lock.
+
+Every source, for example one DeviceMapper per joystick thread, gets its own
+SourceSlot. A slot has the DS4GamepadSerial setters but never writes to the
+serial port: after each change, or after the outermost batch(), it publishes
+an immutable copy of its frame by replacing one reference. Only the thread
+of that source touches the slot so the setters do not lock.
+
+The writer thread of InputMerger wakes up when a slot publishes, combines
+the latest frame of every slot and is the only thread that writes to the
+DS4GamepadSerial. Source threads never wait for the UART or for each other.
+
+    merger = InputMerger(ds4g, axes='priority').start()
+    left = DeviceMapper(PROFILE_LEFT, merger.slot(), js_left)
+    right = DeviceMapper(PROFILE_RIGHT, merger.slot(), js_right)
+
+Policies, slots in the order slot() created them
+    buttons     pressed if pressed in any slot
+    dPad        first slot not centered
+    axes        'priority' first slot not centered, 'max' furthest from
+                center
+    triggers    the same with 0 as rest, 'max' is the largest
+
+The merger owns the DS4GamepadSerial; do not call its setters directly.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import threading
+from contextlib import nullcontext
+from ds4gpadserial import DS4GamepadSerial, DS4DPad, OFF_LX, OFF_RY, \
+    OFF_BUTTONS, OFF_L2, OFF_R2
+
+AXIS_REST = 128
+TRIGGER_REST = 0
+
+def merge_priority(values, rest):
+    """First value not at rest"""
+    for value in values:
+        if value != rest:
+            return value
+    return rest
+
+def merge_max(values, rest):
+    """Value furthest from rest"""
+    return max(values, key=lambda value: abs(value - rest))
+
+MERGE_POLICIES = {'priority': merge_priority, 'max': merge_max}
+
+class SourceSlot(DS4GamepadSerial):
+    """
+    Setters of one input source. Only one thread may call them. frame is
+    the latest published frame, replaced and never modified.
+    """
+    __slots__ = ('merger', 'frame')
+
+    def __init__(self, merger):
+        super().__init__()
+        # One thread per slot, nothing to lock against
+        self.thread_lock = nullcontext()
+        self.merger = merger
+        self.frame = bytes(self.report)
+
+    def update(self):
+        """Publish the frame and wake up the merger"""
+        if self.batch_depth:
+            self.batch_dirty = True
+            return
+        self.frame = bytes(self.report)
+        wakeup = self.merger.wakeup
+        if not wakeup.is_set():
+            wakeup.set()
+        return
+
+class InputMerger:
+    """Combine SourceSlots into one DS4GamepadSerial from a writer thread"""
+    def __init__(self, ds4g, axes='priority', triggers='max'):
+        self.ds4g = ds4g
+        self.merge_axis = MERGE_POLICIES[axes]
+        self.merge_trigger = MERGE_POLICIES[triggers]
+        self.slots = []
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        # Frames combined and frames written to ds4g
+        self.merges = 0
+        self.frames = 0
+
+    def slot(self):
+        """New source slot, lower priority than the slots before it"""
+        slot = SourceSlot(self)
+        # Replaced, not appended, so the writer can iterate without a lock
+        self.slots = self.slots + [slot]
+        return slot
+
+    def remove(self, slot):
+        """Drop the slot of a source that went away, its buttons and axes no
+        longer count"""
+        self.slots = [other for other in self.slots if other is not slot]
+        self.wakeup.set()
+        return
+
+    def start(self):
+        """Start the writer thread"""
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the writer thread"""
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        return
+
+    def combine(self, frames, out):
+        """Merge the slot frames into the report fields of out"""
+        buttons = 0
+        dpad = DS4DPad.CENTERED
+        for frame in frames:
+            bits = int.from_bytes(frame[OFF_BUTTONS:OFF_BUTTONS + 3], 'little')
+            buttons |= bits >> 4
+            if dpad == DS4DPad.CENTERED and (bits & 0x0f) < DS4DPad.CENTERED:
+                dpad = bits & 0x0f
+        bits = (buttons << 4) | dpad
+        out[OFF_BUTTONS:OFF_BUTTONS + 3] = bits.to_bytes(3, 'little')
+        merge_axis = self.merge_axis
+        for offset in range(OFF_LX, OFF_RY + 1):
+            out[offset] = merge_axis([frame[offset] for frame in frames],
+                                     AXIS_REST)
+        for offset in (OFF_L2, OFF_R2):
+            out[offset] = self.merge_trigger([frame[offset] for frame in frames],
+                                             TRIGGER_REST)
+        return
+
+    def merge(self):
+        """Combine the published frames and write them if they changed"""
+        frames = [slot.frame for slot in self.slots]
+        if not frames:
+            return
+        self.merges += 1
+        ds4g = self.ds4g
+        with ds4g.thread_lock:
+            merged = bytearray(ds4g.report)
+            self.combine(frames, merged)
+            if merged == ds4g.report:
+                return
+            ds4g.report[:] = merged
+            self.frames += 1
+            ds4g.update()
+        return
+
+    def run(self):
+        """Writer thread"""
+        wakeup = self.wakeup
+        while not self.stop_event.is_set():
+            wakeup.wait()
+            # Clear before reading the slots so a publish after this is not
+            # missed
+            wakeup.clear()
+            self.merge()
+        return
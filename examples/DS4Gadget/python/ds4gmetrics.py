@@ -0,0 +1,316 @@
+#!/usr/bin/python3
+"""
+Runtime metrics for a running mapper, in Prometheus text format on a Unix
+socket.
+
+MetricsRegistry reads the counters the library already keeps when it is
+scraped, so nothing is added to the event path. Register what the script
+uses and start the server.
+
+    metrics = MetricsRegistry()
+    metrics.add_gadget('main', ds4g, governor)
+    metrics.add_input('/dev/input/js0', jsdev)
+    metrics.add_tracer(tracer)          # lock wait and write time
+    metrics.serve()
+    ...
+    metrics.inc('ds4g_reconnects_total', {'device': path})
+
+Metrics
+    ds4g_input_events_total             events read per input device
+    ds4g_frames_sent_total              frames written per gadget
+    ds4g_frames_coalesced_total         states replaced before they were
+                                        sent (governor or asyncio client)
+    ds4g_coalesce_ratio                 coalesced / (sent + coalesced)
+    ds4g_lock_wait_seconds              setter waiting for thread_lock, p50,
+                                        p99 and max, needs a LatencyTracer
+    ds4g_write_seconds                  ser_port.write() time, the same
+    ds4g_reconnects_total               counted by the script
+    process_cpu_seconds_total           user + system CPU of the process
+
+ds4g-stats shows them live, with the rate per second of every counter.
+
+    $ ./ds4g-stats
+    $ curl --unix-socket /tmp/ds4g-metrics.sock http://localhost/metrics
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+import time
+import socket
+import threading
+import socketserver
+
+METRICS_SOCKET = '/tmp/ds4g-metrics.sock'
+
+# name: (type, help)
+METRICS = {
+    'ds4g_input_events_total':
+        ('counter', 'Events read from the input device'),
+    'ds4g_frames_sent_total':
+        ('counter', 'Frames written to the gadget serial port'),
+    'ds4g_frames_coalesced_total':
+        ('counter', 'States replaced by a newer state before they were sent'),
+    'ds4g_frames_dropped_total':
+        ('counter', 'Held states not sent because the gadget had them'),
+    'ds4g_coalesce_ratio':
+        ('gauge', 'Coalesced states over sent and coalesced'),
+    'ds4g_lock_wait_seconds':
+        ('summary', 'Setter call to thread_lock acquired'),
+    'ds4g_write_seconds':
+        ('summary', 'Frame ready to ser_port.write() returning'),
+    'ds4g_reconnects_total':
+        ('counter', 'Input devices attached again'),
+    'process_cpu_seconds_total':
+        ('counter', 'User and system CPU time of the process'),
+}
+
+# LatencyTracer stages exported and the quantiles of their summaries
+TRACER_STAGES = (('lock', 'ds4g_lock_wait_seconds'),
+                 ('write', 'ds4g_write_seconds'))
+QUANTILES = (('p50', '0.5'), ('p99', '0.99'), ('max', '1'))
+
+def format_labels(labels):
+    """'{a="1",b="2"}' or '' for no labels"""
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\')
+                                           .replace('"', '\\"'))
+                             for key, value in labels.items())
+
+def parse_text(text):
+    """{(name, labels text): value} from Prometheus text format"""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, _, value = line.rpartition(' ')
+        brace = series.find('{')
+        name = series if brace < 0 else series[:brace]
+        samples[(name, series[len(name):])] = float(value)
+    return samples
+
+class MetricsRegistry:
+    """Counters of registered gadgets, inputs and tracers, read when
+    scraped"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels text): value, for inc()
+        self.counters = {}
+        # Callables returning a list of (name, labels dict, value)
+        self.collectors = [self.collect_process, self.collect_inputs]
+        # device name: [reader, events of the readers it replaced]
+        self.inputs = {}
+        self.server = None
+
+    def inc(self, name, labels=None, amount=1):
+        """Add amount to a counter kept by the registry"""
+        key = (name, format_labels(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        return
+
+    def add_collector(self, collector):
+        """Call collector() at every scrape"""
+        self.collectors.append(collector)
+        return
+
+    def add_gadget(self, name, ds4g, governor=None):
+        """Frames of a DS4GamepadSerial, its OutputGovernor or the
+        AsyncDS4GamepadSerial coalescing"""
+        labels = {'gadget': name}
+        def collect():
+            sent = ds4g.frames_sent
+            dropped = None
+            if governor is not None:
+                coalesced = governor.frames_coalesced
+                dropped = governor.frames_dropped
+            else:
+                coalesced = getattr(ds4g, 'frames_superseded', 0)
+            samples = [('ds4g_frames_sent_total', labels, sent),
+                       ('ds4g_frames_coalesced_total', labels, coalesced),
+                       ('ds4g_coalesce_ratio', labels,
+                        coalesced / (sent + coalesced) if sent + coalesced
+                        else 0.0)]
+            if dropped is not None:
+                samples.append(('ds4g_frames_dropped_total', labels, dropped))
+            return samples
+        self.add_collector(collect)
+        return
+
+    def add_input(self, name, reader):
+        """Events read by a JoystickReader or EventReader. A new reader for
+        the same name, after a reconnect, carries on the count."""
+        with self.lock:
+            entry = self.inputs.get(name)
+            if entry is None:
+                self.inputs[name] = [reader, 0]
+            else:
+                entry[1] += entry[0].events_read
+                entry[0] = reader
+        return
+
+    def collect_inputs(self):
+        """Events of every input device"""
+        with self.lock:
+            entries = [(name, entry[0].events_read + entry[1])
+                       for name, entry in self.inputs.items()]
+        return [('ds4g_input_events_total', {'device': name}, events)
+                for name, events in entries]
+
+    def add_tracer(self, tracer):
+        """Lock wait and write time per device from a LatencyTracer"""
+        def collect():
+            samples = []
+            for device, entry in tracer.report().items():
+                for stage, name in TRACER_STAGES:
+                    for key, quantile in QUANTILES:
+                        samples.append((name, {'device': device,
+                                               'quantile': quantile},
+                                        entry[stage][key] / 1e6))
+            return samples
+        self.add_collector(collect)
+        return
+
+    @staticmethod
+    def collect_process():
+        """CPU time of this process"""
+        times = os.times()
+        return [('process_cpu_seconds_total', None, times.user + times.system)]
+
+    def collect(self):
+        """{(name, labels text): value} of every metric"""
+        samples = {}
+        for collector in list(self.collectors):
+            for name, labels, value in collector():
+                samples[(name, format_labels(labels))] = value
+        with self.lock:
+            samples.update(self.counters)
+        return samples
+
+    def text(self):
+        """Every metric in Prometheus text exposition format"""
+        by_name = {}
+        for (name, labels), value in self.collect().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text = METRICS.get(name, ('untyped', name))
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for labels, value in sorted(by_name[name]):
+                lines.append('%s%s %s' % (name, labels, repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, path=METRICS_SOCKET):
+        """Serve text() on a Unix socket from a daemon thread. A client
+        sending an HTTP request gets an HTTP response."""
+        registry = self
+        class Handler(socketserver.BaseRequestHandler):
+            """One scrape"""
+            def handle(self):
+                self.request.settimeout(0.2)
+                try:
+                    request = self.request.recv(1024)
+                except socket.timeout:
+                    request = b''
+                body = registry.text().encode()
+                if request.startswith(b'GET'):
+                    body = (b'HTTP/1.0 200 OK\r\n'
+                            b'Content-Type: text/plain; version=0.0.4\r\n'
+                            b'Content-Length: %d\r\n\r\n' % len(body)) + body
+                self.request.sendall(body)
+        if os.path.exists(path):
+            os.unlink(path)
+        self.server = socketserver.ThreadingUnixStreamServer(path, Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self):
+        """Stop serving"""
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            os.unlink(self.server.server_address)
+            self.server = None
+        return
+
+def scrape(path=METRICS_SOCKET):
+    """Metrics text from a running registry"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(path)
+        client.sendall(b'METRICS\n')
+        chunks = []
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode()
+
+def main():
+    """ds4g-stats, show the metrics of a running mapper live"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='ds4g-stats', description='Show the metrics of a running mapper')
+    parser.add_argument('--socket', default=METRICS_SOCKET)
+    parser.add_argument('--interval', type=float, default=1.0)
+    parser.add_argument('--once', action='store_true',
+                        help='print the metrics text once and exit')
+    args = parser.parse_args()
+
+    if args.once:
+        sys.stdout.write(scrape(args.socket))
+        return 0
+    previous = None
+    previous_time = 0.0
+    try:
+        while True:
+            try:
+                samples = parse_text(scrape(args.socket))
+            except OSError as err:
+                print('%s: %s' % (args.socket, err))
+                return 1
+            now = time.monotonic()
+            lines = ['%-60s %14s %12s' % ('metric', 'value', 'per second')]
+            for key in sorted(samples):
+                name, labels = key
+                rate = ''
+                if previous is not None and name.endswith('_total') \
+                        and key in previous:
+                    rate = '%.1f' % ((samples[key] - previous[key])
+                                     / (now - previous_time))
+                lines.append('%-60s %14.6g %12s' % (name + labels,
+                                                    samples[key], rate))
+            # Clear the screen then draw
+            sys.stdout.write('\x1b[H\x1b[2J' + '\n'.join(lines) + '\n')
+            sys.stdout.flush()
+            previous, previous_time = samples, now
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
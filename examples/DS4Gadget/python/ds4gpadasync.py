@@ -0,0 +1,205 @@
+#!/usr/bin/python3
+"""
+asyncio interface to Dual Shock 4 Gamepad Gadget (DS4Gadget.ino) via serial
+port.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import asyncio
+from ds4gpadserial import DS4GamepadSerial, DS4DPad, FRAME_LEN, EXT_FRAME_LEN
+from ds4gtelemetry import TELEMETRY_READ_SIZE
+
+class AsyncDS4GamepadSerial(DS4GamepadSerial):
+    """
+    Dual Shock 4 Gamepad Serial Interface for asyncio.
+
+    Same setters and frame format as DS4GamepadSerial but the serial port is
+    written non-blocking from the event loop. The setters never block. When
+    the UART output buffer is full the frame in progress is finished when the
+    port becomes writable and then only the newest state is sent; states in
+    between are dropped.
+
+    begin() must be called from the thread running the event loop.
+    """
+    __slots__ = ('loop', 'fd', 'out_buf', 'out_view', 'out_pos', 'out_len',
+                 'pending',
+                 'writer_active', 'waiters', 'frames_superseded')
+
+    def __init__(self, loop=None, delta=False):
+        super().__init__(delta=delta)
+        self.loop = loop
+        self.fd = -1
+        self.out_buf = bytearray(EXT_FRAME_LEN)
+        self.out_view = memoryview(self.out_buf)
+        # out_pos < out_len means part of out_buf is not written yet
+        self.out_pos = FRAME_LEN
+        self.out_len = FRAME_LEN
+        self.pending = False
+        self.writer_active = False
+        self.waiters = []
+        self.frames_sent = 0
+        self.frames_superseded = 0
+
+    def begin(self, serial_port):
+        """Start DS4Gamepad. serial_port is a pyserial Serial or a file
+        descriptor."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+        if isinstance(serial_port, int):
+            self.fd = serial_port
+        else:
+            self.fd = serial_port.fileno()
+        os.set_blocking(self.fd, False)
+        super().begin(serial_port)
+        return
+
+    def end(self):
+        """End DS4Gamepad"""
+        if self.writer_active:
+            self.loop.remove_writer(self.fd)
+            self.writer_active = False
+        self.wake_waiters()
+        if isinstance(self.ser_port, int):
+            os.close(self.ser_port)
+        else:
+            self.ser_port.close()
+        return
+
+    def write(self):
+        """Send DS4Gamepad state. Call with thread_lock held."""
+        if self.out_pos < self.out_len:
+            # UART busy. Latest state wins when it drains.
+            if self.pending:
+                self.frames_superseded += 1
+            self.pending = True
+            return
+        self.send_frame()
+        return
+
+    def send_frame(self):
+        """Start sending the current state"""
+        frame = self.encode()
+        self.out_len = len(frame)
+        self.out_buf[:self.out_len] = frame
+        self.out_pos = 0
+        if self.tracer is not None:
+            self.tracer.encoded()
+        self.write_some()
+        if self.out_pos < self.out_len and not self.writer_active:
+            self.loop.add_writer(self.fd, self.on_writable)
+            self.writer_active = True
+        return
+
+    def write_some(self):
+        """Write as much of out_buf as the UART will take"""
+        try:
+            self.out_pos += os.write(self.fd, self.out_view[self.out_pos:self.out_len])
+        except BlockingIOError:
+            return
+        if self.out_pos == self.out_len:
+            self.frames_sent += 1
+            if self.tracer is not None:
+                self.tracer.written()
+        return
+
+    def on_writable(self):
+        """Event loop callback when the serial port can take more bytes"""
+        with self.thread_lock:
+            if self.out_pos < self.out_len:
+                self.write_some()
+                if self.out_pos < self.out_len:
+                    return
+            if self.pending:
+                self.pending = False
+                if self.last_frame != self.state() or self.ext_dirty:
+                    self.send_frame()
+                    if self.out_pos < self.out_len:
+                        return
+            self.loop.remove_writer(self.fd)
+            self.writer_active = False
+            self.wake_waiters()
+        return
+
+    def wake_waiters(self):
+        """Complete flush() futures"""
+        waiters = self.waiters
+        self.waiters = []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        return
+
+    async def flush(self):
+        """Wait until the newest state has been handed to the UART"""
+        with self.thread_lock:
+            if self.out_pos == self.out_len and not self.pending:
+                return
+            waiter = self.loop.create_future()
+            self.waiters.append(waiter)
+        await waiter
+        return
+
+    def read_telemetry(self):
+        """Read the telemetry frames the gadget sent without blocking.
+        Returns the newest ds4gtelemetry.Telemetry or None."""
+        try:
+            data = os.read(self.fd, TELEMETRY_READ_SIZE)
+        except BlockingIOError:
+            return None
+        frames = self.telemetry.feed(data)
+        return frames[-1] if frames else None
+
+async def amain():
+    """ test AsyncDS4GamepadSerial class """
+    import sys
+    import serial
+
+    ds4g = AsyncDS4GamepadSerial()
+    try:
+        ds4g.begin(serial.Serial('/dev/ttyAMA0', 2000000, timeout=0))
+    except:
+        print('Cannot open /dev/ttyAMA0')
+        sys.exit(1)
+
+    print('Serial port open')
+    while True:
+        # Press and hold every button 0..13
+        for button in range(0, 14):
+            ds4g.press(button)
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(1)
+        # Release all buttons
+        ds4g.releaseAll()
+        await ds4g.flush()
+        await asyncio.sleep(1)
+        # Move directional pad in all directions
+        for direction in range(0, 8):
+            ds4g.dPad(direction)
+            await asyncio.sleep(0.5)
+        # Move directional pad to center
+        ds4g.dPad(DS4DPad.CENTERED)
+        await ds4g.flush()
+
+if __name__ == "__main__":
+    asyncio.run(amain())
@@ -24,10 +24,17 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
 OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
-from struct import pack
-import array
+from struct import Struct
 import threading
+from contextlib import contextmanager
+import time
 from enum import IntEnum
+from ds4gtelemetry import TelemetryParser, TELEMETRY_READ_SIZE
+from ds4ghat import AXIS_HAT, HAT_X, HAT_Y
+
+# Suggested rate_hz for DS4GamepadSerial. The gadget sends a USB report
+# every 3 ms so sending faster than this gains nothing.
+DEFAULT_RATE_HZ = 250
 
 # Direction pad names
 class DS4DPad(IntEnum):
@@ -68,25 +75,184 @@ class DPadButton(IntEnum):
     LEFT = 252
     RIGHT = 251
 
+# Byte offsets of the fields in the serial frame
+#   STX, length, type, then the first 10 bytes of HID_DS4GamepadReport_Data_t,
+#   then ETX
+FRAME_LEN = 14
+OFF_LX = 4
+OFF_LY = 5
+OFF_RX = 6
+OFF_RY = 7
+OFF_BUTTONS = 8     # dPad:4, button1:4, button2, button3:2
+OFF_L2 = 11
+OFF_R2 = 12
+
+# dPad in bits 0..3 then buttons 0..13 in bits 4..17, spread over 3 bytes
+BUTTONS_STRUCT = Struct('<HB')
+# allAxes() uint32_t is LX, LY, RX, RY in frame order
+AXES_STRUCT = Struct('<I')
+
+# Delta frame, type 4
+#   STX, length, 4, field mask, the changed fields in mask bit order, ETX
+# Mask bit n is frame byte OFF_LX + n (LX, LY, RX, RY, the 3 button bytes,
+# L2). Bit 7 covers both triggers, L2 then R2. A delta only makes sense if
+# the gadget has every frame before it so a full frame is sent every
+# DELTA_FULL_EVERY frames in case one was lost.
+FRAME_REPORT = 3
+FRAME_DELTA = 4
+DELTA_OFFSETS = (OFF_LX, OFF_LY, OFF_RX, OFF_RY,
+                 OFF_BUTTONS, OFF_BUTTONS + 1, OFF_BUTTONS + 2, OFF_L2)
+DELTA_TRIGGERS = 0x80
+DELTA_FULL_EVERY = 64
+
+# Extended frame, type 6, for the rest of the 64 byte report
+#   STX, length, 6, region mask, the changed regions in mask bit order, ETX
+# Region n is EXT_REGIONS[n], (offset, size) in HID_DS4GamepadReport_Data_t.
+FRAME_EXTENDED = 6
+REPORT_SIZE = 64
+REPORT_BATTERY = 12
+REPORT_GYRO = 13
+REPORT_ACCEL = 19
+REPORT_TOUCH = 33   # packet count, packet timestamp, 2 x 4 byte finger
+EXT_REGIONS = ((1, 4),              # sticks
+               (5, 3),              # dPad and buttons
+               (8, 2),              # triggers
+               (REPORT_BATTERY, 1),
+               (REPORT_GYRO, 6),
+               (REPORT_ACCEL, 6),
+               (REPORT_TOUCH, 10))
+EXT_FRAME_LEN = 5 + sum(size for _, size in EXT_REGIONS)
+EXT_FULL_MASK = (1 << len(EXT_REGIONS)) - 1
+# gyro() and accel() X, Y, Z
+MOTION_STRUCT = Struct('<3h')
+# Touch finger, bit 7 set when not touching, 7 bit touch id, then X and Y
+# 12 bits each
+TOUCH_NONE = 0x80
+
+def encode_regions(report, previous, out):
+    """
+    Encode the regions of report, a 64 byte report, that differ from
+    previous as an extended frame in out, a bytearray of at least
+    EXT_FRAME_LEN bytes. previous None encodes every region. Returns the
+    frame length.
+    """
+    mask = 0
+    length = 4
+    for bit, (offset, size) in enumerate(EXT_REGIONS):
+        end = offset + size
+        if previous is None or report[offset:end] != previous[offset:end]:
+            mask |= 1 << bit
+            out[length:length + size] = report[offset:end]
+            length += size
+    out[0] = 2  # STX
+    out[1] = length - 2
+    out[2] = FRAME_EXTENDED
+    out[3] = mask
+    out[length] = 3 # ETX
+    return length + 1
+
+def encode_delta(frame, previous, out):
+    """
+    Encode the changes from frame previous to frame as a delta frame in
+    out, a bytearray of at least FRAME_LEN bytes. Returns the delta frame
+    length or 0 if it would not be shorter than a full frame.
+    """
+    mask = 0
+    length = 4
+    for bit, offset in enumerate(DELTA_OFFSETS):
+        if frame[offset] != previous[offset]:
+            mask |= 1 << bit
+            out[length] = frame[offset]
+            length += 1
+    if frame[OFF_R2] != previous[OFF_R2]:
+        if not mask & DELTA_TRIGGERS:
+            mask |= DELTA_TRIGGERS
+            out[length] = frame[OFF_L2]
+            length += 1
+        out[length] = frame[OFF_R2]
+        length += 1
+    elif mask & DELTA_TRIGGERS:
+        out[length] = frame[OFF_R2]
+        length += 1
+    if length + 1 >= FRAME_LEN:
+        return 0
+    out[0] = 2  # STX
+    out[1] = length - 2
+    out[2] = FRAME_DELTA
+    out[3] = mask
+    out[length] = 3 # ETX
+    return length + 1
+
 class DS4GamepadSerial:
     """Dual Shock 4 Gamepad Serial Interface"""
     # pylint: disable=too-many-instance-attributes
-    compass_dir_x = array.array('B', \
-            [0, 0, 128, 255, 255, 255, 128, 0, \
-            128, 128, 128, 128, 128, 128, 128, 128, 128])
-    compass_dir_y = array.array('B', \
-            [128, 255, 255, 255, 128, 0, 0, 0,\
-            128, 128, 128, 128, 128, 128, 128, 128, 128])
-
-    def __init__(self):
-        self.thread_lock = threading.Lock()
+    __slots__ = ('thread_lock', 'rate_hz', 'dirty', 'report',
+                 'last_frame', 'sender', 'sender_stop', 'ser_port',
+                 'batch_depth', 'batch_dirty', 'tracer',
+                 'delta', 'delta_frame', 'delta_view', 'delta_count',
+                 'frames_sent', 'telemetry',
+                 'ext_report', 'ext_last', 'ext_frame', 'ext_view', 'ext_dirty',
+                 'ext_count',
+                 'overlay_keep', 'overlay_value', 'merged', 'governor',
+                 'my_buttons', 'd_pad', 'dpad_x_axis', 'dpad_y_axis')
+
+
+    def __init__(self, rate_hz=0, delta=False):
+        """
+        rate_hz = 0 sends a frame from every setter call. rate_hz > 0 makes
+        the setters only update the state and a sender thread sends at most
+        rate_hz frames per second, skipping frames identical to the last one
+        sent. See DEFAULT_RATE_HZ.
+
+        delta = True sends delta frames with only the fields that changed.
+        The gadget firmware must support frame type 4.
+        """
+        # Reentrant so setters can be called inside batch()
+        self.thread_lock = threading.RLock()
+        self.rate_hz = rate_hz
+        self.dirty = False
+        self.batch_depth = 0
+        self.batch_dirty = False
+        # Optional ds4glatency.LatencyTracer
+        self.tracer = None
+        # The state lives in the frame. Setters patch it in place.
+        self.report = bytearray((
+            2,  # STX
+            11, # data len + 1
+            3,  # report type
+            1,  # report ID
+            128, 128, 128, 128, DS4DPad.CENTERED, 0, 0, 0, 0,
+            3)) # ETX
+        self.last_frame = bytearray(FRAME_LEN)
+        self.delta = delta
+        self.delta_frame = bytearray(FRAME_LEN)
+        self.delta_view = memoryview(self.delta_frame)
+        # Frames since the last full frame
+        self.delta_count = DELTA_FULL_EVERY
+        # Motion, battery and touch live in a whole report. Only sent in
+        # extended frames once one of their setters has been called.
+        self.ext_report = bytearray(REPORT_SIZE)
+        self.ext_report[REPORT_TOUCH] = 1
+        self.ext_report[REPORT_TOUCH + 2] = TOUCH_NONE
+        self.ext_report[REPORT_TOUCH + 6] = TOUCH_NONE
+        self.ext_last = bytearray(REPORT_SIZE)
+        self.ext_frame = bytearray(EXT_FRAME_LEN)
+        self.ext_view = memoryview(self.ext_frame)
+        self.ext_dirty = False
+        # Extended frames since the last one with every region
+        self.ext_count = DELTA_FULL_EVERY
+        # Macro overlay, see set_overlay()
+        self.overlay_keep = None
+        self.overlay_value = 0
+        self.merged = bytearray(FRAME_LEN)
+        # Optional ds4ggovernor.OutputGovernor
+        self.governor = None
+        # Compare with the gadget telemetry frames_accepted
+        self.frames_sent = 0
+        self.telemetry = TelemetryParser()
+        self.sender = None
+        self.sender_stop = threading.Event()
         self.ser_port = 0
-        self.left_x_axis = 128
-        self.left_y_axis = 128
-        self.right_x_axis = 128
-        self.right_y_axis = 128
-        self.left_trigger = 0
-        self.right_trigger = 0
         self.my_buttons = 0
         self.d_pad = DS4DPad.CENTERED
         self.dpad_x_axis = 128
@@ -96,140 +262,351 @@ class DS4GamepadSerial:
         """Start DS4Gamepad"""
         with self.thread_lock:
             self.ser_port = serial_port
-            self.left_x_axis = 128
-            self.left_y_axis = 128
-            self.right_x_axis = 128
-            self.right_y_axis = 128
+            # The first frame is a full frame
+            self.delta_count = DELTA_FULL_EVERY
+            self.ext_count = DELTA_FULL_EVERY
+            AXES_STRUCT.pack_into(self.report, OFF_LX, 0x80808080)
             self.my_buttons = 0
-            self.d_pad = 15
+            self.d_pad = DS4DPad.CENTERED
             self.dpad_x_axis = 128
             self.dpad_y_axis = 128
+            self.pack_buttons()
             self.write()
+        if self.rate_hz:
+            self.sender_stop.clear()
+            self.sender = threading.Thread(target=self.send_loop, daemon=True)
+            self.sender.start()
         return
 
     def end(self):
         """End DS4Gamepad"""
+        if self.sender is not None:
+            self.sender_stop.set()
+            self.sender.join()
+            self.sender = None
         self.ser_port.close()
         return
 
+    def pack_buttons(self):
+        """Copy my_buttons and d_pad into the frame"""
+        bits = (self.my_buttons << 4) | self.d_pad
+        BUTTONS_STRUCT.pack_into(self.report, OFF_BUTTONS, bits & 0xffff, bits >> 16)
+        return
+
+    def state(self):
+        """The frame state to send, the report with the macro overlay
+        applied. Call with thread_lock held."""
+        if self.overlay_keep is None:
+            return self.report
+        merged = (int.from_bytes(self.report, 'little') & self.overlay_keep) \
+            | self.overlay_value
+        self.merged[:] = merged.to_bytes(FRAME_LEN, 'little')
+        return self.merged
+
+    def set_overlay(self, keep, value):
+        """
+        Send the bits set in keep, an int over the frame bytes in little
+        endian order, from the report and the rest from value. keep None
+        removes the overlay. Used by ds4gmacro to merge macros with the
+        live state without touching it.
+        """
+        with self.thread_lock:
+            self.overlay_keep = keep
+            self.overlay_value = value
+            self.update()
+        return
+
+    def encode(self):
+        """Copy the state to last_frame and return the frame to send, a full
+        delta or extended frame. Call with thread_lock held."""
+        if self.ext_dirty:
+            return self.encode_ext()
+        report = self.state()
+        if self.delta:
+            self.delta_count += 1
+            if self.delta_count < DELTA_FULL_EVERY:
+                length = encode_delta(report, self.last_frame,
+                                      self.delta_frame)
+                if length:
+                    self.sent_report(report)
+                    return self.delta_view[:length]
+            self.delta_count = 0
+        self.sent_report(report)
+        return self.last_frame
+
+    def sent_report(self, report):
+        """Record the frame state the gadget has after a full or delta
+        frame. The sticks, buttons and triggers of ext_last follow it so
+        the next extended frame compares them with what the gadget has."""
+        self.last_frame[:] = report
+        self.ext_last[0:10] = report[3:13]
+        return
+
+    def encode_ext(self):
+        """Extended frame with the regions that differ from what the gadget
+        has, every region once every DELTA_FULL_EVERY extended frames"""
+        self.ext_dirty = False
+        ext = self.ext_report
+        report = self.state()
+        ext[0:10] = report[3:13]
+        self.ext_count += 1
+        previous = self.ext_last
+        if self.ext_count >= DELTA_FULL_EVERY:
+            self.ext_count = 0
+            previous = None
+        length = encode_regions(ext, previous, self.ext_frame)
+        self.ext_last[:] = ext
+        self.last_frame[:] = report
+        return self.ext_view[:length]
+
     def write(self):
         """Send DS4Gamepad state"""
-        self.ser_port.write(
-            pack('<BBBBBBBBBBBBBB',
-                 2,  # STX
-                 11, # data len + 1
-                 3,  # report type
-                 1,  # report ID
-                 self.left_x_axis, self.left_y_axis,
-                 self.right_x_axis, self.right_y_axis,
-                 ((self.my_buttons & 0x0f) << 4) | self.d_pad,
-                 (self.my_buttons >> 4) & 0xff,
-                 self.my_buttons >> 12,
-                 self.left_trigger,
-                 self.right_trigger,
-                 3)) # ETX
+        governor = self.governor
+        if governor is not None and not governor.admit():
+            return
+        frame = self.encode()
+        self.frames_sent += 1
+        if governor is not None:
+            governor.sent(len(frame))
+        if self.tracer is not None:
+            self.tracer.encoded()
+            self.ser_port.write(frame)
+            self.tracer.written()
+        else:
+            self.ser_port.write(frame)
+        return
+
+    def update(self):
+        """Send DS4Gamepad state now or leave it for the sender thread.
+        Call with thread_lock held."""
+        if self.tracer is not None:
+            self.tracer.locked()
+        if self.batch_depth:
+            self.batch_dirty = True
+        elif self.rate_hz:
+            self.dirty = True
+        else:
+            self.write()
+        return
+
+    def read_telemetry(self):
+        """
+        Read the telemetry frames the gadget sent without blocking. Returns
+        the newest ds4gtelemetry.Telemetry or None if none arrived. The
+        serial port must be opened with timeout=0.
+        """
+        frames = self.telemetry.feed(self.ser_port.read(TELEMETRY_READ_SIZE))
+        return frames[-1] if frames else None
+
+    @contextmanager
+    def batch(self):
+        """
+        Apply several changes as one frame.
+
+            with ds4g.batch():
+                ds4g.leftXAxis(x)
+                ds4g.leftYAxis(y)
+                ds4g.press(DS4Button.CROSS)
+
+        The lock is held for the whole block so no other thread sees the
+        intermediate states. Batches may be nested; the frame is sent when
+        the outermost batch exits and only if something changed.
+        """
+        with self.thread_lock:
+            self.batch_depth += 1
+            try:
+                yield self
+            finally:
+                self.batch_depth -= 1
+                if self.batch_depth == 0 and self.batch_dirty:
+                    self.batch_dirty = False
+                    self.update()
+
+    def send_loop(self):
+        """Sender thread for rate_hz > 0. Sends at most one frame per tick."""
+        period = 1.0 / self.rate_hz
+        deadline = time.monotonic()
+        last_frame = self.last_frame
+        while True:
+            # Absolute deadlines so the tick does not drift
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay < 0:
+                # Fell behind, skip the missed ticks
+                deadline -= delay
+                delay = 0
+            if self.sender_stop.wait(delay):
+                break
+            with self.thread_lock:
+                governor = self.governor
+                # A state held by the governor is retried every tick
+                held = governor is not None and governor.held
+                new_state = self.dirty
+                if not new_state and not held:
+                    continue
+                self.dirty = False
+                # Read every tick, a tracer may be attached after begin()
+                tracer = self.tracer
+                if last_frame == self.state() and not self.ext_dirty:
+                    if held:
+                        if new_state:
+                            # The held state was replaced by this one
+                            governor.frames_coalesced += 1
+                        governor.drop()
+                    if new_state and tracer is not None:
+                        tracer.skipped()
+                    continue
+                if governor is not None and not governor.admit(new_state):
+                    # Port backed up, the governor holds the newest state
+                    continue
+                frame = self.encode()
+                self.frames_sent += 1
+                if governor is not None:
+                    governor.sent(len(frame))
+                if tracer is not None:
+                    tracer.encoded()
+            # Write outside the lock so setters never wait on the UART. Only
+            # this thread changes last_frame and delta_frame.
+            self.ser_port.write(frame)
+            if tracer is not None:
+                tracer.written()
         return
 
     def press(self, button_number):
         """Press button 0..13"""
         with self.thread_lock:
             self.my_buttons |= (1<<button_number)
-            self.write()
+            self.pack_buttons()
+            self.update()
         return
 
     def release(self, button_number):
         """Release button 0..13"""
         with self.thread_lock:
             self.my_buttons &= ~(1<<button_number)
-            self.write()
+            self.pack_buttons()
+            self.update()
         return
 
     def releaseAll(self):
         """Release all buttons"""
         with self.thread_lock:
             self.my_buttons = 0
-            self.write()
+            self.pack_buttons()
+            self.update()
         return
 
     def buttons(self, buttons):
         """Set all buttons 0..13"""
         with self.thread_lock:
             self.my_buttons = buttons
-            self.write()
+            self.pack_buttons()
+            self.update()
         return
 
     def leftXAxis(self, position):
         """Move left stick X axis 0..128..255"""
         with self.thread_lock:
-            self.left_x_axis = position
-            self.write()
+            self.report[OFF_LX] = position
+            self.update()
         return
 
     def leftYAxis(self, position):
         """Move left stick Y axis 0..128..255"""
         with self.thread_lock:
-            self.left_y_axis = position
-            self.write()
+            self.report[OFF_LY] = position
+            self.update()
         return
 
     def rightXAxis(self, position):
         """Move right stick X axis 0..128..255"""
         with self.thread_lock:
-            self.right_x_axis = position
-            self.write()
+            self.report[OFF_RX] = position
+            self.update()
         return
 
     def rightYAxis(self, position):
         """Move right stick Y axis 0..128..255"""
         with self.thread_lock:
-            self.right_y_axis = position
-            self.write()
+            self.report[OFF_RY] = position
+            self.update()
         return
 
     def allAxes(self, RYRXLYLX):
         """Change all axes from uint32_t."""
         with self.thread_lock:
-            self.right_y_axis = (RYRXLYLX >> 24) & 0xFF;
-            self.right_x_axis = (RYRXLYLX >> 16) & 0xFF;
-            self.left_y_axis  = (RYRXLYLX >>  8) & 0xFF;
-            self.left_x_axis  = (RYRXLYLX      ) & 0xFF;
-            self.write()
+            AXES_STRUCT.pack_into(self.report, OFF_LX, RYRXLYLX & 0xFFFFFFFF)
+            self.update()
         return
 
     def leftTrigger(self, position):
         """Move left trigger 0..255"""
         with self.thread_lock:
-            self.left_trigger = position
-            self.write()
+            self.report[OFF_L2] = position
+            self.update()
         return
 
     def rightTrigger(self, position):
         """Move right trigger 0..255"""
         with self.thread_lock:
-            self.right_trigger = position
-            self.write()
+            self.report[OFF_R2] = position
+            self.update()
+        return
+
+    def gyro(self, x, y, z):
+        """Gyroscope X, Y, Z, -32768..32767"""
+        with self.thread_lock:
+            MOTION_STRUCT.pack_into(self.ext_report, REPORT_GYRO, x, y, z)
+            self.ext_dirty = True
+            self.update()
+        return
+
+    def accel(self, x, y, z):
+        """Accelerometer X, Y, Z, -32768..32767"""
+        with self.thread_lock:
+            MOTION_STRUCT.pack_into(self.ext_report, REPORT_ACCEL, x, y, z)
+            self.ext_dirty = True
+            self.update()
+        return
+
+    def batteryLevel(self, level):
+        """Battery level 0..255"""
+        with self.thread_lock:
+            self.ext_report[REPORT_BATTERY] = level
+            self.ext_dirty = True
+            self.update()
+        return
+
+    def touchPoint(self, finger, x, y):
+        """Touch finger 0 or 1 at x 0..1919, y 0..941"""
+        offset = REPORT_TOUCH + 2 + 4 * finger
+        with self.thread_lock:
+            ext = self.ext_report
+            touch_id = ext[offset]
+            if touch_id & TOUCH_NONE:
+                # New touch, new id
+                touch_id = (touch_id + 1) & 0x7f
+            ext[offset] = touch_id
+            ext[offset + 1] = x & 0xff
+            ext[offset + 2] = ((x >> 8) & 0x0f) | ((y & 0x0f) << 4)
+            ext[offset + 3] = (y >> 4) & 0xff
+            self.ext_dirty = True
+            self.update()
+        return
+
+    def touchRelease(self, finger):
+        """Lift finger 0 or 1 from the touchpad"""
+        offset = REPORT_TOUCH + 2 + 4 * finger
+        with self.thread_lock:
+            self.ext_report[offset] |= TOUCH_NONE
+            self.ext_dirty = True
+            self.update()
         return
 
-    def map_dpad_xy(self, x, y):
+    @staticmethod
+    def map_dpad_xy(x, y):
         """Return direction pad number given axes x,y"""
-        if x == 128:
-            if y == 128:
-                return 15   # Center
-            elif y < 128:
-                return 0    # North
-            return 4        # South
-        elif x < 128:
-            if y == 128:
-                return 6    # West
-            elif y < 128:
-                return 7    # North West
-            return 5        # South West
-        else:
-            if y == 128:
-                return 2    # East
-            elif y < 128:
-                return 1    # North East
-            return 3        # South East
+        return AXIS_HAT[(x << 8) | y]
 
     def dPadXAxis(self, position):
         """Move right stick X axis 0..128..255"""
@@ -237,8 +614,9 @@ class DS4GamepadSerial:
             position = 128
         with self.thread_lock:
             self.dpad_x_axis = position
-            self.d_pad = self.map_dpad_xy(self.dpad_x_axis, self.dpad_y_axis)
-            self.write()
+            self.d_pad = AXIS_HAT[(position << 8) | self.dpad_y_axis]
+            self.pack_buttons()
+            self.update()
         return
 
     def dPadYAxis(self, position):
@@ -247,26 +625,28 @@ class DS4GamepadSerial:
             position = 128
         with self.thread_lock:
             self.dpad_y_axis = position
-            self.d_pad = self.map_dpad_xy(self.dpad_x_axis, self.dpad_y_axis)
-            self.write()
+            self.d_pad = AXIS_HAT[(self.dpad_x_axis << 8) | position]
+            self.pack_buttons()
+            self.update()
         return
 
     def dPad(self, position):
-        """Move directional pad (0..7, 15)"""
+        """Move directional pad (0..7, DS4DPad.CENTERED)"""
         if position < 0 or position > 7:
-            position = 15
+            position = DS4DPad.CENTERED
         with self.thread_lock:
             self.d_pad = position
-            self.dpad_x_axis = self.compass_dir_x[position]
-            self.dpad_y_axis = self.compass_dir_y[position]
-            self.write()
+            self.dpad_x_axis = HAT_X[position]
+            self.dpad_y_axis = HAT_Y[position]
+            self.pack_buttons()
+            self.update()
         return
 
 def main():
     """ test DS4GamepadSerial class """
     import sys
     import serial
-    import time
+    from ds4gschedule import Scheduler
 
     ds4g = DS4GamepadSerial()
     try:
@@ -276,28 +656,30 @@ def main():
         sys.exit(1)
 
     print('Serial port open')
+    sched = Scheduler().start()
     while True:
         # Press and hold every button 0..13
         for button in range(0, 14):
             ds4g.press(button)
-            time.sleep(0.1)
-        time.sleep(1)
+            sched.wait(0.1)
+        sched.wait(1)
         # Release all buttons
         ds4g.releaseAll()
-        time.sleep(1)
+        sched.wait(1)
         # Press all 14 buttons at the same time
         ds4g.buttons(0x3fff)
-        time.sleep(1)
+        sched.wait(1)
         # Release all buttons
         ds4g.releaseAll()
-        time.sleep(1)
+        sched.wait(1)
         # Move directional pad in all directions
         # 0 = North, 1 = North-East, 2 = East, etc.
         for direction in range(0, 8):
             ds4g.dPad(direction)
-            time.sleep(0.5)
+            sched.wait(0.5)
         # Move directional pad to center
         ds4g.dPad(DS4DPad.CENTERED)
+        print('lateness us %s' % sched.stats())
 
 if __name__ == "__main__":
     main()
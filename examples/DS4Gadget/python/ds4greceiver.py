@@ -0,0 +1,455 @@
+#!/usr/bin/python3
+"""
+Host-side model of the DS4Gadget serial receiver.
+
+GadgetReceiver is a Python version of gadget_report() and loop() in
+DS4Gadget.ino and DS4GamepadAPI::loop()/write(). Bytes are fed in with the
+time they were sent and the model works out when each byte reaches the gadget
+UART, which frames the state machine accepts, and which USB reports the
+gadget sends and when the console receives them.
+
+What is modelled
+
+* The STX/length/type/payload/ETX state machine including the 2 ms resync
+  timeout and the buffer length limit.
+* Full (type 3), delta (type 4) and extended (type 6) report frames.
+  apply_delta() and apply_regions() are the reference decoders.
+* The USB report sent for every accepted frame plus the one sent every 3 ms
+  by DS4GamepadAPI::loop(), with the reportCnt and timestamp fields.
+* The interrupt IN endpoint polled every bInterval (1 ms). SendReport() waits
+  for the previous report to be collected so the sketch stops reading the
+  UART while it waits.
+* The UART receive ring buffer. Bytes arriving when it is full are lost.
+* The telemetry frame sent back to the host every TELEMETRY_MS, passed to
+  on_telemetry. PtyGadget writes it to the pty.
+
+PtyGadget runs the model on the master side of a pty so any sender can open
+the slave side as if it were the CP2104.
+
+    $ ./ds4greceiver.py
+    Gadget serial port: /dev/pts/5
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import tty
+import select
+import threading
+import time
+from collections import deque
+from ds4gtelemetry import encode_telemetry, TELEMETRY_MS
+
+STX = 0x02
+ETX = 0x03
+
+# DS4Gadget.ino
+GADGET_BPS = 2000000
+GADGET_BUFFER_SIZE = 128
+RESYNC_MS = 2
+# DS4GamepadAPI::loop()
+REPORT_TICK_MS = 3
+# sizeof(HID_DS4GamepadReport_Data_t)
+REPORT_SIZE = 64
+# Byte offsets in HID_DS4GamepadReport_Data_t
+REPORT_CNT_OFFSET = 7
+TIMESTAMP_OFFSET = 10
+# lsusb_ds4gadget.txt bInterval
+USB_INTERVAL_MS = 1.0
+# SAMD core RingBuffer size for Serial1
+UART_BUFFER_SIZE = 64
+# Frame types
+FRAME_REPORT = 3
+FRAME_DELTA = 4
+FRAME_EXTENDED = 6
+# Report byte changed by each delta mask bit. Bit 7 is L2 and R2.
+DELTA_REPORT_OFFSETS = (1, 2, 3, 4, 5, 6, 7, 8)
+DELTA_TRIGGERS = 0x80
+
+# Extended frame regions, (offset, size) in the report
+EXT_REGIONS = ((1, 4), (5, 3), (8, 2), (12, 1), (13, 6), (19, 6), (33, 10))
+
+def apply_regions(report, payload):
+    """
+    gadget_regions() in DS4Gadget.ino. Apply the payload of an extended
+    frame, the region mask then the regions, to report. Returns False and
+    leaves report unchanged if the payload length does not match the mask.
+    """
+    if not payload or payload[0] >> len(EXT_REGIONS):
+        return False
+    mask = payload[0]
+    regions = [region for bit, region in enumerate(EXT_REGIONS)
+               if mask & (1 << bit)]
+    if len(payload) != 1 + sum(size for _, size in regions):
+        return False
+    index = 1
+    for offset, size in regions:
+        report[offset:offset + size] = payload[index:index + size]
+        index += size
+    return True
+
+def apply_delta(report, delta):
+    """
+    gadget_delta() in DS4Gadget.ino. Apply the payload of a delta frame,
+    the field mask then the changed bytes, to report. Returns False and
+    leaves report unchanged if the payload length does not match the mask.
+    """
+    if not delta:
+        return False
+    mask = delta[0]
+    needed = 1 + bin(mask).count('1') + (1 if mask & DELTA_TRIGGERS else 0)
+    if len(delta) != needed:
+        return False
+    index = 1
+    for bit, offset in enumerate(DELTA_REPORT_OFFSETS):
+        if mask & (1 << bit):
+            report[offset] = delta[index]
+            index += 1
+    if mask & DELTA_TRIGGERS:
+        report[9] = delta[index]
+    return True
+
+class GadgetReceiver:
+    """
+    Model of the DS4Gadget sketch. Times are float milliseconds on any
+    monotonic clock; the model keeps its own integer millis() like the
+    sketch.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, bps=GADGET_BPS, uart_buffer=UART_BUFFER_SIZE,
+                 usb_interval_ms=USB_INTERVAL_MS, max_reports=4096,
+                 on_report=None, on_telemetry=None):
+        self.byte_ms = 10000.0 / bps    # 8N1
+        self.uart_buffer = uart_buffer
+        self.usb_interval_ms = usb_interval_ms
+        self.on_report = on_report
+        self.on_telemetry = on_telemetry
+        # Effective USB report stream, (time collected by host, report)
+        self.reports = deque(maxlen=max_reports)
+
+        # Wire and UART
+        self.wire_free_ms = 0.0
+        self.ring = deque()
+        # Sketch state
+        self.now = 0.0
+        self.state = 0
+        self.buffer = bytearray(GADGET_BUFFER_SIZE)
+        self.buflen = 0
+        self.expectedlen = 0
+        self.timeout_ms = 0
+        self.report = bytearray(REPORT_SIZE)
+        # gadget_last, the last report received. Delta frames change it.
+        self.last = bytearray(REPORT_SIZE)
+        self.start_millis = 0
+        self.telemetry_millis = 0
+        self.telemetry_sequence = 0
+        self.ep_free_ms = 0.0
+        # Counters
+        self.bytes_received = 0
+        self.bytes_overrun = 0
+        self.bytes_discarded = 0
+        self.frames_accepted = 0
+        self.frames_dropped = 0
+        self.frames_ignored = 0
+        self.resyncs = 0
+        self.usb_reports = 0
+        self.usb_reports_tick = 0
+        self.usb_wait_ms = 0.0
+        self.release_all()
+        self.last[:] = self.report
+
+    def release_all(self):
+        """DS4GamepadAPI::releaseAll()"""
+        self.report[2:] = bytes(REPORT_SIZE - 2)
+        self.report[0] = 0x01
+        self.report[1:5] = b'\x80\x80\x80\x80'
+        self.report[5] = 0x08   # DS4GAMEPAD_DPAD_CENTERED
+        return
+
+    def feed(self, data, sent_ms):
+        """Bytes written by the host at sent_ms"""
+        start = max(sent_ms, self.wire_free_ms)
+        for index, byt in enumerate(data):
+            arrival = start + (index + 1) * self.byte_ms
+            self.run_until(arrival)
+            if len(self.ring) >= self.uart_buffer:
+                self.bytes_overrun += 1
+            else:
+                self.ring.append(byt)
+            self.bytes_received += 1
+        self.wire_free_ms = start + len(data) * self.byte_ms
+        return
+
+    def run_until(self, until_ms):
+        """Run the sketch loop() up to until_ms"""
+        if self.now == 0.0:
+            # setup() runs at the first time seen
+            self.now = until_ms
+            self.start_millis = int(until_ms)
+            self.telemetry_millis = int(until_ms)
+        while self.now <= until_ms:
+            sent = False
+            if self.ring:
+                sent = self.gadget_report()
+            elif self.state != 0 and int(self.now) - self.timeout_ms > RESYNC_MS:
+                self.state = 0
+                self.resyncs += 1
+            # DS4Gamepad.loop()
+            if int(self.now) - self.start_millis >= REPORT_TICK_MS:
+                self.send_report()
+                self.usb_reports_tick += 1
+                self.start_millis = int(self.now)
+                # Checked every tick so no wake up of its own is needed
+                if self.on_telemetry is not None and \
+                        int(self.now) - self.telemetry_millis >= TELEMETRY_MS:
+                    self.telemetry_millis = int(self.now)
+                    self.on_telemetry(encode_telemetry(self.telemetry_sequence,
+                                                       self.counters()))
+                    self.telemetry_sequence += 1
+                continue
+            if sent or self.ring:
+                continue
+            # Nothing to do until the next byte, timeout or tick
+            next_ms = self.start_millis + REPORT_TICK_MS
+            if self.state != 0:
+                next_ms = min(next_ms, self.timeout_ms + RESYNC_MS + 1)
+            if next_ms > until_ms:
+                self.now = until_ms
+                break
+            self.now = float(next_ms)
+        return
+
+    def gadget_report(self):
+        """
+        gadget_report() for the bytes in the UART buffer. Returns True when
+        loop() would have called DS4Gamepad.write(), which takes time.
+        """
+        ring = self.ring
+        while ring:
+            byt = ring.popleft()
+            if self.state == 0:
+                if byt == STX:
+                    self.timeout_ms = int(self.now)
+                    self.state = 1
+                    self.buflen = 0
+                else:
+                    self.bytes_discarded += 1
+            elif self.state == 1:
+                self.buffer[0] = byt
+                self.buflen = 1
+                self.expectedlen = min(byt, GADGET_BUFFER_SIZE - 1)
+                self.state = 2
+            elif self.state == 2:
+                self.buffer[1] = byt
+                self.buflen = 2
+                if self.expectedlen < 2:
+                    # The sketch mishandles lengths below 2 (readBytes() of
+                    # 0 or (size_t)-1 bytes). Count it as a dropped frame.
+                    self.frames_dropped += 1
+                    self.state = 0
+                    continue
+                self.state = 3
+            elif self.state == 3:
+                if self.buflen <= self.expectedlen:
+                    self.buffer[self.buflen] = byt
+                    self.buflen += 1
+                if self.buflen > self.expectedlen:
+                    self.state = 4
+            elif self.state == 4:
+                if byt == ETX:
+                    self.state = 0
+                    self.frames_accepted += 1
+                    if self.handle_frame(self.buffer, self.buflen):
+                        return True
+                elif byt == STX:
+                    self.frames_dropped += 1
+                    self.timeout_ms = int(self.now)
+                    self.state = 1
+                    self.buflen = 0
+                    # gadget_report() returns here
+                    return False
+                else:
+                    self.frames_dropped += 1
+                    self.state = 0
+        return False
+
+    def handle_frame(self, buffer, buflen):
+        """
+        loop() after gadget_report() returned a frame. buffer[0] is the
+        length, buffer[1] the type. Returns True if a USB report was sent.
+        """
+        if buflen > 1 and buffer[1] == FRAME_REPORT:
+            # memcpy(gadget_last, &gadget_data[2], reportLen - 2), the rest
+            # of the report is left as extended frames set it
+            count = min(buflen - 2, REPORT_SIZE)
+            self.last[:count] = buffer[2:2 + count]
+            self.write_report(self.last)
+            return True
+        if buflen > 1 and buffer[1] == FRAME_EXTENDED:
+            if apply_regions(self.last, buffer[2:buflen]):
+                self.write_report(self.last)
+                return True
+        if buflen > 1 and buffer[1] == FRAME_DELTA:
+            if apply_delta(self.last, buffer[2:buflen]):
+                self.write_report(self.last)
+                return True
+        self.frames_ignored += 1
+        return False
+
+    def write_report(self, payload):
+        """DS4GamepadAPI::write(void *report)"""
+        save = self.report[REPORT_CNT_OFFSET] & 0xfc, \
+            self.report[TIMESTAMP_OFFSET:TIMESTAMP_OFFSET + 2]
+        self.report[:] = payload
+        self.report[REPORT_CNT_OFFSET] = (payload[REPORT_CNT_OFFSET] & 0x03) | save[0]
+        self.report[TIMESTAMP_OFFSET:TIMESTAMP_OFFSET + 2] = save[1]
+        self.send_report()
+        return
+
+    def send_report(self):
+        """DS4GamepadAPI::write(void). SendReport() waits for the previous
+        report to be collected by the host."""
+        start = max(self.now, self.ep_free_ms)
+        self.usb_wait_ms += start - self.now
+        self.now = start
+        interval = self.usb_interval_ms
+        self.ep_free_ms = (int(start / interval) + 1) * interval
+        report = bytes(self.report)
+        self.reports.append((self.ep_free_ms, report))
+        self.usb_reports += 1
+        if self.on_report is not None:
+            self.on_report(self.ep_free_ms, report)
+        # reportCnt:6 in the top bits, timestamp += 188
+        count = self.report[REPORT_CNT_OFFSET]
+        self.report[REPORT_CNT_OFFSET] = ((count + 4) & 0xfc) | (count & 0x03)
+        stamp = (int.from_bytes(self.report[TIMESTAMP_OFFSET:TIMESTAMP_OFFSET + 2],
+                                'little') + 188) & 0xffff
+        self.report[TIMESTAMP_OFFSET:TIMESTAMP_OFFSET + 2] = stamp.to_bytes(2, 'little')
+        return
+
+    def counters(self):
+        """Return a dict of the counters"""
+        return {
+            'bytes_received': self.bytes_received,
+            'bytes_overrun': self.bytes_overrun,
+            'bytes_discarded': self.bytes_discarded,
+            'frames_accepted': self.frames_accepted,
+            'frames_dropped': self.frames_dropped,
+            'frames_ignored': self.frames_ignored,
+            'resyncs': self.resyncs,
+            'usb_reports': self.usb_reports,
+            'usb_reports_tick': self.usb_reports_tick,
+            'usb_wait_ms': round(self.usb_wait_ms, 3),
+        }
+
+class PtyGadget:
+    """
+    Run a GadgetReceiver on a pty. Open slave_name with pyserial (any baud
+    rate) or os.open(). Times are time.monotonic() in ms.
+    """
+    def __init__(self, receiver=None):
+        self.receiver = receiver if receiver is not None else GadgetReceiver()
+        self.master, self.slave = os.openpty()
+        # Send the telemetry frames back to the host
+        if self.receiver.on_telemetry is None:
+            self.receiver.on_telemetry = self.send_telemetry
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.slave_name = os.ttyname(self.slave)
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the receiver thread"""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the receiver thread and close the pty"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+        os.close(self.master)
+        os.close(self.slave)
+        return
+
+    def run(self):
+        """Receiver thread"""
+        poller = select.poll()
+        poller.register(self.master, select.POLLIN)
+        while not self.stop_event.is_set():
+            # The pty has no baud rate. Stop reading while the modelled wire
+            # is behind so the pty fills and the sender blocks like on a
+            # real UART.
+            backlog = self.receiver.wire_free_ms - time.monotonic() * 1000.0
+            if backlog > 1.0:
+                time.sleep(backlog / 1000.0)
+            ready = poller.poll(1)
+            now = time.monotonic() * 1000.0
+            with self.lock:
+                if ready:
+                    try:
+                        data = os.read(self.master, 65536)
+                    except OSError:
+                        break
+                    self.receiver.feed(data, now)
+                else:
+                    self.receiver.run_until(now)
+        return
+
+    def send_telemetry(self, frame):
+        """Write a telemetry frame to the pty, drop it if the host is not
+        reading"""
+        try:
+            os.write(self.master, frame)
+        except BlockingIOError:
+            pass
+        return
+
+    def counters(self):
+        """Return the receiver counters"""
+        with self.lock:
+            return self.receiver.counters()
+
+def main():
+    """Run the model on a pty and print the counters every second"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bps', type=int, default=GADGET_BPS)
+    parser.add_argument('--uart-buffer', type=int, default=UART_BUFFER_SIZE)
+    parser.add_argument('--usb-interval', type=float, default=USB_INTERVAL_MS)
+    args = parser.parse_args()
+
+    gadget = PtyGadget(GadgetReceiver(args.bps, args.uart_buffer,
+                                      args.usb_interval)).start()
+    print('Gadget serial port: %s' % gadget.slave_name)
+    try:
+        while True:
+            time.sleep(1)
+            print(gadget.counters())
+    except KeyboardInterrupt:
+        gadget.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+Record and replay gamepad sessions.
+
+A recording is a file of fixed size 32 byte records after a 32 byte header
+so it can be appended to while recording and memory-mapped for replay.
+Multi-hour recordings are never loaded into memory.
+
+    header  magic 'DS4GREC', version, record size, flags, start time
+    record  uint64 ns since start, kind, length, source, 20 bytes of data
+
+Kinds
+
+    KIND_EVENT  js_event (time, value, type, number) read by a mapper.
+                source tells the joysticks apart.
+    KIND_FRAME  serial frame written to DS4Gadget. Frames longer than 20
+                bytes continue in KIND_CONT records.
+
+Record the frames by wrapping the serial port and the events by wrapping the
+JoystickReader.
+
+    recorder = Recorder('session.ds4g')
+    ds4g.begin(RecordingPort(serial.Serial(...), recorder))
+    jsdev = RecordingReader(JoystickReader(path), recorder)
+
+Replay the frames to the gadget, or the events through a profile, at the
+original timing or faster.
+
+    $ ./ds4grecord.py info session.ds4g
+    $ ./ds4grecord.py replay session.ds4g --speed 2
+    $ ./ds4grecord.py replay session.ds4g --profile horipad
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+import mmap
+import time
+import threading
+from struct import Struct
+from jsreader import JS_EVENT
+from ds4gschedule import Scheduler
+
+MAGIC = b'DS4GREC\x00'
+VERSION = 1
+HEADER = Struct('<8sHHId8x')
+RECORD = Struct('<QBBH20s')
+RECORD_SIZE = RECORD.size
+DATA_SIZE = 20
+
+KIND_EVENT = 1
+KIND_FRAME = 2
+KIND_CONT = 3
+
+class RecordError(ValueError):
+    """Not a recording"""
+
+class Recorder:
+    """Append records to a recording. Thread safe."""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE, 0,
+                                        time.time()))
+        elif self.file.tell() % RECORD_SIZE:
+            # Partly written record from a crash
+            self.file.truncate(self.file.tell() - self.file.tell() % RECORD_SIZE)
+        self.start_ns = time.monotonic_ns()
+        # Appending to an existing recording carries on after its last record
+        self.offset_ns = 0
+        if self.file.tell() > HEADER.size:
+            with Recording(path) as recording:
+                self.offset_ns = recording.duration_ns()
+        self.record = bytearray(RECORD_SIZE)
+        self.records = 0
+
+    def close(self):
+        """Flush and close the file"""
+        with self.lock:
+            self.file.close()
+        return
+
+    def append(self, kind, data, source=0):
+        """Append data, continued in KIND_CONT records if it is long"""
+        t_ns = time.monotonic_ns() - self.start_ns + self.offset_ns
+        record = self.record
+        with self.lock:
+            for start in range(0, max(1, len(data)), DATA_SIZE):
+                RECORD.pack_into(record, 0, t_ns, kind if start == 0 else KIND_CONT,
+                                 len(data) - start, source,
+                                 bytes(data[start:start + DATA_SIZE]))
+                self.file.write(record)
+                self.records += 1
+        return
+
+    def event(self, event, source=0):
+        """Record a (time, value, type, number) js event"""
+        self.append(KIND_EVENT, JS_EVENT.pack(*event), source)
+        return
+
+    def frame(self, data):
+        """Record a serial frame"""
+        self.append(KIND_FRAME, data)
+        return
+
+class RecordingPort:
+    """Serial port that records the frames written to it"""
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.port, name)
+
+    def write(self, data):
+        """Record then write a frame"""
+        self.recorder.frame(data)
+        return self.port.write(data)
+
+class RecordingReader:
+    """JoystickReader that records the events it returns"""
+    def __init__(self, reader, recorder, source=0):
+        self.reader = reader
+        self.recorder = recorder
+        self.source = source
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+    def events(self):
+        """JoystickReader.events(), recorded"""
+        record = self.recorder.event
+        source = self.source
+        for event in self.reader.events():
+            record(event, source)
+            yield event
+
+class Recording:
+    """Memory-mapped recording. Records are read on demand."""
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < HEADER.size:
+            raise RecordError('%s: too short' % path)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size, _, self.start_time = \
+            HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise RecordError('%s: not a version %d recording' % (path, VERSION))
+        # A partly written last record is ignored
+        self.count = (size - HEADER.size) // RECORD_SIZE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """Unmap and close"""
+        self.map.close()
+        self.file.close()
+        return
+
+    def record(self, index):
+        """(t_ns, kind, length, source, data) of record index"""
+        return RECORD.unpack_from(self.map, HEADER.size + index * RECORD_SIZE)
+
+    def duration_ns(self):
+        """Time of the last record"""
+        return self.record(self.count - 1)[0] if self.count else 0
+
+    def find(self, t_ns):
+        """Index of the first record at or after t_ns"""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] < t_ns:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, start=0, kinds=(KIND_EVENT, KIND_FRAME)):
+        """Yield (t_ns, kind, source, data) from record index start,
+        joining continued frames"""
+        unpack_from = RECORD.unpack_from
+        mapped = self.map
+        index = start
+        while index < self.count:
+            t_ns, kind, length, source, data = \
+                unpack_from(mapped, HEADER.size + index * RECORD_SIZE)
+            index += 1
+            if kind == KIND_CONT:
+                # Continuation of a frame before start
+                continue
+            if length > DATA_SIZE:
+                parts = [data]
+                while index < self.count and length > DATA_SIZE * len(parts):
+                    parts.append(unpack_from(
+                        mapped, HEADER.size + index * RECORD_SIZE)[4])
+                    index += 1
+                data = b''.join(parts)
+            if kind in kinds:
+                yield t_ns, kind, source, data[:length]
+
+class Replayer:
+    """
+    Replay a recording with the original timing divided by speed. Times are
+    absolute deadlines from the start so errors do not add up.
+    """
+    def __init__(self, recording, speed=1.0, start_ns=0, scheduler=None):
+        self.recording = recording
+        self.speed = speed
+        self.start_ns = start_ns
+        # Lateness statistics, see stats()
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        # Largest delay behind the recorded timing in seconds
+        self.max_late = 0.0
+
+    def timed(self, kinds):
+        """Yield (kind, source, data) of each entry when it is due"""
+        entries = self.recording.entries(self.recording.find(self.start_ns),
+                                         kinds)
+        scheduler = self.scheduler.start()
+        start_ns = scheduler.start_ns
+        for t_ns, kind, source, data in entries:
+            late_ns = scheduler.until_ns(
+                start_ns + int((t_ns - self.start_ns) / self.speed))
+            self.max_late = max(self.max_late, late_ns / 1e9)
+            yield kind, source, data
+
+    def stats(self):
+        """Lateness statistics in microseconds"""
+        return self.scheduler.stats()
+
+    def frames(self, ds4g):
+        """Write the recorded frames to the serial port of a
+        DS4GamepadSerial"""
+        write = ds4g.ser_port.write
+        lock = ds4g.thread_lock
+        for _, _, data in self.timed((KIND_FRAME,)):
+            with lock:
+                write(data)
+        return
+
+    def events(self, mappers):
+        """Dispatch the recorded events to DeviceMapper mappers[source]"""
+        unpack = JS_EVENT.unpack
+        for _, source, data in self.timed((KIND_EVENT,)):
+            mapper = mappers.get(source) if isinstance(mappers, dict) \
+                else mappers
+            if mapper is not None:
+                mapper.dispatch(unpack(data))
+        return
+
+def info(recording):
+    """Print a summary of a recording"""
+    counts = {}
+    for _, kind, _, _ in recording.entries():
+        counts[kind] = counts.get(kind, 0) + 1
+    print('started   %s' % time.strftime('%Y-%m-%d %H:%M:%S',
+                                         time.localtime(recording.start_time)))
+    print('duration  %.3f s' % (recording.duration_ns() / 1e9))
+    print('records   %d' % len(recording))
+    print('events    %d' % counts.get(KIND_EVENT, 0))
+    print('frames    %d' % counts.get(KIND_FRAME, 0))
+    return
+
+def main():
+    """Show or replay a recording"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('command', choices=('info', 'replay'))
+    parser.add_argument('path')
+    parser.add_argument('--port', default='/dev/ttyAMA0')
+    parser.add_argument('--bps', type=int, default=2000000)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed, 2 is twice as fast')
+    parser.add_argument('--start', type=float, default=0.0,
+                        help='seconds into the recording to start from')
+    parser.add_argument('--profile',
+                        help='replay the events through this profile instead '
+                        'of replaying the frames')
+    args = parser.parse_args()
+
+    with Recording(args.path) as recording:
+        if args.command == 'info':
+            info(recording)
+            return 0
+        import serial
+        from ds4gpadserial import DS4GamepadSerial
+        ds4g = DS4GamepadSerial()
+        ds4g.begin(serial.Serial(args.port, args.bps, timeout=0))
+        replayer = Replayer(recording, args.speed, int(args.start * 1e9))
+        if args.profile:
+            from ds4gmapper import DeviceMapper, load_profile
+            replayer.events(DeviceMapper(load_profile(args.profile), ds4g))
+        else:
+            replayer.frames(ds4g)
+        ds4g.end()
+        print('lateness us %s' % replayer.stats())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
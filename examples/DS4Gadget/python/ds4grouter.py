@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+"""
+Route input devices to several DS4Gadgets from one event loop.
+
+A Router owns N gadget serial ports and M joysticks. Each joystick is routed
+to one gadget, mirrored to several, or merged with other joysticks into one
+gadget (for example the two halves of a dual stick setup). Everything runs on
+one asyncio event loop (epoll on Linux): joysticks are read when readable and
+every gadget is an AsyncDS4GamepadSerial writing non-blocking with its own
+output buffer, so a slow or stuck UART only delays its own gadget.
+
+A gadget with several routes merges them with a ds4gmerge.InputMerger: each
+joystick sets its own SourceSlot and the slots are combined after every read,
+buttons ORed, axes and triggers by the gadget "axes" and "triggers" policies
+(default "priority" and "max", see ds4gmerge.py). The merger runs on the
+event loop, its writer thread is not started.
+
+Routes are given in code or in a JSON file.
+
+    {
+        "gadgets": {
+            "console1": "/dev/ttyUSB0",
+            "console2": "/dev/ttyUSB1",
+            "console3": {"port": "/dev/ttyUSB2", "axes": "max"}
+        },
+        "routes": [
+            {"input": "/dev/input/js0", "gadgets": ["console1", "console2"]},
+            {"input": "/dev/input/js1", "profile": "dragonrise_left",
+             "gadgets": ["console3"]},
+            {"input": "/dev/input/js2", "profile": "dragonrise_right",
+             "gadgets": ["console3"]}
+        ]
+    }
+
+Without "profile" the profile is found from the joystick USB IDs.
+
+    $ ./ds4grouter.py routes.json
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+import json
+import tty
+import termios
+import asyncio
+from contextlib import ExitStack
+from ds4gpadasync import AsyncDS4GamepadSerial
+from ds4gmerge import InputMerger
+from ds4gmapper import DeviceMapper, ProfileRegistry, ProfileError, \
+    load_profile, load_profiles
+from ds4gidentity import IdentityCache
+from jsreader import JoystickReader
+
+GADGET_BPS = 2000000
+
+# Longest wait for a gadget to take its last frame when the router stops
+FLUSH_TIMEOUT = 0.5
+
+def open_uart(path, bps=GADGET_BPS):
+    """Open a serial port raw and non-blocking, return the file descriptor.
+    Raises ValueError if termios has no B<bps> speed for bps."""
+    speed = getattr(termios, 'B%d' % bps, None)
+    if speed is None:
+        raise ValueError('%s: %d bps is not a termios speed' % (path, bps))
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    tty.setraw(fd)
+    attrs = termios.tcgetattr(fd)
+    attrs[4] = attrs[5] = speed
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+    return fd
+
+class Mirror:
+    """Forward DS4GamepadSerial setter calls to several gadgets"""
+    def __init__(self, gadgets):
+        self.gadgets = gadgets
+
+    def __getattr__(self, name):
+        methods = [getattr(gadget, name) for gadget in self.gadgets]
+        def call(*args):
+            for method in methods:
+                method(*args)
+        return call
+
+class Route:
+    """One joystick and the gadgets it drives"""
+    def __init__(self, path, gadgets, profile=None):
+        self.path = path
+        self.gadgets = gadgets
+        self.profile = profile
+        self.reader = None
+        self.mapper = None
+        # gadget name: SourceSlot, for the gadgets shared with other routes
+        self.slots = {}
+
+class Router:
+    """Joysticks to gadgets on one asyncio event loop"""
+    def __init__(self):
+        self.loop = None
+        self.gadgets = {}
+        # name: (port path or fd, bps)
+        self.ports = {}
+        # name: InputMerger of the gadget
+        self.mergers = {}
+        self.routes = []
+        self.registry = ProfileRegistry(load_profiles())
+        self.identities = IdentityCache()
+        self.stopped = None
+
+    def add_gadget(self, name, port, bps=GADGET_BPS, delta=False,
+                   axes='priority', triggers='max'):
+        """Add a gadget on a serial port path or an open file descriptor.
+        axes and triggers are the merge policies used when several routes
+        drive it."""
+        self.gadgets[name] = AsyncDS4GamepadSerial(delta=delta)
+        self.ports[name] = (port, bps)
+        self.mergers[name] = InputMerger(self.gadgets[name], axes, triggers)
+        if self.loop is not None:
+            self.begin_gadget(name)
+        return self.gadgets[name]
+
+    def add_input(self, path, gadgets, profile=None):
+        """Route the joystick at path to the gadgets named in gadgets.
+        profile is a profile dict, a profile name or None to look it up."""
+        if isinstance(profile, str):
+            profile = load_profile(profile)
+        for name in gadgets:
+            if name not in self.ports:
+                raise KeyError('unknown gadget %s' % name)
+        route = Route(path, list(gadgets), profile)
+        self.routes.append(route)
+        if self.loop is not None:
+            # A route writing straight to a gadget now shared moves to a slot
+            for other in self.routes[:-1]:
+                if other.reader is not None and \
+                        set(other.gadgets) & set(route.gadgets) - \
+                        set(other.slots):
+                    self.close_input(other)
+                    self.open_input(other)
+            self.open_input(route)
+        return route
+
+    def shared(self, name):
+        """True if more than one route drives gadget name"""
+        return sum(name in route.gadgets for route in self.routes) > 1
+
+    def begin_gadget(self, name):
+        """Open a gadget port and start it on the event loop"""
+        port, bps = self.ports[name]
+        fd = open_uart(port, bps) if isinstance(port, str) else port
+        self.gadgets[name].begin(fd)
+        return
+
+    def open_input(self, route):
+        """Open a joystick and start reading it"""
+        profile = route.profile
+        if profile is None:
+            profile = self.registry.find(self.identities.lookup(route.path))
+            if profile is None:
+                print('%s: no profile' % route.path)
+                return False
+        try:
+            reader = JoystickReader(route.path)
+        except OSError as err:
+            print('%s: %s' % (route.path, err))
+            return False
+        gadgets = []
+        for name in route.gadgets:
+            if self.shared(name):
+                merger = self.mergers[name]
+                route.slots[name] = merger.slot()
+                # Priority follows the routing table, not the plug order
+                merger.slots = [other.slots[name] for other in self.routes
+                                if name in other.slots]
+                gadgets.append(route.slots[name])
+            else:
+                gadgets.append(self.gadgets[name])
+        target = gadgets[0] if len(gadgets) == 1 else Mirror(gadgets)
+        try:
+            route.mapper = DeviceMapper(profile, target, reader)
+        except ProfileError:
+            reader.close()
+            self.drop_slots(route)
+            raise
+        route.reader = reader
+        self.loop.add_reader(reader.fileno(), self.on_input, route)
+        print('%s: %s -> %s' % (route.path, profile['name'],
+                                ', '.join(route.gadgets)))
+        return True
+
+    def close_input(self, route):
+        """Stop reading a joystick"""
+        if route.reader is None:
+            return
+        self.loop.remove_reader(route.reader.fileno())
+        if not route.reader.jsdev.closed and route.mapper.saved_corr is not None:
+            try:
+                route.reader.set_corr(route.mapper.saved_corr)
+            except OSError:
+                pass
+        route.reader.close()
+        route.reader = None
+        self.drop_slots(route)
+        return
+
+    def drop_slots(self, route):
+        """Take the slots of a route out of their mergers"""
+        for name, slot in route.slots.items():
+            merger = self.mergers[name]
+            merger.remove(slot)
+            merger.merge()
+        route.slots = {}
+        return
+
+    def on_input(self, route):
+        """Event loop callback when a joystick is readable"""
+        try:
+            events = route.reader.read_events()
+        except OSError:
+            print('%s: removed' % route.path)
+            self.close_input(route)
+            return
+        table = route.mapper.table
+        if not route.slots:
+            for _, value, type, number in events:
+                handler = table[((type & 0x03) << 8) | number]
+                if handler is not None:
+                    handler(value)
+            return
+        # One publish per slot for the whole read, then one merged frame
+        with ExitStack() as stack:
+            for slot in route.slots.values():
+                stack.enter_context(slot.batch())
+            for _, value, type, number in events:
+                handler = table[((type & 0x03) << 8) | number]
+                if handler is not None:
+                    handler(value)
+        for name in route.slots:
+            self.mergers[name].merge()
+        return
+
+    def counters(self):
+        """Frames sent and superseded per gadget"""
+        return {name: {'frames_sent': gadget.frames_sent,
+                       'frames_superseded': gadget.frames_superseded}
+                for name, gadget in self.gadgets.items()}
+
+    async def run(self):
+        """Start the gadgets and inputs then run until stop()"""
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        for name in self.gadgets:
+            self.begin_gadget(name)
+        for route in self.routes:
+            self.open_input(route)
+        try:
+            await self.stopped
+        finally:
+            for route in self.routes:
+                self.close_input(route)
+            # Flushed together so each stuck UART costs FLUSH_TIMEOUT once
+            results = await asyncio.gather(
+                *(asyncio.wait_for(gadget.flush(), FLUSH_TIMEOUT)
+                  for gadget in self.gadgets.values()),
+                return_exceptions=True)
+            for (name, gadget), result in zip(self.gadgets.items(), results):
+                if isinstance(result, asyncio.TimeoutError):
+                    # Stuck or unplugged UART, the last state is lost
+                    print('%s: flush timed out' % name)
+                gadget.end()
+            self.loop = None
+        return
+
+    def stop(self):
+        """Make run() return"""
+        if self.stopped is not None and not self.stopped.done():
+            self.stopped.set_result(None)
+        return
+
+def load_routes(path):
+    """Router from a JSON routing table"""
+    with open(path) as routes_file:
+        config = json.load(routes_file)
+    router = Router()
+    for name, port in config.get('gadgets', {}).items():
+        if isinstance(port, dict):
+            router.add_gadget(name, port['port'], port.get('bps', GADGET_BPS),
+                              port.get('delta', False),
+                              port.get('axes', 'priority'),
+                              port.get('triggers', 'max'))
+        else:
+            router.add_gadget(name, port)
+    for route in config.get('routes', ()):
+        router.add_input(route['input'], route['gadgets'], route.get('profile'))
+    return router
+
+def main():
+    """Run the routing table given on the command line"""
+    if len(sys.argv) != 2:
+        print('usage: %s routes.json' % sys.argv[0])
+        return 1
+    router = load_routes(sys.argv[1])
+    try:
+        asyncio.run(router.run())
+    except KeyboardInterrupt:
+        print(router.counters())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+"""
+Absolute deadline scheduler for scripted input and replay.
+
+time.sleep(0.1) between steps drifts: every step adds the time the step took
+and the scheduling delay of the sleep itself. Scheduler keeps a cursor of
+deadlines relative to start() so every step is due at its nominal time no
+matter how late the previous one was.
+
+Deadlines are slept with clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME)
+then, for the last spin_ns, busy-waited on time.monotonic_ns() which costs
+CPU but takes out the wake up delay of the kernel.
+
+    sched = Scheduler()
+    sched.start()
+    for button in range(14):
+        ds4g.press(button)
+        sched.wait(0.1)
+    print(sched.stats())
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import time
+import errno
+import ctypes
+import ctypes.util
+from time import monotonic_ns
+from ds4glatency import LatencyHistogram
+
+# <time.h>, the clock of time.monotonic_ns()
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+
+# Busy-wait the last 200 us before a deadline
+SPIN_NS = 200000
+
+class Timespec(ctypes.Structure):
+    """struct timespec"""
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+try:
+    CLOCK_NANOSLEEP = LIBC.clock_nanosleep
+    CLOCK_NANOSLEEP.argtypes = (ctypes.c_int, ctypes.c_int,
+                                ctypes.POINTER(Timespec), ctypes.c_void_p)
+except AttributeError:
+    CLOCK_NANOSLEEP = None
+
+def sleep_until_ns(deadline_ns, spin_ns=SPIN_NS):
+    """Return at time.monotonic_ns() deadline_ns or as soon after as
+    possible"""
+    sleep_ns = deadline_ns - spin_ns
+    if sleep_ns > monotonic_ns():
+        if CLOCK_NANOSLEEP is not None:
+            request = Timespec(sleep_ns // 1000000000, sleep_ns % 1000000000)
+            while CLOCK_NANOSLEEP(CLOCK_MONOTONIC, TIMER_ABSTIME,
+                                  ctypes.byref(request), None) == errno.EINTR:
+                pass
+        else:
+            time.sleep(max(0, sleep_ns - monotonic_ns()) / 1e9)
+    while monotonic_ns() < deadline_ns:
+        pass
+    return
+
+class Scheduler:
+    """
+    Run steps at absolute times from start(). Lateness, how long after its
+    deadline each step ran, is kept in a microsecond LatencyHistogram.
+    """
+    def __init__(self, spin_ns=SPIN_NS, window=60.0):
+        self.spin_ns = spin_ns
+        self.start_ns = 0
+        # Deadline of the next wait()
+        self.cursor_ns = 0
+        self.lateness = LatencyHistogram(window)
+        self.steps = 0
+        self.late_total_ns = 0
+
+    def start(self, start_ns=None):
+        """Set time 0, now by default"""
+        self.start_ns = monotonic_ns() if start_ns is None else start_ns
+        self.cursor_ns = self.start_ns
+        return self
+
+    def until_ns(self, deadline_ns):
+        """Wait for a time.monotonic_ns() deadline. Returns the lateness
+        in ns."""
+        sleep_until_ns(deadline_ns, self.spin_ns)
+        now = monotonic_ns()
+        late_ns = now - deadline_ns
+        self.lateness.record(late_ns // 1000, now)
+        self.steps += 1
+        self.late_total_ns += late_ns
+        return late_ns
+
+    def at(self, offset):
+        """Wait until offset seconds after start()"""
+        self.cursor_ns = self.start_ns + int(offset * 1e9)
+        return self.until_ns(self.cursor_ns)
+
+    def wait(self, delay):
+        """Wait until delay seconds after the previous deadline. Use in
+        place of time.sleep(delay) between steps."""
+        self.cursor_ns += int(delay * 1e9)
+        return self.until_ns(self.cursor_ns)
+
+    def every(self, period, count=None):
+        """Yield the step number every period seconds from the previous
+        deadline"""
+        step = 0
+        while count is None or step < count:
+            self.wait(period)
+            yield step
+            step += 1
+
+    def run(self, steps):
+        """Run (offset seconds, func, args...) steps in offset order"""
+        for offset, func, *args in sorted(steps, key=lambda step: step[0]):
+            self.at(offset)
+            func(*args)
+        return
+
+    def stats(self):
+        """Return dict of step count and lateness in microseconds"""
+        summary = self.lateness.summary()
+        summary['steps'] = self.steps
+        summary['mean'] = self.late_total_ns // 1000 // self.steps \
+            if self.steps else 0
+        return summary
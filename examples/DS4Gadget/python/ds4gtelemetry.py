@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+"""
+Telemetry sent by DS4Gadget back to the host.
+
+Every TELEMETRY_MS the gadget sends a telemetry frame (type 5) on its TX pin
+with its counters.
+
+    STX, 26, 5, sequence, 6 x uint32_t little endian, ETX
+
+    frames_accepted     frames ending with ETX
+    frames_dropped      frames without ETX where expected
+    frames_ignored      frames of unknown type or bad delta frames
+    resyncs             2 ms timeouts waiting for the rest of a frame
+    bytes_discarded     bytes outside frames
+    usb_reports         USB reports sent
+
+The counters wrap at 2**32 and the sequence at 256. Comparing
+frames_accepted with the frames the host sent shows whether the UART link
+loses frames under load.
+
+    $ ./ds4gtelemetry.py /dev/ttyAMA0
+
+prints the counter increments every second. It only reads the port so it can
+run while a mapper script writes to the same port.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import time
+from collections import namedtuple
+from struct import Struct
+
+STX = 0x02
+ETX = 0x03
+
+FRAME_TELEMETRY = 5
+# gadget_telemetry() in DS4Gadget.ino
+TELEMETRY_MS = 100
+TELEMETRY_FIELDS = ('frames_accepted', 'frames_dropped', 'frames_ignored',
+                    'resyncs', 'bytes_discarded', 'usb_reports')
+TELEMETRY_STRUCT = Struct('<B6I')
+# Length byte, type + payload
+TELEMETRY_LEN = 1 + TELEMETRY_STRUCT.size
+# Bytes to read per call, a few frames
+TELEMETRY_READ_SIZE = 256
+
+Telemetry = namedtuple('Telemetry', ('sequence',) + TELEMETRY_FIELDS)
+
+def encode_telemetry(sequence, counters):
+    """Telemetry frame for a dict of counters, as sent by the gadget"""
+    return bytes((STX, TELEMETRY_LEN, FRAME_TELEMETRY)) + \
+        TELEMETRY_STRUCT.pack(sequence & 0xff,
+                              *(counters[name] & 0xffffffff
+                                for name in TELEMETRY_FIELDS)) + \
+        bytes((ETX,))
+
+def increments(old, new):
+    """Dict of the counter increments from Telemetry old to new"""
+    return {name: (getattr(new, name) - getattr(old, name)) & 0xffffffff
+            for name in TELEMETRY_FIELDS}
+
+class TelemetryParser:
+    """Find telemetry frames in the bytes read from the gadget"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.latest = None
+        # Telemetry frames missed, from gaps in the sequence
+        self.frames_lost = 0
+        self.bytes_discarded = 0
+
+    def feed(self, data):
+        """Add bytes read from the port. Returns the list of new Telemetry."""
+        buf = self.buffer
+        buf += data
+        frames = []
+        start = 0
+        while True:
+            stx = buf.find(STX, start)
+            if stx < 0:
+                self.bytes_discarded += len(buf) - start
+                start = len(buf)
+                break
+            self.bytes_discarded += stx - start
+            start = stx
+            if len(buf) - start < 3:
+                break
+            etx = start + buf[start + 1] + 2
+            if buf[start + 1] != TELEMETRY_LEN or \
+                    buf[start + 2] != FRAME_TELEMETRY:
+                # Not a telemetry frame, look for the next STX
+                self.bytes_discarded += 1
+                start += 1
+                continue
+            if len(buf) <= etx:
+                break
+            if buf[etx] != ETX:
+                self.bytes_discarded += 1
+                start += 1
+                continue
+            telemetry = Telemetry(*TELEMETRY_STRUCT.unpack_from(buf, start + 3))
+            if self.latest is not None:
+                self.frames_lost += (telemetry.sequence -
+                                     self.latest.sequence - 1) & 0xff
+            self.latest = telemetry
+            frames.append(telemetry)
+            start = etx + 1
+        del buf[:start]
+        return frames
+
+def main():
+    """Print the gadget counter increments every second"""
+    import argparse
+    import serial
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('port', nargs='?', default='/dev/ttyAMA0')
+    parser.add_argument('--bps', type=int, default=2000000)
+    args = parser.parse_args()
+
+    ser_port = serial.Serial(args.port, args.bps, timeout=1)
+    telemetry = TelemetryParser()
+    first = None
+    last_print = time.monotonic()
+    while True:
+        telemetry.feed(ser_port.read(TELEMETRY_READ_SIZE))
+        if first is None:
+            first = telemetry.latest
+        now = time.monotonic()
+        if now - last_print >= 1.0 and telemetry.latest is not None:
+            last_print = now
+            counts = increments(first, telemetry.latest)
+            counts['telemetry_lost'] = telemetry.frames_lost
+            print(counts)
+            first = telemetry.latest
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+Per-axis transfer lookup tables.
+
+An axis transfer function (calibration, deadzone, response curve, inversion)
+is computed once for every possible 16-bit js value and stored in a 65536
+byte table so mapping an event is table[value + 32768].
+
+Axis settings, all optional
+
+    min, center, max    raw js values at the ends and center of travel
+    deadzone            fraction 0 up to 1 (not 1 itself) of half travel
+                        around center read as center
+    curve               response exponent, 1 is linear, 2 is softer near
+                        center
+    invert              true to swap the ends
+
+With none of min/center/max/deadzone/curve the table reproduces the old
+((value + axis_offset) >> 8) conversion with the optional 127 to 128 fix.
+
+The kernel joystick correction (JSIOCGCORR, set with jscal) can be baked
+into the table. JoystickReader.get_corr() reads it, the correction in the
+kernel is switched off with set_corr() and transfer_table(..., corr=...)
+applies the same broken line formula as joydev so the result is identical
+with no work done per event.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+# <linux/joystick.h>
+JS_CORR_NONE = 0x00
+JS_CORR_BROKEN = 0x01
+
+TABLE_SIZE = 65536
+TABLE_OFFSET = 32768
+CURVE_KEYS = ('min', 'center', 'max', 'deadzone', 'curve')
+
+def joydev_correct(value, corr):
+    """joydev_correct() from drivers/input/joydev.c. corr is
+    (coef, prec, type) from JoystickReader.get_corr()."""
+    coef, _, corr_type = corr
+    if corr_type == JS_CORR_BROKEN:
+        if value > coef[0]:
+            if value < coef[1]:
+                value = 0
+            else:
+                value = (coef[3] * (value - coef[1])) >> 14
+        else:
+            value = (coef[2] * (value - coef[0])) >> 14
+    elif corr_type != JS_CORR_NONE:
+        return 0
+    return max(-32767, min(32767, value))
+
+def transfer_table(axis=None, offset=32768, center_fix=False, corr=None):
+    """
+    Return a 65536 byte table of DS4 axis positions indexed by
+    js value + 32768. axis is the dict of axis settings from the profile.
+    """
+    axis = axis or {}
+    invert = axis.get('invert', False)
+    if corr is None and not any(key in axis for key in CURVE_KEYS):
+        # Every output value covers 256 inputs so build the table from
+        # blocks and fix it up with translate().
+        shift = offset - TABLE_OFFSET
+        blocks = b''.join(bytes((position,)) * 256 for position in range(256))
+        if shift < 0:
+            table = blocks[:1] * -shift + blocks[:TABLE_SIZE + shift]
+        else:
+            table = blocks[shift:] + blocks[-1:] * shift
+        fixup = bytearray(range(256))
+        if center_fix:
+            fixup[127] = 128
+        if invert:
+            fixup = bytearray(255 - position for position in fixup)
+        return table.translate(bytes(fixup))
+
+    table = bytearray(TABLE_SIZE)
+    low = axis.get('min', -32767)
+    center = axis.get('center', 0)
+    high = axis.get('max', 32767)
+    deadzone = axis.get('deadzone', 0.0)
+    curve = axis.get('curve', 1.0)
+    if not 0.0 <= deadzone < 1.0:
+        raise ValueError('deadzone %s must be >= 0 and < 1' % deadzone)
+    for index in range(TABLE_SIZE):
+        value = index - TABLE_OFFSET
+        if corr is not None:
+            value = joydev_correct(value, corr)
+        # Calibrate to -1..1
+        if value >= center:
+            norm = (value - center) / (high - center) if high != center else 0.0
+        else:
+            norm = (value - center) / (center - low) if low != center else 0.0
+        norm = max(-1.0, min(1.0, norm))
+        # Deadzone then curve on the magnitude
+        magnitude = abs(norm)
+        if magnitude <= deadzone:
+            magnitude = 0.0
+        else:
+            magnitude = (magnitude - deadzone) / (1.0 - deadzone)
+        magnitude = magnitude ** curve
+        norm = -magnitude if norm < 0 else magnitude
+        if invert:
+            norm = -norm
+        table[index] = min(255, max(0, int(norm * 127.5 + 128.0)))
+    return bytes(table)
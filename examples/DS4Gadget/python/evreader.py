@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+"""
+Read Linux evdev (/dev/input/event*) devices as frames of joystick events.
+
+The joystick API has no frame boundaries: a diagonal stick move is two
+js_events and becomes two serial frames with a state in between that the
+stick never had. evdev ends every hardware report with SYN_REPORT.
+EventReader buffers the EV_ABS and EV_KEY changes up to each SYN_REPORT and
+returns them as one frame, which DeviceMapper.run_frames() applies in one
+batch() so the gadget gets one serial frame per report.
+
+Events use the same (time, value, type, number) tuples as JoystickReader
+with the axis and button numbers joydev would give the device, so the
+existing profiles work unchanged. Axis values are scaled to -32767..32767
+from the kernel input_absinfo range of each axis the way joydev does it,
+and get_corr()/set_corr() behave like the joydev ioctls so "calibration":
+"kernel" profiles also work.
+
+grab=True takes the device with EVIOCGRAB so the desktop and other readers
+do not also see its events.
+
+    $ ./evreader.py /dev/input/event3 --grab
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import sys
+import select
+from fcntl import ioctl
+from struct import Struct
+from jsreader import JS_EVENT_BUTTON, JS_EVENT_AXIS
+from ds4gtransfer import joydev_correct, JS_CORR_NONE, JS_CORR_BROKEN
+
+# struct input_event { struct timeval time; __u16 type, code; __s32 value; }
+INPUT_EVENT = Struct('llHHi')
+# struct input_absinfo { __s32 value, minimum, maximum, fuzz, flat,
+#                        resolution; }
+INPUT_ABSINFO = Struct('6i')
+
+# <linux/input-event-codes.h>
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0
+SYN_DROPPED = 3
+BTN_MISC = 0x100
+BTN_JOYSTICK = 0x120
+KEY_MAX = 0x2ff
+ABS_MAX = 0x3f
+
+def _IOC(direction, number, size):
+    """<asm-generic/ioctl.h> _IOC() for type 'E'"""
+    return (direction << 30) | (size << 16) | (ord('E') << 8) | number
+
+IOC_WRITE = 1
+IOC_READ = 2
+
+def EVIOCGNAME(length):
+    """EVIOCGNAME(len) ioctl request"""
+    return _IOC(IOC_READ, 0x06, length)
+
+def EVIOCGKEY(length):
+    """EVIOCGKEY(len) ioctl request, the pressed keys"""
+    return _IOC(IOC_READ, 0x18, length)
+
+def EVIOCGBIT(event_type, length):
+    """EVIOCGBIT(ev, len) ioctl request, the codes of an event type"""
+    return _IOC(IOC_READ, 0x20 + event_type, length)
+
+def EVIOCGABS(code):
+    """EVIOCGABS(abs) ioctl request"""
+    return _IOC(IOC_READ, 0x40 + code, INPUT_ABSINFO.size)
+
+EVIOCGRAB = _IOC(IOC_WRITE, 0x90, 4)
+
+def test_bit(bits, number):
+    """True if bit number is set in an ioctl bit array"""
+    return bool(bits[number >> 3] & (1 << (number & 7)))
+
+def cdiv(numerator, denominator):
+    """Integer division rounding toward zero like C"""
+    quotient = abs(numerator) // abs(denominator)
+    return quotient if (numerator < 0) == (denominator < 0) else -quotient
+
+def default_corr(absinfo):
+    """The (coef, prec, type) joydev starts an axis with"""
+    _, minimum, maximum, fuzz, flat, _ = absinfo
+    if maximum == minimum:
+        # No range to scale, joydev passes the value through
+        return ((0,) * 8, 0, JS_CORR_NONE)
+    center = cdiv(maximum + minimum, 2)
+    coef = [center - flat, center + flat, 0, 0, 0, 0, 0, 0]
+    span = cdiv(maximum - minimum, 2) - 2 * flat
+    if span:
+        coef[2] = coef[3] = cdiv(1 << 29, span)
+    return (tuple(coef), fuzz, JS_CORR_BROKEN)
+
+class EventReader:
+    """
+    Non-blocking reader for one evdev device returning frames of
+    (time, value, type, number) events ended by SYN_REPORT.
+    """
+    def __init__(self, path, grab=False, max_events=64, collapse=True,
+                 skip_init=False, tracer=None):
+        self.path = path
+        # Optional ds4glatency.LatencyTracer
+        self.tracer = tracer
+        self.collapse = collapse
+        self.skip_init = skip_init
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.jsdev = open(fd, 'rb', buffering=0)
+        self.buf = bytearray(max_events * INPUT_EVENT.size)
+        self.view = memoryview(self.buf)
+        self.poller = select.poll()
+        self.poller.register(fd, select.POLLIN)
+        # input_events read, SYN included, for ds4gmetrics
+        self.events_read = 0
+        # evdev code: js number, in joydev order
+        self.axis_map = {}
+        self.button_map = {}
+        self.corrs = []
+        self.read_capabilities()
+        # (type, number): event of the frame in progress
+        self.pending = {}
+        # Events were lost, skip to the next SYN_REPORT then resync
+        self.dropped = False
+        self.grabbed = False
+        if grab:
+            self.grab()
+        # The current state first, like the joydev init events
+        self.init_frame = None if skip_init else self.state()
+
+    def read_capabilities(self):
+        """Number the axes and buttons like joydev and read the axis
+        ranges"""
+        abs_bits = bytearray((ABS_MAX >> 3) + 1)
+        ioctl(self.jsdev, EVIOCGBIT(EV_ABS, len(abs_bits)), abs_bits)
+        for code in range(ABS_MAX + 1):
+            if test_bit(abs_bits, code):
+                self.axis_map[code] = len(self.corrs)
+                self.corrs.append(default_corr(self.absinfo(code)))
+        key_bits = bytearray((KEY_MAX >> 3) + 1)
+        ioctl(self.jsdev, EVIOCGBIT(EV_KEY, len(key_bits)), key_bits)
+        # Joystick buttons first, then BTN_MISC up to BTN_JOYSTICK
+        for code in list(range(BTN_JOYSTICK, KEY_MAX + 1)) + \
+                list(range(BTN_MISC, BTN_JOYSTICK)):
+            if test_bit(key_bits, code):
+                self.button_map[code] = len(self.button_map)
+        return
+
+    def fileno(self):
+        """File descriptor for ioctl() and select()"""
+        return self.jsdev.fileno()
+
+    def close(self):
+        """Release the grab and close the device"""
+        if self.grabbed:
+            try:
+                self.grab(False)
+            except OSError:
+                pass
+        self.jsdev.close()
+        return
+
+    def grab(self, grab=True):
+        """Take or release exclusive access with EVIOCGRAB"""
+        ioctl(self.jsdev, EVIOCGRAB, int(grab))
+        self.grabbed = grab
+        return
+
+    def name(self):
+        """Device name from EVIOCGNAME, upper case"""
+        buf = bytearray(256)
+        ioctl(self.jsdev, EVIOCGNAME(len(buf)), buf)
+        return buf.rstrip(b'\x00').decode('utf-8').upper()
+
+    def num_axes(self):
+        """Number of axes joydev would report"""
+        return len(self.axis_map)
+
+    def num_buttons(self):
+        """Number of buttons joydev would report"""
+        return len(self.button_map)
+
+    def absinfo(self, code):
+        """(value, minimum, maximum, fuzz, flat, resolution) of an axis"""
+        buf = bytearray(INPUT_ABSINFO.size)
+        ioctl(self.jsdev, EVIOCGABS(code), buf)
+        return INPUT_ABSINFO.unpack(buf)
+
+    def get_corr(self):
+        """Correction of every axis as a list of (coef, prec, type), like
+        JoystickReader.get_corr()"""
+        return list(self.corrs)
+
+    def set_corr(self, corrs):
+        """Set the correction of every axis, like JoystickReader.set_corr()"""
+        self.corrs = [(tuple(coef), prec, corr_type)
+                      for coef, prec, corr_type in corrs]
+        return
+
+    def state(self):
+        """Frame with the current value of every axis and button"""
+        keys = bytearray((KEY_MAX >> 3) + 1)
+        ioctl(self.jsdev, EVIOCGKEY(len(keys)), keys)
+        frame = [(0, joydev_correct(self.absinfo(code)[0],
+                                    self.corrs[number]),
+                  JS_EVENT_AXIS, number)
+                 for code, number in self.axis_map.items()]
+        frame += [(0, int(test_bit(keys, code)), JS_EVENT_BUTTON, number)
+                  for code, number in self.button_map.items()]
+        return frame
+
+    def read_frames(self):
+        """
+        Return a list of the frames completed since the last call, empty if
+        none. With collapse consecutive frames are joined while no button
+        changes twice so a stalled consumer does not replay stale stick
+        motion. Raises OSError when the device is unplugged.
+        """
+        frames = []
+        if self.init_frame is not None:
+            frames.append(self.init_frame)
+            self.init_frame = None
+        nbytes = self.jsdev.readinto(self.buf)
+        if nbytes is None:
+            return frames
+        if nbytes == 0:
+            raise OSError('%s: end of file' % self.path)
+        self.events_read += nbytes // INPUT_EVENT.size
+        pending = self.pending
+        for sec, usec, ev_type, code, value in \
+                INPUT_EVENT.iter_unpack(self.view[:nbytes]):
+            if ev_type == EV_SYN:
+                if code == SYN_DROPPED:
+                    self.dropped = True
+                    pending.clear()
+                elif code == SYN_REPORT:
+                    if self.dropped:
+                        self.dropped = False
+                        frames.append(self.state())
+                    elif pending:
+                        frames.append(list(pending.values()))
+                        pending.clear()
+                continue
+            if self.dropped:
+                continue
+            time = (sec * 1000 + usec // 1000) & 0xffffffff
+            if ev_type == EV_ABS:
+                number = self.axis_map.get(code)
+                if number is not None:
+                    pending[(JS_EVENT_AXIS, number)] = (
+                        time, joydev_correct(value, self.corrs[number]),
+                        JS_EVENT_AXIS, number)
+            elif ev_type == EV_KEY and value != 2:
+                number = self.button_map.get(code)
+                if number is not None:
+                    pending[(JS_EVENT_BUTTON, number)] = (
+                        time, value, JS_EVENT_BUTTON, number)
+        if self.collapse and len(frames) > 1:
+            frames = collapse_frames(frames)
+        return frames
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds for events. Return True if ready."""
+        if self.init_frame is not None:
+            return True
+        if timeout is not None:
+            timeout = timeout * 1000
+        for _, revents in self.poller.poll(timeout):
+            if revents & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                raise OSError('%s: device error' % self.path)
+            return True
+        return False
+
+    def frames(self):
+        """Yield frames forever. Raises OSError when the device is
+        unplugged."""
+        tracer = self.tracer
+        while True:
+            self.wait()
+            for frame in self.read_frames():
+                if tracer is not None and frame:
+                    tracer.begin(self.path, frame[0][0])
+                yield frame
+
+    def events(self):
+        """Yield the events of every frame, like JoystickReader.events()"""
+        for frame in self.frames():
+            yield from frame
+
+def collapse_frames(frames):
+    """Join consecutive frames, starting a new frame when a button would
+    change twice"""
+    joined = []
+    current = {}
+    for frame in frames:
+        for event in frame:
+            key = (event[2], event[3])
+            if event[2] == JS_EVENT_BUTTON and key in current \
+                    and current[key][1] != event[1]:
+                joined.append(list(current.values()))
+                current = {}
+            current[key] = event
+    if current:
+        joined.append(list(current.values()))
+    return joined
+
+def main():
+    """Print the frames of an evdev device"""
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--grab', action='store_true',
+                        help='take the device from other readers')
+    args = parser.parse_args()
+    reader = EventReader(args.path, args.grab)
+    print('%s: %s, %d axes, %d buttons' % (args.path, reader.name(),
+                                           reader.num_axes(),
+                                           reader.num_buttons()))
+    try:
+        for frame in reader.frames():
+            print(' '.join('%s%d=%d' % ('a' if type == JS_EVENT_AXIS else 'b',
+                                        number, value)
+                           for _, value, type, number in frame))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+"""
+Read Linux joystick (/dev/input/js*) events in bulk.
+
+Each read() drains all pending js_events into a reusable buffer instead of
+one read(8) per event. When the reader has fallen behind, older events for an
+axis are dropped if a newer event for the same axis is in the same batch so a
+stalled consumer does not replay stale stick motion. Button events are never
+dropped.
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import array
+import select
+from fcntl import ioctl
+from struct import Struct
+
+# struct js_event { __u32 time; __s16 value; __u8 type; __u8 number; }
+JS_EVENT = Struct('IhBB')
+JS_EVENT_BUTTON = 0x01
+JS_EVENT_AXIS = 0x02
+JS_EVENT_INIT = 0x80
+
+JSIOCGAXES = 0x80016a11
+JSIOCGBUTTONS = 0x80016a12
+JSIOCSCORR = 0x40246a21
+JSIOCGCORR = 0x80246a22
+# struct js_corr { __s32 coef[8]; __s16 prec; __u16 type; }
+JS_CORR = Struct('8ihH')
+
+def JSIOCGNAME(length):
+    """JSIOCGNAME(len) ioctl request"""
+    return 0x80006a13 + (0x10000 * length)
+
+class JoystickReader:
+    """
+    Non-blocking bulk reader for one joystick device.
+
+    Events are (time, value, type, number) tuples like unpack('IhBB', ...)
+    except JS_EVENT_INIT is removed from type. The init events the driver
+    sends on open report the current state of every button and axis so they
+    are handled like normal events unless skip_init is True.
+    """
+    def __init__(self, path, max_events=64, collapse=True, skip_init=False,
+                 tracer=None):
+        self.path = path
+        # Optional ds4glatency.LatencyTracer
+        self.tracer = tracer
+        self.collapse = collapse
+        self.skip_init = skip_init
+        fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.jsdev = open(fd, 'rb', buffering=0)
+        self.buf = bytearray(max_events * JS_EVENT.size)
+        self.view = memoryview(self.buf)
+        self.poller = select.poll()
+        self.poller.register(fd, select.POLLIN)
+        # Events read, before collapsing, for ds4gmetrics
+        self.events_read = 0
+
+    def fileno(self):
+        """File descriptor for ioctl() and select()"""
+        return self.jsdev.fileno()
+
+    def close(self):
+        """Close the device"""
+        self.jsdev.close()
+        return
+
+    def name(self):
+        """Device name from JSIOCGNAME, upper case"""
+        buf = array.array('B', [0] * 64)
+        ioctl(self.jsdev, JSIOCGNAME(len(buf)), buf)
+        return buf.tobytes().rstrip(b'\x00').decode('utf-8').upper()
+
+    def num_axes(self):
+        """Number of axes from JSIOCGAXES"""
+        buf = array.array('B', [0])
+        ioctl(self.jsdev, JSIOCGAXES, buf)
+        return buf[0]
+
+    def get_corr(self):
+        """Kernel correction for every axis from JSIOCGCORR as a list of
+        (coef, prec, type)"""
+        buf = bytearray(JS_CORR.size * self.num_axes())
+        ioctl(self.jsdev, JSIOCGCORR, buf)
+        return [(values[:8], values[8], values[9])
+                for values in JS_CORR.iter_unpack(buf)]
+
+    def set_corr(self, corrs):
+        """Set the kernel correction for every axis with JSIOCSCORR"""
+        buf = b''.join(JS_CORR.pack(*coef, prec, corr_type)
+                       for coef, prec, corr_type in corrs)
+        ioctl(self.jsdev, JSIOCSCORR, buf)
+        return
+
+    def num_buttons(self):
+        """Number of buttons from JSIOCGBUTTONS"""
+        buf = array.array('B', [0])
+        ioctl(self.jsdev, JSIOCGBUTTONS, buf)
+        return buf[0]
+
+    def read_events(self):
+        """
+        Return a list of all pending events, empty if none are pending.
+        Raises OSError when the joystick is unplugged.
+        """
+        nbytes = self.jsdev.readinto(self.buf)
+        if nbytes is None:
+            return []
+        if nbytes == 0:
+            raise OSError('%s: end of file' % self.path)
+        self.events_read += nbytes // JS_EVENT.size
+        events = []
+        for time, value, type, number in JS_EVENT.iter_unpack(self.view[:nbytes]):
+            if type & JS_EVENT_INIT:
+                if self.skip_init:
+                    continue
+                type &= ~JS_EVENT_INIT
+            events.append((time, value, type, number))
+        if self.collapse and len(events) > 1:
+            events = collapse_axes(events)
+        return events
+
+    def wait(self, timeout=None):
+        """Wait up to timeout seconds for events. Return True if ready."""
+        if timeout is not None:
+            timeout = timeout * 1000
+        for _, revents in self.poller.poll(timeout):
+            if revents & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                raise OSError('%s: device error' % self.path)
+            return True
+        return False
+
+    def events(self):
+        """Yield events forever. Raises OSError when the joystick is
+        unplugged."""
+        tracer = self.tracer
+        while True:
+            self.wait()
+            if tracer is None:
+                yield from self.read_events()
+                continue
+            for event in self.read_events():
+                tracer.begin(self.path, event[0])
+                yield event
+
+def collapse_axes(events):
+    """Keep only the newest event for each axis. Order is preserved."""
+    seen = set()
+    kept = []
+    for event in reversed(events):
+        if event[2] == JS_EVENT_AXIS:
+            if event[3] in seen:
+                continue
+            seen.add(event[3])
+        kept.append(event)
+    kept.reverse()
+    return kept
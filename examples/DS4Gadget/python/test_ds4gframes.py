@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+"""
+Round trip tests of the serial frames. Delta and extended frames are
+decoded with the ds4greceiver versions of gadget_delta() and
+gadget_regions(), and frames from DS4GamepadSerial go through the
+ds4greceiver model of the gadget; the report the gadget ends up with is
+compared with the host state.
+
+    $ python3 -m unittest test_ds4gframes
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import random
+import unittest
+from ds4gpadserial import DS4GamepadSerial, encode_delta, encode_regions, \
+    EXT_REGIONS, EXT_FRAME_LEN, FRAME_LEN, FRAME_REPORT, FRAME_DELTA, \
+    FRAME_EXTENDED, DELTA_TRIGGERS, DELTA_FULL_EVERY, REPORT_SIZE, OFF_LX, \
+    OFF_L2, OFF_R2
+from ds4greceiver import GadgetReceiver, apply_delta, apply_regions
+
+class ReceiverPort:
+    """Serial port that feeds what is written to a GadgetReceiver, one
+    frame every 2 ms so the model UART never overruns"""
+    def __init__(self):
+        self.receiver = GadgetReceiver()
+        self.clock_ms = 1.0
+        self.frames = []
+
+    def write(self, data):
+        """Frame from DS4GamepadSerial"""
+        self.frames.append(bytes(data))
+        self.receiver.feed(bytes(data), self.clock_ms)
+        self.clock_ms += 2.0
+        # Let the sketch read the last byte
+        self.receiver.run_until(self.clock_ms)
+        return len(data)
+
+    def close(self):
+        """Nothing to close"""
+        return
+
+def gadget_report(ds4g):
+    """The 64 byte report the gadget should have for the state of ds4g"""
+    report = bytearray(ds4g.ext_report)
+    report[0:10] = ds4g.state()[3:13]
+    return report
+
+def random_setter(ds4g, rnd):
+    """Call one setter of ds4g with random values"""
+    choice = rnd.randrange(9)
+    if choice == 0:
+        ds4g.leftXAxis(rnd.randrange(256))
+    elif choice == 1:
+        ds4g.rightYAxis(rnd.randrange(256))
+    elif choice == 2:
+        ds4g.press(rnd.randrange(14))
+    elif choice == 3:
+        ds4g.release(rnd.randrange(14))
+    elif choice == 4:
+        ds4g.leftTrigger(rnd.randrange(256))
+    elif choice == 5:
+        ds4g.rightTrigger(rnd.randrange(256))
+    elif choice == 6:
+        ds4g.dPad(rnd.randrange(9))
+    elif choice == 7:
+        ds4g.gyro(*(rnd.randrange(-32768, 32768) for _ in range(3)))
+    else:
+        ds4g.accel(*(rnd.randrange(-32768, 32768) for _ in range(3)))
+    return
+
+def gadget_fields(frame):
+    """The 64 byte gadget report of a full frame"""
+    report = bytearray(REPORT_SIZE)
+    report[0:10] = frame[3:13]
+    return report
+
+def random_frame(rnd, previous):
+    """previous with a random few fields changed"""
+    frame = bytearray(previous)
+    for _ in range(rnd.randrange(4)):
+        frame[rnd.randrange(OFF_LX, OFF_R2 + 1)] = rnd.randrange(256)
+    return frame
+
+class DeltaTest(unittest.TestCase):
+    """encode_delta() against ds4greceiver.apply_delta()"""
+    def setUp(self):
+        self.ds4g = DS4GamepadSerial()
+        self.full = bytes(self.ds4g.report)
+        self.out = bytearray(FRAME_LEN)
+
+    def round_trip(self, frame, previous):
+        """Encode frame against previous, apply it to the gadget report of
+        previous and check the result. Returns the delta frame."""
+        length = encode_delta(frame, previous, self.out)
+        if not length:
+            return None
+        delta = bytes(self.out[:length])
+        self.assertEqual((delta[0], delta[1], delta[2], delta[-1]),
+                         (2, length - 3, FRAME_DELTA, 3))
+        report = gadget_fields(previous)
+        self.assertTrue(apply_delta(report, delta[3:-1]))
+        self.assertEqual(report, gadget_fields(frame))
+        return delta
+
+    def test_one_field(self):
+        """Each field but the triggers alone is a 6 byte frame"""
+        for offset in range(OFF_LX, OFF_L2):
+            frame = bytearray(self.full)
+            frame[offset] ^= 0x5a
+            delta = self.round_trip(frame, self.full)
+            self.assertEqual(len(delta), 6)
+            self.assertEqual(delta[3], 1 << (offset - OFF_LX))
+
+    def test_triggers(self):
+        """Bit 7 carries L2 then R2, whichever of them changed"""
+        for l2, r2 in ((1, 0), (0, 1), (1, 1)):
+            frame = bytearray(self.full)
+            frame[OFF_L2] = 200 if l2 else frame[OFF_L2]
+            frame[OFF_R2] = 100 if r2 else frame[OFF_R2]
+            delta = self.round_trip(frame, self.full)
+            self.assertEqual(delta[3], DELTA_TRIGGERS)
+            self.assertEqual(delta[4:6], bytes((frame[OFF_L2], frame[OFF_R2])))
+
+    def test_no_gain(self):
+        """A delta no shorter than a full frame is not encoded"""
+        frame = bytearray(self.full)
+        for offset in range(OFF_LX, OFF_R2 + 1):
+            frame[offset] ^= 0xff
+        self.assertEqual(encode_delta(frame, self.full, self.out), 0)
+
+    def test_random(self):
+        """Random changes, every delta decodes to the new frame"""
+        rnd = random.Random(13)
+        previous = self.full
+        for _ in range(5000):
+            frame = random_frame(rnd, previous)
+            self.round_trip(frame, previous)
+            previous = frame
+
+    def test_bad_length(self):
+        """The gadget ignores a delta whose length does not match its
+        mask"""
+        report = bytearray(REPORT_SIZE)
+        self.assertFalse(apply_delta(report, bytes((0x03, 1))))
+        self.assertFalse(apply_delta(report, bytes((DELTA_TRIGGERS, 1))))
+        self.assertEqual(report, bytearray(REPORT_SIZE))
+
+    def test_full_every(self):
+        """DS4GamepadSerial sends a full frame every DELTA_FULL_EVERY
+        frames and the gadget follows every frame"""
+        ds4g = DS4GamepadSerial(delta=True)
+        port = ReceiverPort()
+        ds4g.begin(port)
+        rnd = random.Random(64)
+        for count in range(3 * DELTA_FULL_EVERY):
+            ds4g.leftXAxis(count & 0xff)
+            if rnd.randrange(2):
+                ds4g.rightTrigger(rnd.randrange(256))
+            self.assertEqual(port.receiver.last[0:10], ds4g.report[3:13])
+        full = [index for index, frame in enumerate(port.frames)
+                if frame[2] == FRAME_REPORT]
+        self.assertEqual(full[0], 0)
+        self.assertEqual(set(b - a for a, b in zip(full, full[1:])),
+                         {DELTA_FULL_EVERY})
+
+class RegionsTest(unittest.TestCase):
+    """encode_regions() against ds4greceiver.apply_regions()"""
+    def test_random(self):
+        """Random report changes, every extended frame decodes to the new
+        report and carries only the regions that changed"""
+        rnd = random.Random(6)
+        out = bytearray(EXT_FRAME_LEN)
+        previous = bytearray(REPORT_SIZE)
+        gadget = bytearray(REPORT_SIZE)
+        for count in range(2000):
+            report = bytearray(previous)
+            for _ in range(rnd.randrange(4)):
+                offset, size = rnd.choice(EXT_REGIONS)
+                report[offset + rnd.randrange(size)] = rnd.randrange(256)
+            length = encode_regions(report, None if count == 0 else previous,
+                                    out)
+            frame = bytes(out[:length])
+            self.assertEqual((frame[0], frame[1], frame[2], frame[-1]),
+                             (2, length - 3, FRAME_EXTENDED, 3))
+            self.assertTrue(apply_regions(gadget, frame[3:-1]))
+            for bit, (offset, size) in enumerate(EXT_REGIONS):
+                self.assertEqual(gadget[offset:offset + size],
+                                 report[offset:offset + size])
+                changed = count == 0 or \
+                    report[offset:offset + size] != previous[offset:offset + size]
+                self.assertEqual(bool(frame[3] & (1 << bit)), changed)
+            previous = report
+
+    def test_all_regions(self):
+        """previous None sends every region in one EXT_FRAME_LEN frame"""
+        out = bytearray(EXT_FRAME_LEN)
+        length = encode_regions(bytearray(REPORT_SIZE), None, out)
+        self.assertEqual(length, EXT_FRAME_LEN)
+        self.assertEqual(out[3], (1 << len(EXT_REGIONS)) - 1)
+
+    def test_bad_length(self):
+        """The gadget ignores a payload that does not match its mask or
+        has unknown regions"""
+        report = bytearray(REPORT_SIZE)
+        self.assertFalse(apply_regions(report, bytes((0x01, 1, 2, 3))))
+        self.assertFalse(apply_regions(report, bytes((1 << len(EXT_REGIONS),))))
+        self.assertEqual(report, bytearray(REPORT_SIZE))
+
+class ExtendedRoundTripTest(unittest.TestCase):
+    """Setters mixed with extended frame setters, with and without delta
+    frames"""
+    def run_gadget(self, delta):
+        """New DS4GamepadSerial writing to a ReceiverPort"""
+        ds4g = DS4GamepadSerial(delta=delta)
+        port = ReceiverPort()
+        ds4g.begin(port)
+        return ds4g, port
+
+    def assert_gadget(self, ds4g, port):
+        """The gadget has the host state in every region, the extended
+        regions once an extended frame was sent"""
+        receiver = port.receiver
+        self.assertEqual(receiver.bytes_overrun, 0)
+        self.assertEqual(receiver.frames_dropped, 0)
+        self.assertEqual(receiver.frames_ignored, 0)
+        expected = gadget_report(ds4g)
+        regions = EXT_REGIONS
+        if not any(frame[2] == FRAME_EXTENDED for frame in port.frames):
+            regions = EXT_REGIONS[:3]
+        for offset, size in regions:
+            self.assertEqual(receiver.last[offset:offset + size],
+                             expected[offset:offset + size],
+                             'region at %d' % offset)
+        return
+
+    def test_stick_back_with_gyro(self):
+        """A stick moved by a full or delta frame then moved back in the
+        same batch as a gyro change"""
+        for delta in (False, True):
+            ds4g, port = self.run_gadget(delta)
+            ds4g.leftXAxis(100)
+            ds4g.gyro(1, 2, 3)
+            ds4g.leftXAxis(120)
+            with ds4g.batch():
+                ds4g.leftXAxis(100)
+                ds4g.gyro(4, 5, 6)
+            self.assertEqual(port.receiver.last[1], 100)
+            self.assert_gadget(ds4g, port)
+
+    def test_random(self):
+        """Random setters, the gadget state checked after every frame"""
+        for delta in (False, True):
+            rnd = random.Random(15 + delta)
+            ds4g, port = self.run_gadget(delta)
+            for _ in range(2000):
+                if rnd.randrange(4):
+                    random_setter(ds4g, rnd)
+                else:
+                    with ds4g.batch():
+                        for _ in range(rnd.randrange(1, 4)):
+                            random_setter(ds4g, rnd)
+                self.assert_gadget(ds4g, port)
+
+    def test_ext_refresh(self):
+        """Every DELTA_FULL_EVERY extended frames one has every region,
+        however full and delta frames come in between"""
+        ds4g, port = self.run_gadget(True)
+        for count in range(200):
+            ds4g.gyro(count, 0, 0)
+            if count % 3 == 0:
+                ds4g.leftXAxis(count)
+        extended = [frame for frame in port.frames if frame[2] == FRAME_EXTENDED]
+        full = [index for index, frame in enumerate(extended)
+                if frame[3] == (1 << len(EXT_REGIONS)) - 1]
+        self.assertEqual(full, [0, 64, 128, 192])
+
+if __name__ == "__main__":
+    unittest.main()
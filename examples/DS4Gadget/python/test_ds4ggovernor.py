@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Tests of ds4ggovernor, held, coalesced and dropped states.
+
+    $ python3 -m unittest test_ds4ggovernor
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import time
+import unittest
+from ds4ggovernor import OutputGovernor
+from ds4gpadserial import DS4GamepadSerial, DS4Button
+
+class BackedUpPort:
+    """Serial port with a settable out_waiting"""
+    def __init__(self):
+        self.out_waiting = 0
+        self.frames = []
+
+    def write(self, data):
+        """Keep the frame"""
+        self.frames.append(bytes(data))
+        return len(data)
+
+def governed(out_waiting=0):
+    """DS4GamepadSerial on a BackedUpPort and its governor, not started"""
+    ds4g = DS4GamepadSerial()
+    port = BackedUpPort()
+    port.out_waiting = out_waiting
+    ds4g.begin(port)
+    # Not the first frame begin() sends
+    port.frames.clear()
+    return ds4g, OutputGovernor(ds4g)
+
+class AdmitTest(unittest.TestCase):
+    """admit() and drop() keep the counters of the module docstring"""
+    def test_under_budget(self):
+        """Frames go out while the port is under budget"""
+        _, governor = governed()
+        self.assertTrue(governor.admit())
+        self.assertFalse(governor.held)
+
+    def test_hold_and_coalesce(self):
+        """Over budget the state is held, newer states replace it"""
+        _, governor = governed()
+        governor.ds4g.ser_port.out_waiting = governor.budget + 100
+        self.assertFalse(governor.admit())
+        self.assertTrue(governor.held)
+        self.assertTrue(governor.wakeup.is_set())
+        self.assertFalse(governor.admit())
+        # A retry of the held state is not a new state
+        self.assertFalse(governor.admit(new_state=False))
+        self.assertEqual(governor.counters(),
+                         {'sent': 0, 'coalesced': 1, 'dropped': 0})
+        governor.ds4g.ser_port.out_waiting = 0
+        self.assertTrue(governor.admit(new_state=False))
+        self.assertFalse(governor.held)
+
+    def test_drop(self):
+        """A dropped state is no longer held"""
+        _, governor = governed(out_waiting=1 << 20)
+        governor.admit()
+        governor.drop()
+        self.assertFalse(governor.held)
+        self.assertEqual(governor.counters(),
+                         {'sent': 0, 'coalesced': 0, 'dropped': 1})
+
+    def test_line_model(self):
+        """Bytes sent count against the budget until the line drains them"""
+        _, governor = governed()
+        governor.sent(governor.budget * 4)
+        self.assertFalse(governor.admit())
+        self.assertEqual(governor.frames_sent, 1)
+
+class ThreadTest(unittest.TestCase):
+    """The governor thread sends the newest held state"""
+    def test_newest_state_sent(self):
+        """Two states while backed up send one frame with the second"""
+        ds4g, governor = governed()
+        port = ds4g.ser_port
+        governor.start()
+        try:
+            # Just over budget so the thread keeps checking
+            port.out_waiting = governor.budget + 10
+            ds4g.press(DS4Button.CROSS)
+            ds4g.leftXAxis(1)
+            self.assertEqual(port.frames, [])
+            port.out_waiting = 0
+            deadline = time.monotonic() + 1.0
+            while governor.held and time.monotonic() < deadline:
+                time.sleep(0.001)
+        finally:
+            governor.stop()
+        self.assertEqual(len(port.frames), 1)
+        self.assertEqual(ds4g.last_frame, ds4g.state())
+        self.assertEqual(governor.counters(),
+                         {'sent': 1, 'coalesced': 1, 'dropped': 0})
+
+if __name__ == "__main__":
+    unittest.main()
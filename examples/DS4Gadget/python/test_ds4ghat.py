@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+"""
+Tests of ds4ghat, direction pad codes from axes, buttons and POV hats.
+
+    $ python3 -m unittest test_ds4ghat
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+from ds4ghat import HAT_CENTERED, HAT_X, HAT_Y, AXIS_HAT, HAT_UP, HAT_RIGHT, \
+    HAT_DOWN, HAT_LEFT, SOCD_NEUTRAL, SOCD_UP, SOCD_LAST, SOCD_FIRST, \
+    SOCD_MODES, ButtonHat, button_table, axis_table, pov
+from ds4gpadserial import DS4DPad
+
+def press_both(socd, first, second):
+    """Code with first pressed, then second"""
+    hat = ButtonHat(socd)
+    hat.set(first, True)
+    return hat.set(second, True)
+
+class ButtonHatTest(unittest.TestCase):
+    """Opposite buttons held together resolve by the SOCD mode"""
+    def test_left_right(self):
+        """Only last and first pick a side of left and right"""
+        expected = {SOCD_NEUTRAL: DS4DPad.CENTERED, SOCD_UP: DS4DPad.CENTERED,
+                    SOCD_LAST: DS4DPad.RIGHT, SOCD_FIRST: DS4DPad.LEFT}
+        for socd, code in expected.items():
+            self.assertEqual(press_both(socd, HAT_LEFT, HAT_RIGHT), code, socd)
+
+    def test_up_down(self):
+        """Up wins in up mode whichever was pressed first"""
+        expected = {SOCD_NEUTRAL: (DS4DPad.CENTERED, DS4DPad.CENTERED),
+                    SOCD_UP: (DS4DPad.UP, DS4DPad.UP),
+                    SOCD_LAST: (DS4DPad.DOWN, DS4DPad.UP),
+                    SOCD_FIRST: (DS4DPad.UP, DS4DPad.DOWN)}
+        for socd, codes in expected.items():
+            self.assertEqual((press_both(socd, HAT_UP, HAT_DOWN),
+                              press_both(socd, HAT_DOWN, HAT_UP)), codes, socd)
+
+    def test_release(self):
+        """Releasing one of two opposite buttons leaves the other"""
+        for socd in SOCD_MODES:
+            hat = ButtonHat(socd)
+            hat.set(HAT_LEFT, True)
+            hat.set(HAT_RIGHT, True)
+            self.assertEqual(hat.set(HAT_RIGHT, False), DS4DPad.LEFT, socd)
+            self.assertEqual(hat.set(HAT_UP, True), DS4DPad.UP_LEFT, socd)
+            hat.set(HAT_LEFT, False)
+            self.assertEqual(hat.set(HAT_UP, False), DS4DPad.CENTERED, socd)
+
+    def test_unknown_mode(self):
+        """An unknown mode is a ValueError"""
+        self.assertRaises(ValueError, button_table, 'random')
+
+class PovTest(unittest.TestCase):
+    """POV angles map to 45 degree sectors"""
+    def test_sectors(self):
+        """Sectors are centered on the directions and wrap at north"""
+        # Whole degrees, 22.5 degrees belongs to the sector below it
+        for angle, code in ((0, DS4DPad.UP), (2200, DS4DPad.UP),
+                            (2300, DS4DPad.UP_RIGHT), (9000, DS4DPad.RIGHT),
+                            (18000, DS4DPad.DOWN), (27000, DS4DPad.LEFT),
+                            (33700, DS4DPad.UP_LEFT), (33800, DS4DPad.UP),
+                            (35999, DS4DPad.UP)):
+            self.assertEqual(pov(angle), code, angle)
+        self.assertEqual(pov(270, full_circle=360), DS4DPad.LEFT)
+
+    def test_centered(self):
+        """Angles outside the circle are centered"""
+        for angle in (-1, 36000, 0xffff):
+            self.assertEqual(pov(angle), HAT_CENTERED, angle)
+
+class AxisHatTest(unittest.TestCase):
+    """AXIS_HAT and HAT_X/HAT_Y are inverse"""
+    def test_round_trip(self):
+        """The axis pair of every code maps back to the code"""
+        for code in range(HAT_CENTERED + 1):
+            self.assertEqual(AXIS_HAT[(HAT_X[code] << 8) | HAT_Y[code]], code)
+        self.assertEqual((HAT_X[HAT_CENTERED], HAT_Y[HAT_CENTERED]), (128, 128))
+
+    def test_threshold(self):
+        """Values within threshold of 128 are centered"""
+        table = axis_table(threshold=64)
+        self.assertEqual(table[(192 << 8) | 64], DS4DPad.CENTERED)
+        self.assertEqual(table[(193 << 8) | 63], DS4DPad.UP_RIGHT)
+        self.assertEqual(AXIS_HAT[(129 << 8) | 128], DS4DPad.RIGHT)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Tests of ds4gmacro, compiled macro overlays merged with the live state.
+
+    $ python3 -m unittest test_ds4gmacro
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+from ds4gmacro import Macro
+from ds4gpadserial import DS4GamepadSerial, DS4DPad, DS4Button, OFF_LX, \
+    OFF_BUTTONS
+
+class NullPort:
+    """Serial port that discards what is written"""
+    def write(self, data):
+        """Discard data"""
+        return len(data)
+
+def live_gamepad():
+    """DS4GamepadSerial with a live state to overlay"""
+    ds4g = DS4GamepadSerial()
+    ds4g.begin(NullPort())
+    return ds4g
+
+def overlaid(ds4g, macro, index=0):
+    """The state sent with frame index of macro over the live state"""
+    compiled = macro.compile()
+    ds4g.set_overlay(compiled.keeps[index], compiled.values[index])
+    return ds4g.state()
+
+class OverlayTest(unittest.TestCase):
+    """The fields a macro sets win, the others stay live"""
+    def test_dpad_axis(self):
+        """dPadXAxis() sends its own dPad code whatever the live dPad is"""
+        for live in (DS4DPad.CENTERED, DS4DPad.LEFT, DS4DPad.UP_LEFT,
+                     DS4DPad.DOWN):
+            ds4g = live_gamepad()
+            ds4g.dPad(live)
+            state = overlaid(ds4g, Macro().dPadXAxis(255))
+            self.assertEqual(state[OFF_BUTTONS] & 0x0f, DS4DPad.RIGHT, live)
+            state = overlaid(ds4g, Macro().dPadYAxis(0))
+            self.assertEqual(state[OFF_BUTTONS] & 0x0f, DS4DPad.UP, live)
+
+    def test_dpad(self):
+        """dPad() owns the code, press() leaves the live dPad alone"""
+        ds4g = live_gamepad()
+        ds4g.dPad(DS4DPad.DOWN_LEFT)
+        state = overlaid(ds4g, Macro().dPad(DS4DPad.UP_RIGHT))
+        self.assertEqual(state[OFF_BUTTONS] & 0x0f, DS4DPad.UP_RIGHT)
+        state = overlaid(ds4g, Macro().press(DS4Button.CROSS))
+        self.assertEqual(state[OFF_BUTTONS] & 0x0f, DS4DPad.DOWN_LEFT)
+
+    def test_buttons_and_axes(self):
+        """A pressed button is merged with the live buttons and sticks"""
+        ds4g = live_gamepad()
+        ds4g.press(DS4Button.SQUARE)
+        ds4g.leftXAxis(40)
+        state = overlaid(ds4g, Macro().press(DS4Button.CROSS).rightXAxis(200))
+        bits = int.from_bytes(state[OFF_BUTTONS:OFF_BUTTONS + 3], 'little') >> 4
+        self.assertEqual(bits, (1 << DS4Button.SQUARE) | (1 << DS4Button.CROSS))
+        self.assertEqual((state[OFF_LX], state[OFF_LX + 2]), (40, 200))
+
+if __name__ == "__main__":
+    unittest.main()
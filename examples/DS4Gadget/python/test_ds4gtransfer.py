@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Tests of ds4gtransfer lookup tables.
+
+    $ python3 -m unittest test_ds4gtransfer
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import unittest
+from ds4gtransfer import transfer_table, joydev_correct, TABLE_OFFSET, \
+    TABLE_SIZE, JS_CORR_NONE, JS_CORR_BROKEN
+from ds4gmapper import DeviceMapper, ProfileError
+from ds4gpadserial import DS4GamepadSerial
+
+def old_axis(value, offset, center_fix):
+    """The conversion the mapper scripts did before the tables"""
+    axis = (value + offset) >> 8
+    if center_fix and axis == 127:
+        axis = 128
+    return axis
+
+class TransferTableTest(unittest.TestCase):
+    """transfer_table() against the old conversion and its settings"""
+    def test_old_conversion(self):
+        """Without curve settings the table is bit exact with
+        (value + offset) >> 8 over the js range"""
+        for offset in (32767, 32768):
+            for center_fix in (False, True):
+                table = transfer_table(None, offset, center_fix)
+                self.assertEqual(len(table), TABLE_SIZE)
+                for value in range(-32767, 32768):
+                    self.assertEqual(table[value + TABLE_OFFSET],
+                                     old_axis(value, offset, center_fix),
+                                     (offset, center_fix, value))
+
+    def test_out_of_range_clamped(self):
+        """-32768 with offset 32767 is clamped to 0 instead of -1"""
+        self.assertEqual(transfer_table(None, 32767)[0], 0)
+
+    def test_invert(self):
+        """invert mirrors the table"""
+        table = transfer_table(None, 32768)
+        inverted = transfer_table({'invert': True}, 32768)
+        self.assertEqual(inverted, bytes(255 - value for value in table))
+
+    def test_deadzone(self):
+        """Values inside the deadzone are center, outside it the full range
+        is still reached"""
+        table = transfer_table({'deadzone': 0.25})
+        self.assertEqual(set(table[TABLE_OFFSET - 8191:TABLE_OFFSET + 8192]),
+                         {128})
+        self.assertGreater(table[TABLE_OFFSET + 9000], 128)
+        self.assertEqual(table[TABLE_OFFSET + 32767], 255)
+        self.assertEqual(table[TABLE_OFFSET - 32767], 0)
+
+    def test_curve_monotonic(self):
+        """A curve keeps the ends and the order and is softer near center"""
+        linear = transfer_table({'curve': 1.0})
+        table = transfer_table({'curve': 2.0})
+        self.assertEqual(list(table), sorted(table))
+        self.assertEqual((table[0], table[-1]), (0, 255))
+        self.assertLess(table[TABLE_OFFSET + 16384],
+                        linear[TABLE_OFFSET + 16384])
+
+    def test_calibration(self):
+        """min, center and max map to 0, 128 and 255"""
+        table = transfer_table({'min': -20000, 'center': 1000, 'max': 30000})
+        self.assertEqual(table[TABLE_OFFSET - 20000], 0)
+        self.assertEqual(table[TABLE_OFFSET + 1000], 128)
+        self.assertEqual(table[TABLE_OFFSET + 30000], 255)
+
+    def test_corr(self):
+        """A baked kernel correction is applied before the curve"""
+        corr = ((-100, 100, 20000, 20000, 0, 0, 0, 0), 0, JS_CORR_BROKEN)
+        table = transfer_table({'curve': 1.0}, corr=corr)
+        plain = transfer_table({'curve': 1.0})
+        for value in (-30000, -50, 0, 99, 101, 1000, 30000):
+            corrected = joydev_correct(value, corr)
+            self.assertEqual(table[value + TABLE_OFFSET],
+                             plain[corrected + TABLE_OFFSET])
+        self.assertEqual(joydev_correct(40000, ((0,) * 8, 0, JS_CORR_NONE)),
+                         32767)
+
+    def test_bad_deadzone(self):
+        """A deadzone of 1 or more, or below 0, is rejected"""
+        for deadzone in (1.0, 1.5, -0.1):
+            with self.assertRaises(ValueError):
+                transfer_table({'deadzone': deadzone})
+            profile = {'name': 'test',
+                       'axes': {'0': {'target': 'leftXAxis',
+                                      'deadzone': deadzone}}}
+            with self.assertRaises(ProfileError):
+                DeviceMapper(profile, DS4GamepadSerial())
+
+if __name__ == "__main__":
+    unittest.main()
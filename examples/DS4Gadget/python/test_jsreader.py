@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Tests of jsreader, collapse_axes() and JoystickReader reading js_events from
+a FIFO.
+
+    $ python3 -m unittest test_jsreader
+
+MIT License
+
+Copyright (c) 2020 gdsports625@gmail.com
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from jsreader import JoystickReader, collapse_axes, JS_EVENT, \
+    JS_EVENT_BUTTON, JS_EVENT_AXIS, JS_EVENT_INIT
+
+def axis(number, value, time=0):
+    """Axis event tuple"""
+    return (time, value, JS_EVENT_AXIS, number)
+
+def button(number, value, time=0):
+    """Button event tuple"""
+    return (time, value, JS_EVENT_BUTTON, number)
+
+class CollapseAxesTest(unittest.TestCase):
+    """collapse_axes() keeps the newest value of each axis and every button
+    event"""
+    def test_newest_axis(self):
+        """Only the last event of each axis is kept, where it was"""
+        events = [axis(0, 1, 1), axis(1, 2, 2), axis(0, 3, 3),
+                  axis(1, 4, 4), axis(0, 5, 5)]
+        self.assertEqual(collapse_axes(events),
+                         [axis(1, 4, 4), axis(0, 5, 5)])
+
+    def test_buttons_kept(self):
+        """A press and release are both kept, in order with the axes"""
+        events = [axis(0, 1), button(2, 1), axis(0, 2), button(2, 0),
+                  axis(0, 3)]
+        self.assertEqual(collapse_axes(events),
+                         [button(2, 1), button(2, 0), axis(0, 3)])
+
+    def test_nothing_to_collapse(self):
+        """Different axes and buttons come back unchanged"""
+        events = [axis(0, 1), axis(1, 2), button(0, 1), axis(2, 3)]
+        self.assertEqual(collapse_axes(events), events)
+        self.assertEqual(collapse_axes([]), [])
+
+class JoystickReaderTest(unittest.TestCase):
+    """JoystickReader on a FIFO standing in for /dev/input/js0"""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        path = os.path.join(self.tmpdir, 'js0')
+        os.mkfifo(path)
+        self.reader = JoystickReader(path)
+        self.writer = os.open(path, os.O_WRONLY)
+
+    def tearDown(self):
+        os.close(self.writer)
+        self.reader.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, *events):
+        """Write js_events to the FIFO"""
+        os.write(self.writer, b''.join(JS_EVENT.pack(*event)
+                                       for event in events))
+
+    def test_bulk_read(self):
+        """Everything pending is read at once, axes collapsed and the init
+        flag removed"""
+        self.write((1, 0, JS_EVENT_BUTTON | JS_EVENT_INIT, 0),
+                   (2, 100, JS_EVENT_AXIS, 0),
+                   (3, 200, JS_EVENT_AXIS, 0),
+                   (4, 1, JS_EVENT_BUTTON, 0))
+        self.assertTrue(self.reader.wait(1))
+        self.assertEqual(self.reader.read_events(),
+                         [button(0, 0, 1), axis(0, 200, 3), button(0, 1, 4)])
+        self.assertEqual(self.reader.events_read, 4)
+        self.assertEqual(self.reader.read_events(), [])
+
+    def test_skip_init(self):
+        """skip_init drops the init events"""
+        self.reader.skip_init = True
+        self.write((1, 0, JS_EVENT_AXIS | JS_EVENT_INIT, 0),
+                   (2, -5, JS_EVENT_AXIS, 1))
+        self.reader.wait(1)
+        self.assertEqual(self.reader.read_events(), [axis(1, -5, 2)])
+
+    def test_unplugged(self):
+        """End of file is an OSError like an unplugged joystick"""
+        os.close(self.writer)
+        self.writer = os.open(os.devnull, os.O_WRONLY)
+        with self.assertRaises(OSError):
+            self.reader.read_events()
+
+if __name__ == "__main__":
+    unittest.main()
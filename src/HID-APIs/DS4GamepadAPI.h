@@ -110,6 +110,7 @@ class DS4GamepadAPI {
         inline void rightTrigger(uint8_t a);
         inline void leftTrigger(uint8_t a);
         inline void dPad(int8_t d);
+        inline uint32_t reportCount(void);
 
         // Sending is public in the base class for advanced users.
         virtual void SendReport(void* data, int length) = 0;
@@ -117,6 +118,7 @@ class DS4GamepadAPI {
     protected:
         HID_DS4GamepadReport_Data_t _report;
         uint32_t startMillis;
+        uint32_t _reportCount;  // reports sent, wraps
 };
 
 // Implementation is inline
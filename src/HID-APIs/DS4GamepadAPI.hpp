@@ -24,9 +24,8 @@ THE SOFTWARE.
 // Include guard
 #pragma once
 
-DS4GamepadAPI::DS4GamepadAPI(void)
+DS4GamepadAPI::DS4GamepadAPI(void) : _reportCount(0)
 {
-    // Empty
 }
 
 void DS4GamepadAPI::begin(void) {
@@ -58,6 +57,7 @@ void DS4GamepadAPI::end(void) {
 
 void DS4GamepadAPI::write(void) {
     SendReport(&_report, sizeof(_report));
+    _reportCount++;
     _report.reportCnt++;
     _report.timestamp += 188;
 }
@@ -191,3 +191,8 @@ void DS4GamepadAPI::leftTrigger(uint8_t a) {
 void DS4GamepadAPI::dPad(int8_t d) {
     _report.dPad = d;
 }
+
+
+uint32_t DS4GamepadAPI::reportCount(void) {
+    return _reportCount;
+}